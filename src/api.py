@@ -0,0 +1,263 @@
+import json
+import time
+import queue
+import argparse
+import threading
+from decimal import Decimal
+from datetime import datetime
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import mysql.connector
+
+import backends
+from crea_db import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, TABLA_VERSION
+
+# --- API de métricas de solo lectura ---
+# Sirve en JSON las métricas estándar de los paneles, para que Grafana y las herramientas internas no repitan
+# las mismas agregaciones sobre MySQL. Cada respuesta se guarda en memoria durante TTL_SEGUNDOS y mientras
+# no cambie el sello de versión que crea_db.py escribe al terminar cada carga (tabla carga_version).
+# Si llegan a la vez varias peticiones de una métrica que no está en caché, solo la primera consulta la base
+# y las demás esperan su resultado. Funciona sobre MySQL o sobre una base embebida (DuckDB o SQLite).
+HOST = "127.0.0.1"
+PUERTO = 8050
+TTL_SEGUNDOS = 60 # Vida máxima de una respuesta en caché
+INTERVALO_VERSION = 2 # Segundos entre lecturas del sello de versión (como máximo una consulta cada INTERVALO_VERSION)
+TAMANO_POOL = 4 # Conexiones abiertas a la base (las peticiones que no encuentran una libre esperan)
+
+# Formato: { "metrica": { "descripcion": ..., "sql": consulta estándar (MySQL, DuckDB y SQLite),
+#                         "sql_mysql": consulta alternativa sobre las tablas de resumen de rollups.py (opcional) } }
+METRICAS = {
+    "pacientes_por_medicacion": {
+        "descripcion": "Cantidad de pacientes que toman cada medicación",
+        "sql": """
+            SELECT m.medicacion_id, m.droga, m.tipo, COUNT(DISTINCT t.paciente_id) AS pacientes
+            FROM medicacion m
+            JOIN tratamientos t ON t.medicacion_id = m.medicacion_id
+            GROUP BY m.medicacion_id, m.droga, m.tipo
+            ORDER BY pacientes DESC, m.medicacion_id
+        """,
+        "sql_mysql": """
+            SELECT medicacion_id, droga, tipo, pacientes FROM rollup_pacientes_medicacion
+            ORDER BY pacientes DESC, medicacion_id
+        """
+    },
+    "diagnosticos_por_profesional": {
+        "descripcion": "Pacientes con cada diagnóstico atendidos por cada profesional",
+        "sql": """
+            SELECT t.profesionales_id, t.diagnostico_id, p.name AS profesional, d.name AS diagnostico,
+                   COUNT(DISTINCT t.paciente_id) AS pacientes
+            FROM tratamientos t
+            JOIN profesionales p ON p.profesionales_id = t.profesionales_id
+            JOIN diagnosticos d ON d.diagnostico_id = t.diagnostico_id
+            GROUP BY t.profesionales_id, t.diagnostico_id, p.name, d.name
+            ORDER BY t.profesionales_id, t.diagnostico_id
+        """,
+        "sql_mysql": """
+            SELECT profesionales_id, diagnostico_id, profesional, diagnostico, pacientes FROM rollup_diagnostico_profesional
+            ORDER BY profesionales_id, diagnostico_id
+        """
+    },
+    "metabolico_por_tipo": {
+        "descripcion": "Peso e IMC promedio de los pacientes que toman cada tipo de medicación",
+        "sql": """
+            SELECT pt.tipo, COUNT(*) AS pacientes, ROUND(AVG(me.peso), 2) AS peso_promedio, ROUND(AVG(me.imc), 2) AS imc_promedio
+            FROM (
+                SELECT DISTINCT t.paciente_id, m.tipo
+                FROM tratamientos t
+                JOIN medicacion m ON m.medicacion_id = t.medicacion_id
+            ) pt
+            JOIN metabolico me ON me.paciente_id = pt.paciente_id
+            GROUP BY pt.tipo
+            ORDER BY pt.tipo
+        """
+    }
+}
+
+# --- Conexiones ---
+# Reparte un número fijo de conexiones entre los hilos del servidor. Cada conexión la usa un solo hilo a la vez.
+class PoolConexiones:
+    def __init__(self, backend, ruta_db=None, tamano=TAMANO_POOL):
+        self.backend = backend
+        self.ruta_db = ruta_db
+        self._libres = queue.LifoQueue()
+        for _ in range(tamano):
+            self._libres.put(self._abrir())
+
+    def _abrir(self):
+        if self.backend == "mysql":
+            # autocommit: sin él cada conexión seguiría viendo la foto de los datos de su primera consulta
+            return mysql.connector.connect(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD,
+                                           database=DB_NAME, autocommit=True)
+        conn = backends.conectar(self.backend, self.ruta_db, solo_lectura=True)
+        if conn is None:
+            raise RuntimeError(f"No se pudo abrir la base {self.backend}.")
+        return conn
+
+    def consultar(self, sql):
+        """Ejecuta una consulta con una conexión libre. Devuelve una lista de filas como diccionarios."""
+        conn = self._libres.get()
+        try:
+            if self.backend == "mysql":
+                conn.ping(reconnect=True, attempts=3, delay=1) # Reabre la conexión si MySQL la cerró
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            columnas = [descripcion[0] for descripcion in cursor.description]
+            filas = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+            cursor.close()
+            return filas
+        finally:
+            self._libres.put(conn)
+
+# --- Sello de versión de la carga ---
+class VersionCarga:
+    def __init__(self, pool, intervalo=INTERVALO_VERSION):
+        self.pool = pool
+        self.intervalo = intervalo
+        self._version = None
+        self._leida = float("-inf")
+        self._lock = threading.Lock()
+
+    def actual(self):
+        """Devuelve el sello de la última carga ("" si todavía no hay). Se lee de la base como máximo cada intervalo segundos."""
+        with self._lock:
+            if time.monotonic() - self._leida >= self.intervalo:
+                try:
+                    filas = self.pool.consultar(f"SELECT version FROM {TABLA_VERSION} WHERE id = 1")
+                    self._version = filas[0]["version"] if filas else ""
+                except Exception: # mysql.connector.Error, sqlite3.Error o duckdb.Error: todavía no hubo cargas
+                    self._version = ""
+                self._leida = time.monotonic()
+            return self._version
+
+# --- Caché de respuestas ---
+# Guarda el cuerpo JSON ya serializado de cada métrica junto con la versión con la que se calculó.
+# Mientras se calcula una métrica, las demás peticiones de la misma esperan su Future en lugar de consultar.
+class CacheRespuestas:
+    def __init__(self, ttl=TTL_SEGUNDOS):
+        self.ttl = ttl
+        self._entradas = {} # clave -> (versión, vence, cuerpo)
+        self._en_curso = {} # clave -> Future con el cuerpo
+        self._lock = threading.Lock()
+        self.estadisticas = {"aciertos": 0, "calculadas": 0, "colapsadas": 0}
+
+    def obtener(self, clave, version, calcular):
+        """Devuelve (cuerpo, estado, segundos de vida restantes), con estado HIT, MISS o COLAPSADA."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] == version and entrada[1] > time.monotonic():
+                self.estadisticas["aciertos"] += 1
+                return entrada[2], "HIT", entrada[1] - time.monotonic()
+            futuro = self._en_curso.get(clave)
+            propio = futuro is None
+            if propio:
+                futuro = self._en_curso[clave] = Future()
+            else:
+                self.estadisticas["colapsadas"] += 1
+        if not propio:
+            return futuro.result(), "COLAPSADA", self.ttl
+
+        try:
+            cuerpo = calcular()
+            with self._lock:
+                self._entradas[clave] = (version, time.monotonic() + self.ttl, cuerpo)
+                self.estadisticas["calculadas"] += 1
+            futuro.set_result(cuerpo)
+            return cuerpo, "MISS", self.ttl
+        except Exception as err:
+            futuro.set_exception(err) # Las peticiones que esperaban reciben el mismo error
+            raise
+        finally:
+            with self._lock:
+                del self._en_curso[clave]
+
+def a_json(valor):
+    """Convierte los tipos que json no serializa (DECIMAL de MySQL, fechas)."""
+    return float(valor) if isinstance(valor, Decimal) else str(valor)
+
+# --- Servidor HTTP ---
+class ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        ruta = self.path.split("?")[0].rstrip("/")
+        servidor = self.server
+        if ruta in ("", "/metricas"):
+            self.responder(200, {nombre: definicion["descripcion"] for nombre, definicion in METRICAS.items()})
+        elif ruta == "/salud":
+            self.responder(200, {"backend": servidor.pool.backend, "version": servidor.version.actual(),
+                                 "ttl_segundos": servidor.cache.ttl, "cache": dict(servidor.cache.estadisticas)})
+        elif ruta.startswith("/metricas/") and ruta.split("/")[-1] in METRICAS:
+            self.responder_metrica(ruta.split("/")[-1])
+        else:
+            self.responder(404, {"error": f"Ruta desconocida: '{ruta}'. Métricas disponibles en /metricas."})
+
+    def responder_metrica(self, nombre):
+        servidor = self.server
+        definicion = METRICAS[nombre]
+        sql = definicion.get(f"sql_{servidor.pool.backend}", definicion["sql"])
+        version = servidor.version.actual()
+
+        def calcular():
+            inicio = time.perf_counter()
+            filas = servidor.pool.consultar(sql)
+            cuerpo = {"metrica": nombre, "version": version, "generado": datetime.now().isoformat(timespec="seconds"),
+                      "segundos_consulta": round(time.perf_counter() - inicio, 4), "filas": filas}
+            return json.dumps(cuerpo, ensure_ascii=False, default=a_json).encode("utf-8")
+
+        try:
+            cuerpo, estado, vida = servidor.cache.obtener(nombre, version, calcular)
+        except Exception as err: # Error de la base: no se guarda en caché
+            self.responder(503, {"error": f"No se pudo calcular la métrica '{nombre}': {err}"})
+            return
+        self.enviar(200, cuerpo, {"X-Cache": estado, "Cache-Control": f"max-age={max(int(vida), 0)}"})
+
+    def responder(self, codigo, contenido):
+        self.enviar(codigo, json.dumps(contenido, ensure_ascii=False, default=a_json).encode("utf-8"))
+
+    def enviar(self, codigo, cuerpo, cabeceras=None):
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass # Sin una línea por petición: con Grafana refrescando los paneles la salida sería ilegible
+
+def crear_servidor(backend=backends.BACKEND, ruta_db=None, host=HOST, puerto=PUERTO, ttl=TTL_SEGUNDOS, tamano_pool=TAMANO_POOL):
+    """Crea el servidor (sin iniciarlo) con su pool de conexiones, su caché y el lector del sello de versión."""
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorMetricas)
+    servidor.pool = PoolConexiones(backend, ruta_db, tamano_pool)
+    servidor.version = VersionCarga(servidor.pool)
+    servidor.cache = CacheRespuestas(ttl)
+    return servidor
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP/JSON de solo lectura con las métricas estándar de los paneles.")
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=backends.BACKEND, help="Base consultada: mysql o una base embebida")
+    parser.add_argument("--db-path", default=None, help="Archivo de la base embebida (por defecto, ../data_medical.<backend>)")
+    parser.add_argument("--host", default=HOST, help="Dirección en la que escucha el servidor")
+    parser.add_argument("--puerto", type=int, default=PUERTO, help="Puerto del servidor")
+    parser.add_argument("--ttl", type=int, default=TTL_SEGUNDOS, help="Segundos que se reutiliza una respuesta")
+    parser.add_argument("--tamano-pool", type=int, default=TAMANO_POOL, help="Conexiones abiertas a la base")
+    args = parser.parse_args()
+
+    try:
+        servidor = crear_servidor(args.backend, args.db_path, args.host, args.puerto, args.ttl, args.tamano_pool)
+    except (mysql.connector.Error, RuntimeError) as err:
+        print(f"Error al conectar con la base {args.backend}: {err}")
+        return
+    except Exception as err: # sqlite3.Error o duckdb.Error (ej. la base embebida todavía no existe)
+        print(f"Error al abrir la base {args.backend}: {err}. Ejecuta antes crea_db.py --backend {args.backend}.")
+        return
+    print(f"API de métricas en http://{args.host}:{args.puerto}/metricas (backend {args.backend}, TTL {args.ttl} s).")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServidor detenido.")
+    finally:
+        servidor.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,151 @@
 import time
 import subprocess
 import os
+import threading
+from datetime import datetime
 
-def ejecutar_comando(comando, mensaje):
+import mysql.connector
+
+import metricas
+from crea_db import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+
+# --- Configuración de la espera de MySQL ---
+# En lugar de esperar un tiempo fijo, se consulta si MySQL está listo con esperas crecientes (backoff).
+CONTENEDOR_DB = "mysql-db-medical" # Debe coincidir con container_name en docker-compose.yml
+TIMEOUT_MYSQL = 180   # Segundos máximos de espera hasta que MySQL acepte conexiones
+ESPERA_INICIAL = 0.25 # Primera espera entre intentos (segundos); se duplica en cada intento
+ESPERA_MAXIMA = 4     # Espera máxima entre intentos (segundos)
+
+def ejecutar_comando(comando, mensaje, cwd=None):
     """Función auxiliar para ejecutar comandos de shell y proporcionar retroalimentación."""
+    esperar_comando(iniciar_comando(comando, mensaje, cwd))
+
+def iniciar_comando(comando, mensaje, cwd=None):
+    """Lanza un comando de shell en segundo plano, sin esperar a que termine.
+    Devuelve un diccionario con el proceso y un hilo que recoge su salida y el instante en que terminó."""
     print(f"--- {mensaje} ---")
-    try:
-        # subprocess.run ejecuta el comando.
-        # check=True: Si el comando falla, levanta una excepción CalledProcessError.
-        # shell=True: Permite pasar el comando como una cadena de texto.
-        # text=True: Decodifica stdout y stderr como texto.
-        # capture_output=True: Captura la salida y los errores del comando.
-        proceso = subprocess.run(comando, check=True, shell=True, text=True, capture_output=True)
-    except subprocess.CalledProcessError as e:
-        print(f"--- ERROR: {mensaje} FALLÓ ---")
-        print(f"Comando: {e.cmd}")
-        print(f"Código de Retorno: {e.returncode}")
-        print(f"STDOUT: {e.stdout}")
-        print(f"STDERR: {e.stderr}")
+    # shell=True: Permite pasar el comando como una cadena de texto.
+    # text=True: Decodifica stdout y stderr como texto.
+    # stdout/stderr=PIPE: Captura la salida y los errores del comando.
+    proceso = subprocess.Popen(comando, shell=True, text=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    tarea = {"proceso": proceso, "mensaje": mensaje}
+
+    def recoger_salida():
+        tarea["stdout"], tarea["stderr"] = proceso.communicate()
+        tarea["fin"] = time.perf_counter()
+
+    tarea["hilo"] = threading.Thread(target=recoger_salida, daemon=True)
+    tarea["hilo"].start()
+    return tarea
+
+def esperar_comando(tarea):
+    """Espera a que termine un comando lanzado con iniciar_comando. Si falla, muestra el error y sale."""
+    tarea["hilo"].join()
+    proceso = tarea["proceso"]
+    if proceso.returncode != 0:
+        print(f"--- ERROR: {tarea['mensaje']} FALLÓ ---")
+        print(f"Comando: {proceso.args}")
+        print(f"Código de Retorno: {proceso.returncode}")
+        print(f"STDOUT: {tarea['stdout']}")
+        print(f"STDERR: {tarea['stderr']}")
         exit(1) # Salir del script si algún comando falla
+    return tarea["fin"]
+
+def estado_healthcheck():
+    """Devuelve el estado del healthcheck del contenedor de MySQL ('starting', 'healthy', ...) o None."""
+    try:
+        resultado = subprocess.run(
+            ["docker", "inspect", "--format", "{{if .State.Health}}{{.State.Health.Status}}{{end}}", CONTENEDOR_DB],
+            text=True, capture_output=True
+        )
+    except FileNotFoundError: # Docker no está en el PATH
+        return None
+    if resultado.returncode != 0:
+        return None
+    return resultado.stdout.strip() or None
+
+def mysql_acepta_conexiones():
+    """Intenta conectarse a la base de datos de la aplicación (existe cuando init.sql ya se ejecutó)."""
+    try:
+        conn = mysql.connector.connect(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD,
+                                       database=DB_NAME, connection_timeout=2)
+        conn.close()
+        return True
+    except mysql.connector.Error:
+        return False
+
+def esperar_mysql(timeout=TIMEOUT_MYSQL):
+    """Espera con backoff exponencial a que MySQL esté listo. Devuelve True si lo estuvo antes del timeout."""
+    limite = time.monotonic() + timeout
+    espera = ESPERA_INICIAL
+    intentos = 0
+    while True:
+        intentos += 1
+        # Solo cuenta una conexión TCP real a DB_NAME. El healthcheck de docker-compose (mysqladmin ping) usa el
+        # socket Unix y puede dar "healthy" con el servidor temporal de inicialización de la imagen (sin red y
+        # antes de que exista DB_NAME): es solo informativo
+        if mysql_acepta_conexiones():
+            print(f"MySQL está listo (intentos: {intentos}).")
+            return True
+        if time.monotonic() + espera > limite:
+            print(f"Estado del healthcheck del contenedor: {estado_healthcheck() or 'desconocido'}.")
+            return False
+        time.sleep(espera)
+        espera = min(espera * 2, ESPERA_MAXIMA)
+
+def guardar_metricas(componentes):
+    """Guarda en MySQL las métricas de esta ejecución de los componentes indicados (crea_db guarda las suyas)."""
+    registros = metricas.leer_log(metricas.id_ejecucion(), componentes)
+    try:
+        conn = mysql.connector.connect(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+    except mysql.connector.Error as err:
+        print(f"No se pudieron guardar las métricas del pipeline: {err}")
+        return
+    try:
+        metricas.guardar_en_mysql(conn, conn.cursor(), registros)
+    except mysql.connector.Error as err:
+        print(f"No se pudieron guardar las métricas del pipeline: {err}")
+    finally:
+        conn.close()
 
 def main():
-    # Obtener el directorio donde se encuentra app.py
+    # Obtener el directorio donde se encuentra app.py (donde están crea_csv.py y crea_db.py)
     directorio_script = os.path.dirname(os.path.abspath(__file__))
-    
-    # Cambiar al directorio 'src' (donde están app.py, crea_csv.py, crea_db.py)
-    os.chdir(directorio_script)
+    directorio_padre = os.path.join(directorio_script, os.pardir)
 
-    # 1. Crear los archivos CSV necesarios
-    ejecutar_comando("python crea_csv.py", "Creando archivos CSV")
-    time.sleep(5)  # Esperar a que los archivos se creen correctamente
+    # El identificador de la ejecución se hereda en crea_csv.py y crea_db.py (variable de entorno)
+    print(f"--- Ejecución {metricas.id_ejecucion()} ---")
 
-    # 2. Crear la imagen del servidor MYSQL en un contenedor Docker
-    directorio_padre = os.path.join(directorio_script, os.pardir)
-    os.chdir(directorio_padre) 
-    ejecutar_comando("docker-compose up -d", "Iniciando contenedor Docker")
-    time.sleep(30) # Esperar a que el contenedor se inicie correctamente
+    with metricas.etapa("app", "total"):
+        # 1. Crear los archivos CSV y 2. levantar los contenedores Docker, al mismo tiempo
+        inicio = time.perf_counter()
+        inicio_csv = datetime.now()
+        tarea_csv = iniciar_comando("python crea_csv.py", "Creando archivos CSV", cwd=directorio_script)
+        with metricas.etapa("app", "inicio_contenedores"):
+            ejecutar_comando("docker-compose up -d", "Iniciando contenedor Docker", cwd=directorio_padre)
+
+        # Esperar a MySQL mientras se siguen generando los CSV
+        print("--- Esperando a que MySQL esté listo ---")
+        with metricas.etapa("app", "espera_mysql"):
+            if not esperar_mysql():
+                print(f"--- ERROR: MySQL no estuvo listo después de {TIMEOUT_MYSQL} s ---")
+                tarea_csv["proceso"].kill()
+                exit(1)
+
+        # La generación empezó antes que las demás etapas: su registro se arma con el instante de fin del proceso
+        metricas.registrar_duracion("app", "generacion_csv", inicio_csv, esperar_comando(tarea_csv) - inicio)
 
-    # Volver al directorio 'src'
-    os.chdir(directorio_script)
+        # 3. Crear la base de datos de la aplicación, apenas los CSV y MySQL están listos
+        # --incremental: si se vuelve a ejecutar, solo se cargan los CSV que cambiaron (sin duplicar datos)
+        with metricas.etapa("app", "carga_base_de_datos"):
+            ejecutar_comando("python crea_db.py --incremental", "Creando la base de datos de la aplicación", cwd=directorio_script)
 
-    # 3. Crear la base de datos de la aplicación
-    ejecutar_comando("python crea_db.py", "Creando la base de datos de la aplicación")
+    print("\n--- Tiempos por etapa ---")
+    for registro in metricas.REGISTROS:
+        print(f"{registro['etapa']:<28}{registro['segundos']:>8.2f} s")
 
+    guardar_metricas(["app", "crea_csv"])
     print("\n--- ¡Todas las operaciones se completaron exitosamente! ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
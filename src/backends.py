@@ -0,0 +1,106 @@
+import os
+import re
+import sqlite3
+
+import esquema
+import indices
+
+# --- Backends de destino de la carga ---
+# "mysql" (por defecto) es el servidor del contenedor Docker que usa Grafana. "duckdb" y "sqlite" son
+# bases embebidas en un único archivo: se consultan en el mismo proceso, sin red ni Docker (notebook, CI).
+# DuckDB es columnar y es la mejor opción para agregaciones sobre la tabla completa; es una dependencia
+# opcional (pip install duckdb). SQLite viene incluido en Python.
+BACKENDS = ("mysql", "duckdb", "sqlite")
+BACKEND = "mysql"
+RUTAS_POR_DEFECTO = {
+    "duckdb": "../data_medical.duckdb",
+    "sqlite": "../data_medical.sqlite"
+}
+
+# Traducción de los tipos de esquema.py (MySQL) a cada backend embebido
+# Formato: { "backend": [(patrón del tipo MySQL, tipo del backend), ...] } (se usa el primer patrón que coincide)
+TIPOS_EMBEBIDOS = {
+    "duckdb": [
+        (r"TINYINT UNSIGNED", "UTINYINT"),
+        (r"SMALLINT UNSIGNED", "USMALLINT"),
+        (r"INT UNSIGNED", "UINTEGER"),
+        (r"BIGINT UNSIGNED", "UBIGINT"),
+        (r"(DECIMAL\(\d+,\d+\))", r"\1"),
+        (r"VARCHAR\(\d+\)", "VARCHAR")
+    ],
+    "sqlite": [
+        (r"\w*INT\b( UNSIGNED)?", "INTEGER"),
+        (r"DECIMAL\(\d+,\d+\)", "REAL"),
+        (r"VARCHAR\(\d+\)", "TEXT")
+    ]
+}
+
+def modulo_duckdb():
+    """Importa duckdb solo cuando se usa (es una dependencia opcional)."""
+    try:
+        import duckdb
+        return duckdb
+    except ImportError:
+        print("Error: El backend 'duckdb' requiere el paquete duckdb (pip install duckdb).")
+        return None
+
+def conectar(backend, ruta=None, solo_lectura=False):
+    """Abre (o crea) la base embebida del backend indicado. Devuelve None si no se pudo abrir.
+    Con solo_lectura=True la base debe existir y la conexión se puede usar desde varios hilos (uno a la vez)."""
+    ruta = ruta or RUTAS_POR_DEFECTO[backend]
+    if backend == "duckdb":
+        duckdb = modulo_duckdb()
+        return duckdb.connect(ruta, read_only=solo_lectura) if duckdb else None
+    if solo_lectura:
+        return sqlite3.connect(f"file:{os.path.abspath(ruta)}?mode=ro", uri=True, check_same_thread=False)
+    conn = sqlite3.connect(ruta)
+    conn.execute("PRAGMA foreign_keys = ON") # SQLite solo verifica las FKs si se habilitan por conexión
+    return conn
+
+def tipo_embebido(tipo_mysql, backend):
+    """Traduce un tipo de columna de esquema.py (ej. 'SMALLINT UNSIGNED NOT NULL') al tipo del backend."""
+    for patron, reemplazo in TIPOS_EMBEBIDOS[backend]:
+        if re.match(patron, tipo_mysql):
+            return re.sub(patron, reemplazo, tipo_mysql, count=1)
+    return tipo_mysql
+
+def create_table_sql(tabla, backend, primary_keys, foreign_keys):
+    """Devuelve el CREATE TABLE de una tabla para un backend embebido, con su PK y sus FKs declaradas.
+    Las bases embebidas no admiten agregar restricciones con ALTER TABLE, así que se declaran todas al crear la tabla.
+    primary_keys y foreign_keys tienen el formato de PRIMARY_KEYS y FOREIGN_KEYS en crea_db.py."""
+    definicion = esquema.TABLAS[tabla]
+    columnas_sql = [f'"{nombre}" {tipo_embebido(tipo, backend)}' for nombre, tipo in definicion["columnas"]]
+
+    pk = definicion["pk"] or ([primary_keys[tabla]] if tabla in primary_keys else None)
+    if pk:
+        columnas_pk = ", ".join(f'"{col}"' for col in pk)
+        columnas_sql.append(f"PRIMARY KEY ({columnas_pk})")
+    for fk_info in foreign_keys:
+        if fk_info["from_table"] == tabla:
+            columnas_sql.append(f'FOREIGN KEY ("{fk_info["from_column"]}") REFERENCES "{fk_info["to_table"]}" ("{fk_info["to_column"]}")')
+    return f'CREATE TABLE "{tabla}" ({", ".join(columnas_sql)})'
+
+def insertar_chunk(conn, backend, df, table_name):
+    """Inserta un DataFrame en una tabla del backend embebido."""
+    columnas = ", ".join(f'"{col}"' for col in df.columns)
+    if backend == "duckdb":
+        # DuckDB lee el DataFrame directamente (sin convertir fila a fila a objetos de Python)
+        conn.register("chunk_csv", df)
+        conn.execute(f'INSERT INTO "{table_name}" ({columnas}) SELECT {columnas} FROM chunk_csv')
+        conn.unregister("chunk_csv")
+    else:
+        lote_nativo = df.astype(object).where(df.notna(), None)
+        marcadores = ", ".join(["?"] * len(df.columns))
+        conn.executemany(f'INSERT INTO "{table_name}" ({columnas}) VALUES ({marcadores})',
+                         lote_nativo.itertuples(index=False, name=None))
+
+def crear_indices_embebidos(conn, backend, tablas):
+    """Crea los índices de indices.py de las tablas cargadas en SQLite. DuckDB no los necesita: recorre las columnas
+    con sus propios resúmenes por bloque."""
+    if backend != "sqlite":
+        return
+    for tabla, lista_indices in indices.INDICES.items():
+        if tabla not in tablas:
+            continue
+        for nombre, columnas in lista_indices:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{nombre}" ON "{tabla}" ({", ".join(columnas)})')
@@ -0,0 +1,232 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from metricas import rss_pico_mb, VARIABLE_RUTA_LOG
+
+# --- Configuración del Benchmark ---
+# Mide la generación de CSVs (crea_csv) y la carga (crea_db) a distintas escalas del conjunto de datos
+# actual (854 pacientes y 17 profesionales). Cada etapa corre en un proceso nuevo para que el pico de
+# memoria (RSS) medido sea el de esa etapa.
+PACIENTES_BASE = 854
+PROFESIONALES_BASE = 17
+ESCALAS = [1, 10, 100, 1000]
+CARPETA_RESULTADOS = "../benchmarks"
+# Las etapas de crea_csv y crea_db medidas por el benchmark van a su propio log, no al del pipeline real
+LOG_METRICAS_BENCHMARK = os.path.join(CARPETA_RESULTADOS, "pipeline_metrics.jsonl")
+UMBRAL_REGRESION = 0.20 # Una etapa un 20% más lenta (o con 20% más de memoria) que la línea base es una regresión
+BD_BENCHMARK = "data_medical_bench" # En MySQL se usa una base separada para no tocar data_medical
+LIMITE_VARIABLES_SQLITE = 32766 # Máximo de parámetros por sentencia en SQLite
+
+def tamano_csvs(data_dir):
+    """Suma el tamaño en bytes de los CSV de una carpeta."""
+    return sum(os.path.getsize(os.path.join(data_dir, f)) for f in os.listdir(data_dir) if f.endswith(".csv"))
+
+def archivos_por_tabla(data_dir):
+    """Devuelve { tabla: ruta_csv } para los CSV de una carpeta, con los mismos nombres de tabla que crea_db."""
+    import crea_db
+    return {
+        crea_db.limpiar_identificador(os.path.splitext(f)[0]): os.path.join(data_dir, f)
+        for f in sorted(os.listdir(data_dir)) if f.endswith(".csv")
+    }
+
+# --- Backend embebido (SQLite) ---
+# Permite medir el camino de inserción de crea_db (conversión de tipos e INSERT multi-fila por lotes)
+# sin Docker ni red. Solo traduce los marcadores %s de mysql.connector a los ? de sqlite3.
+class CursorSQLite:
+    def __init__(self, conn):
+        self._cursor = conn.cursor()
+
+    def execute(self, query, parametros=()):
+        self._cursor.execute(query.replace("%s", "?"), parametros)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+def cargar_sqlite(data_dir):
+    """Carga los CSV en una base SQLite con insert_data_into_table de crea_db. Devuelve (filas, bytes de la base)."""
+    import crea_db
+
+    ruta_db = os.path.join(data_dir, "benchmark.sqlite")
+    if os.path.exists(ruta_db):
+        os.remove(ruta_db)
+    conn = sqlite3.connect(ruta_db)
+    cursor = CursorSQLite(conn)
+    archivos = archivos_por_tabla(data_dir)
+    filas = 0
+    for tabla in crea_db.orden_de_carga(archivos):
+        columnas = crea_db.columnas_csv(archivos[tabla])
+        cursor.execute(f"CREATE TABLE `{tabla}` ({', '.join(f'`{crea_db.limpiar_identificador(col)}`' for col in columnas)})")
+        tamano_lote = min(crea_db.TAMANO_LOTE_INSERT, LIMITE_VARIABLES_SQLITE // len(columnas))
+        # Mismo lector que crea_db: los CSV se leen con los tipos de tipos.py
+        for chunk in crea_db.leer_archivo_por_chunks(archivos[tabla], crea_db.TAMANO_CHUNK):
+            filas += crea_db.insert_data_into_table(conn, cursor, chunk, tabla, tamano_lote)
+    conn.close()
+    return filas, os.path.getsize(ruta_db)
+
+def cargar_mysql(data_dir, modo, workers):
+    """Carga los CSV en la base BD_BENCHMARK de MySQL con la carga en paralelo de crea_db. Devuelve (filas, bytes en disco)."""
+    import mysql.connector
+    import crea_db
+
+    # Crear la base del benchmark vacía
+    conn = mysql.connector.connect(host=crea_db.DB_HOST, port=crea_db.DB_PORT, user=crea_db.DB_USER, password=crea_db.DB_PASSWORD)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{BD_BENCHMARK}`")
+    cursor.execute(f"CREATE DATABASE `{BD_BENCHMARK}`")
+    conn.close()
+
+    crea_db.DB_NAME = BD_BENCHMARK
+    workers = crea_db.workers_para_pool(workers)
+    pool = crea_db.get_db_pool(workers + 1, allow_local_infile=(modo == "load_data"))
+    conn = pool.get_connection()
+    cursor = conn.cursor()
+    if modo == "load_data" and not crea_db.load_data_disponible(cursor):
+        modo = "lotes"
+    filas = crea_db.cargar_tablas_en_paralelo(pool, archivos_por_tabla(data_dir), modo, workers=workers)
+
+    cursor.execute(
+        "SELECT COALESCE(SUM(DATA_LENGTH + INDEX_LENGTH), 0) FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = %s",
+        (BD_BENCHMARK,)
+    )
+    bytes_db = int(cursor.fetchone()[0])
+    conn.close()
+    return sum(n for n in filas.values() if n is not None), bytes_db
+
+# --- Etapas medidas (se ejecutan en un proceso nuevo cada una) ---
+def etapa_generacion(data_dir, escala, motor, workers):
+    """Genera el conjunto de datos a la escala indicada y devuelve sus métricas."""
+    import crea_csv
+    crea_csv.DATA_DIR = data_dir
+
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        filas = crea_csv.generar_todo(num_pacientes=PACIENTES_BASE * escala, num_profesionales=PROFESIONALES_BASE * escala,
+                                      paralelo=(motor == "paralelo"), workers=workers, usar_cache=False,
+                                      motor=motor if motor in crea_csv.MOTORES else crea_csv.MOTOR)
+    segundos = time.perf_counter() - inicio
+    return {"segundos": segundos, "filas": sum(filas.values()), "rss_pico_mb": rss_pico_mb(), "bytes_salida": tamano_csvs(data_dir)}
+
+def etapa_carga(data_dir, backend, modo, workers):
+    """Carga el conjunto de datos generado en el backend indicado y devuelve sus métricas."""
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if backend == "sqlite":
+            filas, bytes_salida = cargar_sqlite(data_dir)
+        else:
+            filas, bytes_salida = cargar_mysql(data_dir, modo, workers)
+    segundos = time.perf_counter() - inicio
+    return {"segundos": segundos, "filas": filas, "rss_pico_mb": rss_pico_mb(), "bytes_salida": bytes_salida}
+
+def ejecutar_en_proceso_nuevo(funcion, *args):
+    """Ejecuta una etapa en un proceso recién creado para medir su memoria de forma aislada."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as ejecutor:
+        return ejecutor.submit(funcion, *args).result()
+
+def commit_actual():
+    """Devuelve el hash del commit de git actual (o None si no se puede obtener)."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def configuracion_benchmark(motor, backend, modo):
+    """Devuelve los parámetros que deben coincidir para comparar dos ejecuciones del benchmark."""
+    return {"motor": motor, "backend": backend, "modo": modo if backend == "mysql" else None}
+
+def comparar_con_linea_base(resultados, ruta_linea_base, configuracion, umbral=UMBRAL_REGRESION):
+    """Compara los resultados con un JSON anterior e imprime las diferencias. Devuelve la lista de regresiones,
+    o None si la línea base se midió con otro motor, backend o modo de carga (no son comparables)."""
+    with open(ruta_linea_base, encoding="utf-8") as f:
+        informe = json.load(f)
+    configuracion_anterior = {clave: informe.get(clave) for clave in configuracion}
+    if configuracion_anterior != configuracion:
+        print(f"\nError: La línea base '{ruta_linea_base}' se midió con {configuracion_anterior} y esta ejecución con "
+              f"{configuracion}. No se comparan.")
+        return None
+    linea_base = {(r["escala"], r["etapa"]): r for r in informe["resultados"]}
+
+    print(f"\n--- Comparación con '{ruta_linea_base}' ---")
+    regresiones = []
+    for resultado in resultados:
+        anterior = linea_base.get((resultado["escala"], resultado["etapa"]))
+        if not anterior:
+            continue
+        for metrica in ("segundos", "rss_pico_mb"):
+            cambio = resultado[metrica] / max(anterior[metrica], 1e-9) - 1
+            marca = ""
+            if cambio > umbral:
+                marca = "  <-- REGRESIÓN"
+                regresiones.append((resultado["escala"], resultado["etapa"], metrica, cambio))
+            print(f"{resultado['escala']:>5}x {resultado['etapa']:<12} {metrica:<12} "
+                  f"{anterior[metrica]:>10.2f} -> {resultado[metrica]:>10.2f} ({cambio:+.1%}){marca}")
+    return regresiones
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de generación (crea_csv) y carga (crea_db) a distintas escalas.")
+    parser.add_argument("--escalas", type=int, nargs="+", default=ESCALAS, help="Factores de escala sobre 854 pacientes y 17 profesionales")
+    parser.add_argument("--motor", choices=("bucle", "vectorizado", "paralelo"), default="vectorizado", help="Motor de generación de Tratamientos")
+    parser.add_argument("--backend", choices=("sqlite", "mysql"), default="sqlite", help="sqlite (embebido, sin Docker) o mysql (local)")
+    parser.add_argument("--modo", default="load_data", help="Modo de carga de crea_db (solo con --backend mysql)")
+    parser.add_argument("--workers", type=int, default=4, help="Procesos de generación (motor paralelo) y tablas cargadas en paralelo")
+    parser.add_argument("--salida", default=None, help="Ruta del JSON de resultados")
+    parser.add_argument("--linea-base", default=None, help="JSON de una ejecución anterior con el que comparar")
+    args = parser.parse_args()
+    os.environ[VARIABLE_RUTA_LOG] = os.path.abspath(LOG_METRICAS_BENCHMARK) # Lo heredan los procesos de cada etapa
+
+    resultados = []
+    for escala in args.escalas:
+        data_dir = tempfile.mkdtemp(prefix=f"benchmark_{escala}x_")
+        try:
+            print(f"\n--- Escala {escala}x ({PACIENTES_BASE * escala} pacientes, {PROFESIONALES_BASE * escala} profesionales) ---")
+            etapas = [
+                ("generacion", etapa_generacion, (data_dir, escala, args.motor, args.workers)),
+                ("carga", etapa_carga, (data_dir, args.backend, args.modo, args.workers))
+            ]
+            for nombre, funcion, parametros in etapas:
+                metricas = ejecutar_en_proceso_nuevo(funcion, *parametros)
+                metricas["filas_por_segundo"] = metricas["filas"] / max(metricas["segundos"], 1e-9)
+                resultados.append(dict(escala=escala, pacientes=PACIENTES_BASE * escala, etapa=nombre, **metricas))
+                print(f"{nombre:<12} {metricas['segundos']:>9.2f} s  {metricas['filas']:>11} filas  "
+                      f"{metricas['filas_por_segundo']:>12,.0f} filas/s  {metricas['rss_pico_mb']:>8.1f} MB RSS  "
+                      f"{metricas['bytes_salida'] / 1024 / 1024:>9.1f} MB de salida")
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    informe = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        **configuracion_benchmark(args.motor, args.backend, args.modo),
+        "resultados": resultados
+    }
+    salida = args.salida or os.path.join(CARPETA_RESULTADOS, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en '{salida}'.")
+
+    if args.linea_base:
+        regresiones = comparar_con_linea_base(resultados, args.linea_base, configuracion_benchmark(args.motor, args.backend, args.modo))
+        if regresiones is None:
+            sys.exit(1)
+        if regresiones:
+            print(f"\n{len(regresiones)} regresiones respecto de la línea base.")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
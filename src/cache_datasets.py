@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+# --- Caché de conjuntos de datos generados ---
+# La salida de crea_csv.py depende solo de su configuración (semilla, cantidad de pacientes y profesionales,
+# formatos, motor de generación...) y del código que la genera. Cada conjunto generado se guarda en
+# CARPETA_CACHE bajo una huella de la configuración y del código. Si se vuelve a pedir el mismo conjunto,
+# se restaura en la carpeta de datos con enlaces duros: no se genera ni se copia nada. Si el sistema de
+# archivos no admite enlaces duros, se copian los archivos.
+# Como los archivos de la carpeta de datos pueden ser enlaces a la caché, crea_csv.py borra cada archivo
+# antes de volver a escribirlo (nunca lo sobrescribe en el lugar).
+CARPETA_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, ".cache", "datasets")
+MAXIMO_CONJUNTOS = 5 # Al superarlo se borran los conjuntos usados hace más tiempo (LRU)
+ARCHIVOS_CODIGO = ["crea_csv.py", "tipos.py"] # Cualquier cambio en estos archivos invalida la caché
+MANIFIESTO = "manifiesto.json"
+
+def huella(configuracion):
+    """Devuelve la huella (SHA-256) de una configuración de generación y del código que genera los datos."""
+    contenido = hashlib.sha256(json.dumps(configuracion, sort_keys=True, default=str).encode("utf-8"))
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    for archivo in ARCHIVOS_CODIGO:
+        with open(os.path.join(directorio, archivo), "rb") as f:
+            contenido.update(f.read())
+    return contenido.hexdigest()
+
+def enlazar(origen, destino):
+    """Enlaza (o copia, si no se puede) un archivo, reemplazando el destino si existe."""
+    if os.path.exists(destino):
+        os.remove(destino)
+    try:
+        os.link(origen, destino)
+    except OSError: # Otro disco o un sistema de archivos sin enlaces duros
+        shutil.copy2(origen, destino)
+
+def restaurar(configuracion, data_dir):
+    """Si el conjunto está en la caché, lo deja en data_dir y devuelve { tabla: filas }. Si no está, devuelve None."""
+    carpeta = os.path.join(CARPETA_CACHE, huella(configuracion))
+    ruta_manifiesto = os.path.join(carpeta, MANIFIESTO)
+    if not os.path.exists(ruta_manifiesto):
+        return None
+    with open(ruta_manifiesto, encoding="utf-8") as f:
+        manifiesto = json.load(f)
+    # Un conjunto al que le falta algún archivo (borrado a mano, disco lleno...) no sirve: se descarta
+    if not all(os.path.exists(os.path.join(carpeta, archivo)) for archivo in manifiesto["archivos"]):
+        print(f"Conjunto incompleto en la caché ('{carpeta}'): se descarta y se genera de nuevo.")
+        shutil.rmtree(carpeta, ignore_errors=True)
+        return None
+    os.makedirs(data_dir, exist_ok=True)
+    for archivo in manifiesto["archivos"]:
+        enlazar(os.path.join(carpeta, archivo), os.path.join(data_dir, archivo))
+    os.utime(ruta_manifiesto) # La fecha de modificación es la de último uso para el LRU
+    return manifiesto["filas"]
+
+def guardar(configuracion, data_dir, archivos, filas, maximo=MAXIMO_CONJUNTOS):
+    """Guarda en la caché los archivos de un conjunto recién generado y borra los usados hace más tiempo."""
+    carpeta = os.path.join(CARPETA_CACHE, huella(configuracion))
+    # Se arma en una carpeta temporal y se renombra al final: nunca queda un conjunto a medio guardar
+    temporal = f"{carpeta}.tmp{os.getpid()}"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    for archivo in archivos:
+        enlazar(os.path.join(data_dir, archivo), os.path.join(temporal, archivo))
+    with open(os.path.join(temporal, MANIFIESTO), "w", encoding="utf-8") as f:
+        json.dump({"configuracion": configuracion, "archivos": archivos, "filas": filas,
+                   "creado": time.strftime("%Y-%m-%dT%H:%M:%S")}, f, indent=2, ensure_ascii=False)
+    shutil.rmtree(carpeta, ignore_errors=True)
+    os.replace(temporal, carpeta)
+
+    manifiestos = [os.path.join(CARPETA_CACHE, nombre, MANIFIESTO) for nombre in os.listdir(CARPETA_CACHE)]
+    manifiestos = sorted((ruta for ruta in manifiestos if os.path.exists(ruta)), key=os.path.getmtime)
+    for ruta in manifiestos[:-maximo]:
+        shutil.rmtree(os.path.dirname(ruta), ignore_errors=True)
+
+def limpiar():
+    """Borra todos los conjuntos guardados en la caché."""
+    shutil.rmtree(CARPETA_CACHE, ignore_errors=True)
@@ -0,0 +1,313 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+import crea_db
+import tipos
+
+# --- Índice de cohortes en memoria ---
+# Las preguntas más frecuentes son intersecciones de cohortes (ej. pacientes con esquizofrenia que toman 2 o más
+# antipsicóticos, atendidos por un profesional, con IMC > 30). En SQL son varios JOIN sobre tratamientos,
+# medicacion, diagnosticos y metabolico. Aquí cada medicación, tipo de medicación, diagnóstico y profesional
+# tiene el conjunto de sus pacientes, y las cohortes se combinan con operaciones de bits (AND, OR, NOT) sobre
+# arrays de numpy, sin volver a recorrer tratamientos.
+# Cada conjunto se guarda como en un bitmap "roaring": una lista ordenada de paciente_id (uint32) mientras tenga
+# pocos pacientes (ej. un profesional) y un bitmap de un bit por paciente_id (palabras de 64 bits) cuando la
+# lista ocuparía más que el bitmap. Las medidas metabólicas se guardan ordenadas por valor junto con sus
+# paciente_id en el mismo orden: un rango (ej. IMC > 30) se resuelve con dos búsquedas binarias.
+DIMENSIONES = ("medicacion", "tipo", "diagnostico", "profesional")
+COLUMNAS_METABOLICAS = ("edad", "peso", "imc")
+OPERADORES = ("=", "<", "<=", ">", ">=")
+TAMANO_CHUNK = crea_db.TAMANO_CHUNK # Filas por chunk al construir el índice desde los archivos de datos
+
+# --- Bitmaps ---
+# Bit i del bitmap = paciente_id i. Las palabras son uint64 little-endian para que packbits/unpackbits
+# (con bitorder="little") y las operaciones de bits trabajen sobre el mismo orden.
+TIPO_PALABRA = np.dtype("<u8")
+
+def palabras_para(paciente_id_maximo):
+    """Devuelve cuántas palabras de 64 bits necesita un bitmap que llegue hasta ese paciente_id."""
+    return int(paciente_id_maximo) // 64 + 1
+
+def bitmap_de_ids(ids, palabras):
+    """Convierte una lista de paciente_id en un bitmap de palabras uint64."""
+    marcas = np.zeros(palabras * 64, dtype=bool)
+    marcas[ids] = True
+    return np.packbits(marcas, bitorder="little").view(TIPO_PALABRA)
+
+def ids_de_bitmap(bits):
+    """Devuelve los paciente_id (ordenados) cuyos bits están en 1."""
+    return np.flatnonzero(np.unpackbits(bits.view(np.uint8), bitorder="little")).astype(np.uint32)
+
+def ajustar(bits, palabras):
+    """Completa un bitmap con palabras en 0 hasta la longitud pedida (los pacientes nuevos no están en él)."""
+    if len(bits) >= palabras:
+        return bits
+    return np.concatenate([bits, np.zeros(palabras - len(bits), dtype=TIPO_PALABRA)])
+
+def es_bitmap(conjunto):
+    """Los conjuntos densos son bitmaps (uint64); los dispersos, listas ordenadas de paciente_id (uint32)."""
+    return conjunto.dtype == TIPO_PALABRA
+
+def agrupar(claves, pacientes):
+    """Devuelve [(clave, paciente_id ordenados y sin repetir)] a partir de pares (clave, paciente_id) enteros."""
+    orden = np.lexsort((pacientes, claves))
+    claves, pacientes = claves[orden], pacientes[orden]
+    distintos = np.ones(len(claves), dtype=bool)
+    distintos[1:] = (claves[1:] != claves[:-1]) | (pacientes[1:] != pacientes[:-1])
+    claves, pacientes = claves[distintos], pacientes[distintos]
+    unicas, inicios = np.unique(claves, return_index=True)
+    return zip(unicas.tolist(), np.split(pacientes, inicios[1:]))
+
+# --- Cohortes ---
+# Un conjunto de pacientes como bitmap. Se combina con & (y), | (o), - (y no) y ~ (los pacientes del índice
+# que no están en la cohorte); len() devuelve la cantidad de pacientes.
+class Cohorte:
+    def __init__(self, bits, indice):
+        self.bits = bits
+        self.indice = indice
+
+    def _operandos(self, otra):
+        palabras = max(len(self.bits), len(otra.bits))
+        return ajustar(self.bits, palabras), ajustar(otra.bits, palabras)
+
+    def __and__(self, otra):
+        a, b = self._operandos(otra)
+        return Cohorte(a & b, self.indice)
+
+    def __or__(self, otra):
+        a, b = self._operandos(otra)
+        return Cohorte(a | b, self.indice)
+
+    def __sub__(self, otra):
+        a, b = self._operandos(otra)
+        return Cohorte(a & ~b, self.indice)
+
+    def __invert__(self):
+        return self.indice.todos() - self
+
+    def __len__(self):
+        return int(np.bitwise_count(self.bits).sum())
+
+    def __contains__(self, paciente_id):
+        palabra = int(paciente_id) >> 6
+        return palabra < len(self.bits) and bool((int(self.bits[palabra]) >> (int(paciente_id) & 63)) & 1)
+
+    def __repr__(self):
+        return f"Cohorte({len(self)} pacientes)"
+
+    def pacientes(self):
+        """Devuelve los paciente_id de la cohorte (ordenados), ej. para filtrar un DataFrame con isin()."""
+        return ids_de_bitmap(self.bits)
+
+class IndiceCohortes:
+    def __init__(self, medicacion, diagnosticos=None, profesionales=None):
+        """Crea un índice vacío. Las tablas de dimensión (con columnas limpias, como en MySQL) permiten pedir
+        los conjuntos por nombre (ej. "Quetiapina", "Esquizofrenia") además de por id."""
+        self.palabras = 1
+        self.universo = np.zeros(1, dtype=TIPO_PALABRA) # Todos los pacientes conocidos
+        self.conjuntos = {dimension: {} for dimension in DIMENSIONES}
+        self.metabolico = {} # columna -> (valores ordenados, paciente_id en el mismo orden)
+        self.tipo_de_medicacion = dict(zip(medicacion["medicacion_id"].tolist(), medicacion["tipo"].astype(str).tolist()))
+        # dimension -> { id: nombre } y { nombre en minúsculas: id }
+        self.etiquetas = {"medicacion": dict(zip(medicacion["medicacion_id"].tolist(), medicacion["droga"].astype(str).tolist()))}
+        for dimension, tabla, columna_id in (("diagnostico", diagnosticos, "diagnostico_id"), ("profesional", profesionales, "profesionales_id")):
+            self.etiquetas[dimension] = {} if tabla is None else dict(zip(tabla[columna_id].tolist(), tabla["name"].astype(str).tolist()))
+        self.nombres = {dimension: {nombre.lower(): clave for clave, nombre in etiquetas.items()} for dimension, etiquetas in self.etiquetas.items()}
+
+    # --- Actualización (carga inicial y filas agregadas) ---
+    def _ampliar(self, pacientes):
+        """Agrega paciente_id al universo, ampliando los bitmaps si llegan ids más grandes."""
+        if not len(pacientes):
+            return
+        self.palabras = max(self.palabras, palabras_para(pacientes.max()))
+        self.universo = ajustar(self.universo, self.palabras) | bitmap_de_ids(pacientes, self.palabras)
+
+    def _agregar_a_conjunto(self, dimension, clave, ids):
+        """Une ids (ordenados y sin repetir) al conjunto de una clave. Pasa la lista a bitmap cuando este ocupa menos."""
+        conjunto = self.conjuntos[dimension].get(clave)
+        if conjunto is None:
+            conjunto = ids
+        elif es_bitmap(conjunto):
+            conjunto = ajustar(conjunto, self.palabras) | bitmap_de_ids(ids, self.palabras)
+        else:
+            conjunto = np.union1d(conjunto, ids)
+        # 4 bytes por paciente en la lista frente a 8 bytes por palabra en el bitmap
+        if not es_bitmap(conjunto) and len(conjunto) > 2 * self.palabras:
+            conjunto = bitmap_de_ids(conjunto, self.palabras)
+        self.conjuntos[dimension][clave] = conjunto
+
+    def agregar_pacientes(self, paciente_ids):
+        """Agrega pacientes al universo (los pacientes sin tratamientos también forman parte de ~cohorte)."""
+        self._ampliar(np.asarray(paciente_ids, dtype=np.uint32))
+
+    def agregar_tratamientos(self, df):
+        """Agrega filas de tratamientos (paciente_id, medicacion_id, profesionales_id, diagnostico_id)."""
+        pacientes = df["paciente_id"].to_numpy(np.uint32)
+        self._ampliar(pacientes)
+        tipo = df["medicacion_id"].map(self.tipo_de_medicacion)
+        codigos_tipo, nombres_tipo = pd.factorize(tipo)
+        columnas = {
+            "medicacion": df["medicacion_id"].to_numpy(np.int64),
+            "tipo": codigos_tipo,
+            "diagnostico": df["diagnostico_id"].to_numpy(np.int64),
+            "profesional": df["profesionales_id"].to_numpy(np.int64)
+        }
+        for dimension, claves in columnas.items():
+            validas = claves >= 0 # factorize marca con -1 las medicaciones sin tipo conocido
+            for clave, ids in agrupar(claves[validas], pacientes[validas]):
+                self._agregar_a_conjunto(dimension, nombres_tipo[clave] if dimension == "tipo" else clave, ids)
+
+    def agregar_metabolico(self, df):
+        """Agrega filas de metabolico. Si un paciente ya tenía medidas, se reemplazan por las nuevas."""
+        pacientes = df["paciente_id"].to_numpy(np.uint32)
+        self._ampliar(pacientes)
+        dtypes = tipos.dtypes_tabla("metabolico", COLUMNAS_METABOLICAS)
+        for columna in COLUMNAS_METABOLICAS:
+            valores = df[columna].to_numpy(dtypes[columna])
+            orden = np.argsort(valores, kind="stable")
+            valores, ids = valores[orden], pacientes[orden]
+            if columna in self.metabolico:
+                valores_actuales, ids_actuales = self.metabolico[columna]
+                conservar = ~np.isin(ids_actuales, ids)
+                valores_actuales, ids_actuales = valores_actuales[conservar], ids_actuales[conservar]
+                # Ambas partes están ordenadas: se insertan las nuevas en su posición sin reordenar todo
+                posiciones = np.searchsorted(valores_actuales, valores, side="right")
+                valores, ids = np.insert(valores_actuales, posiciones, valores), np.insert(ids_actuales, posiciones, ids)
+            self.metabolico[columna] = (valores, ids)
+
+    # --- Cohortes ---
+    def _clave(self, dimension, valor):
+        """Devuelve la clave de un conjunto a partir de su id o de su nombre."""
+        if dimension == "tipo" or not isinstance(valor, str):
+            return valor
+        try:
+            return self.nombres[dimension][valor.lower()]
+        except KeyError:
+            raise ValueError(f"No existe '{valor}' en {dimension}.") from None
+
+    def _cohorte(self, dimension, valor):
+        conjunto = self.conjuntos[dimension].get(self._clave(dimension, valor))
+        if conjunto is None:
+            return Cohorte(np.zeros(self.palabras, dtype=TIPO_PALABRA), self)
+        return Cohorte(conjunto if es_bitmap(conjunto) else bitmap_de_ids(conjunto, self.palabras), self)
+
+    def todos(self):
+        return Cohorte(self.universo, self)
+
+    def medicacion(self, valor):
+        """Pacientes tratados con una medicación (medicacion_id o droga, ej. "Quetiapina")."""
+        return self._cohorte("medicacion", valor)
+
+    def tipo(self, valor):
+        """Pacientes tratados con algún medicamento de un tipo (ej. "Antipsicotico")."""
+        return self._cohorte("tipo", valor)
+
+    def diagnostico(self, valor):
+        """Pacientes con un diagnóstico (diagnostico_id o nombre, ej. "Esquizofrenia")."""
+        return self._cohorte("diagnostico", valor)
+
+    def profesional(self, valor):
+        """Pacientes atendidos por un profesional (profesionales_id o nombre)."""
+        return self._cohorte("profesional", valor)
+
+    def medida(self, columna, operador, valor):
+        """Pacientes cuya medida metabólica (edad, peso o imc) cumple la condición, ej. medida("imc", ">", 30)."""
+        if columna not in self.metabolico:
+            raise ValueError(f"La columna '{columna}' no está en el índice (columnas: {', '.join(COLUMNAS_METABOLICAS)}).")
+        if operador not in OPERADORES:
+            raise ValueError(f"Operador no permitido: '{operador}'.")
+        valores, ids = self.metabolico[columna]
+        valor = valores.dtype.type(valor) # Comparar en float32 (ej. 30.1 como el valor guardado, no como float64)
+        desde = np.searchsorted(valores, valor, side="right" if operador == ">" else "left") if operador in (">", ">=", "=") else 0
+        hasta = np.searchsorted(valores, valor, side="left" if operador == "<" else "right") if operador in ("<", "<=", "=") else len(valores)
+        return Cohorte(bitmap_de_ids(ids[desde:hasta], self.palabras), self)
+
+    def al_menos(self, k, cohortes):
+        """Pacientes que están en al menos k de las cohortes (ej. k medicaciones distintas)."""
+        cuentas = np.zeros(self.palabras * 64, dtype=np.uint16)
+        for cohorte in cohortes:
+            cuentas += np.unpackbits(ajustar(cohorte.bits, self.palabras).view(np.uint8), bitorder="little")
+        return Cohorte(np.packbits(cuentas >= k, bitorder="little").view(TIPO_PALABRA), self)
+
+    def al_menos_medicaciones(self, k, tipo=None):
+        """Pacientes tratados con al menos k medicaciones distintas (de un tipo, ej. "Antipsicotico", o de cualquiera)."""
+        ids = [medicacion_id for medicacion_id in self.conjuntos["medicacion"] if tipo is None or self.tipo_de_medicacion.get(medicacion_id) == tipo]
+        return self.al_menos(k, [self.medicacion(medicacion_id) for medicacion_id in ids])
+
+    def conteo_por(self, dimension, cohorte=None):
+        """Cantidad de pacientes (de la cohorte, o de todos) por cada clave de una dimensión, de mayor a menor."""
+        etiquetas = self.etiquetas.get(dimension, {})
+        conteos = {}
+        for clave in self.conjuntos[dimension]:
+            pacientes = self._cohorte(dimension, clave)
+            conteos[etiquetas.get(clave, clave)] = len(pacientes & cohorte if cohorte is not None else pacientes)
+        return pd.Series(conteos, name="pacientes", dtype="uint32").sort_values(ascending=False)
+
+    def memoria_mb(self):
+        """Devuelve la memoria que ocupan los conjuntos y las medidas del índice, en MB."""
+        total = self.universo.nbytes + sum(conjunto.nbytes for conjuntos in self.conjuntos.values() for conjunto in conjuntos.values())
+        total += sum(valores.nbytes + ids.nbytes for valores, ids in self.metabolico.values())
+        return total / 1024 / 1024
+
+    def __repr__(self):
+        conjuntos = sum(len(conjuntos) for conjuntos in self.conjuntos.values())
+        return f"IndiceCohortes({len(self.todos())} pacientes, {conjuntos} conjuntos, {self.memoria_mb():.1f} MB)"
+
+# --- Construcción ---
+def limpiar_columnas(df):
+    """Deja los nombres de columna como en MySQL (ej. "Droga" -> "droga")."""
+    df.columns = [crea_db.limpiar_identificador(col) for col in df.columns]
+    return df
+
+def desde_archivos(archivos_por_tabla=None, tamano_chunk=TAMANO_CHUNK):
+    """Construye el índice desde los archivos de datos (CSV, Parquet o Arrow) de crea_db.CSV_FOLDER.
+    tratamientos y metabolico se leen por chunks, agregando cada uno al índice."""
+    inicio = time.perf_counter()
+    archivos_por_tabla = archivos_por_tabla or crea_db.archivos_de_datos_por_tabla(modo=None)
+    dimensiones = {tabla: limpiar_columnas(crea_db.leer_archivo(archivos_por_tabla[tabla]))
+                   for tabla in ("medicacion", "diagnosticos", "profesionales") if tabla in archivos_por_tabla}
+    indice = IndiceCohortes(dimensiones["medicacion"], dimensiones.get("diagnosticos"), dimensiones.get("profesionales"))
+    if "pacientes" in archivos_por_tabla:
+        for paciente_ids in crea_db.leer_columna_por_chunks(archivos_por_tabla["pacientes"], "paciente_id", tamano_chunk):
+            indice.agregar_pacientes(paciente_ids.to_numpy())
+    for tabla, agregar in (("tratamientos", indice.agregar_tratamientos), ("metabolico", indice.agregar_metabolico)):
+        if tabla in archivos_por_tabla:
+            for chunk in crea_db.leer_archivo_por_chunks(archivos_por_tabla[tabla], tamano_chunk):
+                agregar(limpiar_columnas(chunk))
+    print(f"Índice de cohortes construido desde los archivos en {time.perf_counter() - inicio:.2f} s: {indice}.")
+    return indice
+
+def desde_base(usar_cache=True):
+    """Construye el índice desde la base de datos (con datos.py, solo con las columnas necesarias)."""
+    import datos
+
+    inicio = time.perf_counter()
+    indice = IndiceCohortes(datos.leer_tabla("medicacion", usar_cache=usar_cache),
+                            datos.leer_tabla("diagnosticos", usar_cache=usar_cache),
+                            datos.leer_tabla("profesionales", usar_cache=usar_cache))
+    indice.agregar_pacientes(datos.leer_tabla("pacientes", ["paciente_id"], usar_cache=usar_cache)["paciente_id"].to_numpy())
+    indice.agregar_tratamientos(datos.leer_tabla("tratamientos", ["paciente_id", "medicacion_id", "profesionales_id", "diagnostico_id"], usar_cache=usar_cache))
+    indice.agregar_metabolico(datos.leer_tabla("metabolico", ["paciente_id", *COLUMNAS_METABOLICAS], usar_cache=usar_cache))
+    print(f"Índice de cohortes construido desde la base en {time.perf_counter() - inicio:.2f} s: {indice}.")
+    return indice
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye el índice de cohortes y responde una cohorte de ejemplo.")
+    parser.add_argument("--origen", choices=("archivos", "base"), default="archivos", help="Archivos de datos (../data) o base de datos MySQL")
+    parser.add_argument("--diagnostico", default="Esquizofrenia", help="Diagnóstico de la cohorte")
+    parser.add_argument("--antipsicoticos", type=int, default=2, help="Mínimo de antipsicóticos distintos")
+    parser.add_argument("--imc", type=float, default=30, help="IMC mínimo (estricto)")
+    args = parser.parse_args()
+
+    indice = desde_archivos() if args.origen == "archivos" else desde_base()
+    inicio = time.perf_counter()
+    cohorte = (indice.diagnostico(args.diagnostico) & indice.al_menos_medicaciones(args.antipsicoticos, "Antipsicotico")
+               & indice.medida("imc", ">", args.imc))
+    print(f"Pacientes con {args.diagnostico}, al menos {args.antipsicoticos} antipsicóticos e IMC > {args.imc}: "
+          f"{len(cohorte)} ({(time.perf_counter() - inicio) * 1000:.2f} ms).")
+    print(indice.conteo_por("profesional", cohorte).head(10).to_string())
+
+if __name__ == "__main__":
+    main()
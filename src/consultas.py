@@ -0,0 +1,48 @@
+# --- Consultas estándar de los paneles del dashboard de Grafana ---
+# Se usan para verificar sus planes de ejecución (EXPLAIN) después de crear los índices.
+CONSULTAS_DASHBOARD = {
+    # Cantidad de pacientes que toman cada medicación
+    "pacientes_por_medicacion": """
+        SELECT m.droga, m.tipo, COUNT(DISTINCT t.paciente_id) AS pacientes
+        FROM tratamientos t
+        JOIN medicacion m ON m.medicacion_id = t.medicacion_id
+        GROUP BY m.medicacion_id, m.droga, m.tipo
+    """,
+    # Número de pacientes con cada diagnóstico atendidos por cada profesional
+    "diagnosticos_por_profesional": """
+        SELECT p.name AS profesional, d.name AS diagnostico, COUNT(DISTINCT t.paciente_id) AS pacientes
+        FROM tratamientos t
+        JOIN profesionales p ON p.profesionales_id = t.profesionales_id
+        JOIN diagnosticos d ON d.diagnostico_id = t.diagnostico_id
+        GROUP BY t.profesionales_id, t.diagnostico_id, p.name, d.name
+    """,
+    # Peso e IMC de los pacientes que toman antipsicóticos frente a los que no
+    "metabolico_antipsicoticos": """
+        SELECT IF(ap.paciente_id IS NULL, 'No', 'Si') AS toma_antipsicotico,
+               COUNT(*) AS pacientes, AVG(me.peso) AS peso_promedio, AVG(me.imc) AS imc_promedio
+        FROM metabolico me
+        LEFT JOIN (
+            SELECT DISTINCT t.paciente_id
+            FROM tratamientos t
+            JOIN medicacion m ON m.medicacion_id = t.medicacion_id
+            WHERE m.tipo = 'Antipsicotico'
+        ) ap ON ap.paciente_id = me.paciente_id
+        GROUP BY toma_antipsicotico
+    """,
+    # Evolución mensual del peso e IMC según la toma de antipsicóticos, en la ventana de tiempo del panel.
+    # En Grafana el filtro de fechas es $__timeFilter(v.fecha); aquí se usa un rango fijo del seguimiento
+    # para verificar que MySQL solo lee las particiones de esos meses.
+    "evolucion_peso_antipsicoticos": """
+        SELECT DATE_FORMAT(v.fecha, '%Y-%m-01') AS mes, IF(ap.paciente_id IS NULL, 'No', 'Si') AS toma_antipsicotico,
+               COUNT(*) AS visitas, AVG(v.peso) AS peso_promedio, AVG(v.imc) AS imc_promedio
+        FROM visitas v
+        LEFT JOIN (
+            SELECT DISTINCT t.paciente_id
+            FROM tratamientos t
+            JOIN medicacion m ON m.medicacion_id = t.medicacion_id
+            WHERE m.tipo = 'Antipsicotico'
+        ) ap ON ap.paciente_id = v.paciente_id
+        WHERE v.fecha >= '2025-07-01' AND v.fecha < '2026-01-01'
+        GROUP BY mes, toma_antipsicotico
+    """
+}
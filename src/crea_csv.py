@@ -1,29 +1,143 @@
 import os
+import time
 import pandas as pd
 import numpy as np
-from faker import Faker
+import faker
+from faker.providers.person.es_ES import Provider as PersonaES
 import random
+import shutil
+import argparse
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+
+import metricas
+import tipos
+import cache_datasets
+
+# --- Carpeta de salida de los CSVs ---
+DATA_DIR = "../data"
+
+# --- Formatos de salida ---
+# "csv": texto UTF-8 separado por ';'. "parquet" y "arrow" (Arrow IPC) guardan cada tabla en formato
+# columnar con los tipos de tipos.py: se leen sin parsear texto ni inferir tipos, y los archivos
+# .arrow se escriben sin compresión para poder abrirlos con memory-map. Requieren pyarrow (opcional).
+FORMATOS_SALIDA = ("csv", "parquet", "arrow")
+FORMATOS = ["csv"] # Formatos que se escriben (uno o varios)
+EXTENSIONES = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+COLUMNAS_FECHA = {"fecha"} # Se guardan como date32 (sin hora) en los formatos columnares
+
+# --- Tamaño del conjunto de datos (por defecto) ---
+NUM_PACIENTES = 854
+NUM_PROFESIONALES = 17
 
 # --- Configuración del Seed (Semilla) para reproducibilidad ---
-# Puedes cambiar este número, pero si lo mantienes igual, los CSVs siempre serán los mismos.
+# Puedes cambiar este número (o usar --semilla), pero si lo mantienes igual, los CSVs siempre serán los mismos.
 RANDOM_SEED = 42 
 random.seed(RANDOM_SEED)
 np.random.seed(RANDOM_SEED)
-Faker.seed(RANDOM_SEED)
 
-# Configuración de Faker para nombres en español
-fake = Faker('es_ES')
+def fijar_semilla(semilla):
+    """Cambia RANDOM_SEED y reinicia los generadores globales de random y NumPy con esa semilla."""
+    global RANDOM_SEED
+    RANDOM_SEED = semilla
+    random.seed(semilla)
+    np.random.seed(semilla)
+
+# --- Generación masiva de nombres en español ---
+# Llamar a Faker('es_ES').name() una vez por fila no escala a millones de pacientes. Los nombres se arman con
+# NumPy a partir de los nombres de pila y apellidos de Faker es_ES (nombre + dos apellidos, el formato
+# más común de es_ES), con un generador de NumPy para que sean reproducibles con RANDOM_SEED.
+# Con TAMANO_POOL_NOMBRES > 0 se arma un pool de nombres completos una sola vez y cada fila solo elige
+# uno del pool (se guarda como category): 10M de pacientes se generan en segundos en lugar de minutos.
+TAMANO_POOL_NOMBRES = 0 # 0: un nombre armado por fila
+NOMBRES_DE_PILA = np.array(PersonaES.first_names_male + PersonaES.first_names_female, dtype=object)
+APELLIDOS = np.array(PersonaES.last_names, dtype=object)
+
+def generar_nombres(rng, cantidad, tamano_pool=None):
+    """Devuelve una Series con `cantidad` nombres completos ("Nombre Apellido Apellido")."""
+    tamano_pool = TAMANO_POOL_NOMBRES if tamano_pool is None else tamano_pool
+    n = min(tamano_pool, cantidad) if tamano_pool else cantidad
+    nombres = (NOMBRES_DE_PILA[rng.integers(0, len(NOMBRES_DE_PILA), size=n)] + " " +
+               APELLIDOS[rng.integers(0, len(APELLIDOS), size=n)] + " " +
+               APELLIDOS[rng.integers(0, len(APELLIDOS), size=n)])
+    if not tamano_pool:
+        return pd.Series(nombres, dtype=object)
+    # Reutilizar el pool: cada fila es solo un código entero que apunta a un nombre del pool
+    pool = np.unique(nombres)
+    return pd.Series(pd.Categorical.from_codes(rng.integers(0, len(pool), size=cantidad), categories=pool))
+
+# --- Generadores derivados de la semilla ---
+# Cada secuencia independiente (nombres, visitas, shards...) sale de SeedSequence([RANDOM_SEED, espacio, claves...]).
+# Los generadores derivados y los shards tienen su propio espacio: sin él, el shard k usaría la misma secuencia que
+# _rng_derivado(k). Los espacios no son 0 porque SeedSequence no distingue [s, k] de [s, k, 0].
+ESPACIO_DERIVADOS = 1
+ESPACIO_SHARDS = 2
+CLAVES_RNG = {"profesionales": 0, "pacientes": 1, "visitas": 2, "stream": 3} # Claves de _rng_derivado (stream.py usa "stream")
+
+def _rng_derivado(*claves):
+    """Devuelve un generador de NumPy independiente, derivado de RANDOM_SEED y de las claves indicadas."""
+    return np.random.default_rng(np.random.SeedSequence([RANDOM_SEED, ESPACIO_DERIVADOS, *claves]))
+
+def pyarrow_disponible():
+    """Indica si está instalado pyarrow (necesario para los formatos parquet y arrow)."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+def tipar(df, tabla):
+    """Convierte las columnas de un DataFrame a los tipos de la tabla en tipos.py. Los textos que ya son category
+    (los nombres del pool de generar_nombres) se dejan así: pasarlos a string volvería a crear un texto por fila."""
+    dtypes = {col: dtype for col, dtype in tipos.dtypes_tabla(tabla, df.columns).items()
+              if not (dtype == "string" and isinstance(df[col].dtype, pd.CategoricalDtype))}
+    return df.astype(dtypes)
+
+def borrar_anterior(ruta):
+    """Borra un archivo de salida antes de reescribirlo: puede ser un enlace duro a la caché de conjuntos de
+    datos (cache_datasets.py), que se corrompería si se sobrescribiera en el lugar."""
+    if os.path.exists(ruta):
+        os.remove(ruta)
+
+def borrar_otros_formatos(tablas, data_dir=None):
+    """Borra los archivos de las tablas en los formatos que no se pidieron: si quedara, por ejemplo, un .arrow de una
+    generación anterior junto al CSV nuevo, crea_db.py y cohortes.py leerían el .arrow (lo prefieren al CSV)."""
+    for tabla in tablas:
+        for formato, extension in EXTENSIONES.items():
+            if formato not in FORMATOS:
+                borrar_anterior(os.path.join(data_dir or DATA_DIR, tabla + extension))
+
+def guardar_tabla(df, tabla, ruta_base=None, formatos=None):
+    """Guarda una tabla en cada formato de salida. ruta_base es la ruta sin extensión (por defecto DATA_DIR/<tabla>)."""
+    ruta_base = ruta_base or os.path.join(DATA_DIR, tabla)
+    for formato in formatos or FORMATOS:
+        ruta = ruta_base + EXTENSIONES[formato]
+        borrar_anterior(ruta)
+        if formato == "csv":
+            df.to_csv(ruta, index=False, sep=';')
+            continue
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        tabla_arrow = pa.Table.from_pandas(tipar(df, tabla), preserve_index=False)
+        # Los nombres del pool (category) se guardan como texto: así los archivos son iguales con y sin pool y los
+        # part-files de los shards (cada uno con su propio diccionario) se pueden fusionar
+        for indice, campo in enumerate(tabla_arrow.schema):
+            if pa.types.is_dictionary(campo.type):
+                tabla_arrow = tabla_arrow.set_column(indice, campo.name, tabla_arrow[campo.name].cast(campo.type.value_type))
+        for columna in COLUMNAS_FECHA & set(tabla_arrow.column_names):
+            indice = tabla_arrow.column_names.index(columna)
+            tabla_arrow = tabla_arrow.set_column(indice, columna, tabla_arrow[columna].cast(pa.date32()))
+        if formato == "parquet":
+            pq.write_table(tabla_arrow, ruta)
+        else:
+            with pa.ipc.new_file(ruta, tabla_arrow.schema) as destino:
+                destino.write_table(tabla_arrow)
 
 # --- Generación de Profesionales.csv ---
 def generate_profesionales_csv(num_profesionales=17):
-    profesionales = []
-    for i in range(num_profesionales):
-        profesionales.append({
-            "profesionales_id": i + 1,
-            "name": fake.name()
-        })
-    df_profesionales = pd.DataFrame(profesionales)
-    df_profesionales.to_csv("../data/Profesionales.csv", index=False, sep=';')
+    # Los profesionales son pocos: sin pool, para que no se repitan nombres
+    df_profesionales = tipar(pd.DataFrame({
+        "profesionales_id": np.arange(1, num_profesionales + 1),
+        "name": generar_nombres(_rng_derivado(CLAVES_RNG["profesionales"]), num_profesionales, tamano_pool=0)
+    }), "Profesionales")
+    guardar_tabla(df_profesionales, "Profesionales")
     print(f"Profesionales.csv generado con {num_profesionales} registros.")
     return df_profesionales
 
@@ -38,8 +152,8 @@ def generate_diagnosticos_csv():
             "diagnostico_id": i + 1,
             "name": name
         })
-    df_diagnosticos = pd.DataFrame(diagnosticos)
-    df_diagnosticos.to_csv("../data/Diagnosticos.csv", index=False, sep=';')
+    df_diagnosticos = tipar(pd.DataFrame(diagnosticos), "Diagnosticos")
+    guardar_tabla(df_diagnosticos, "Diagnosticos")
     print(f"Diagnosticos.csv generado con {len(diagnosticos_names)} registros.")
     return df_diagnosticos
 
@@ -80,21 +194,18 @@ def generate_medicacion_csv():
             )
         })
     
-    df_medicacion = pd.DataFrame(medicaciones)
-    df_medicacion.to_csv("../data/Medicacion.csv", index=False, sep=';')
+    df_medicacion = tipar(pd.DataFrame(medicaciones), "Medicacion")
+    guardar_tabla(df_medicacion, "Medicacion")
     print(f"Medicacion.csv generado con {len(all_medicaciones)} registros.")
     return df_medicacion, antipsicoticos # Devolvemos también la lista de antipsicóticos
 
 # --- Generación de Pacientes.csv (nueva tabla) ---
 def generate_pacientes_csv(num_pacientes=854):
-    pacientes = []
-    for i in range(1, num_pacientes + 1):
-        pacientes.append({
-            "paciente_id": i,
-            "name": fake.name()
-        })
-    df_pacientes = pd.DataFrame(pacientes)
-    df_pacientes.to_csv("../data/Pacientes.csv", index=False, sep=';')
+    df_pacientes = tipar(pd.DataFrame({
+        "paciente_id": np.arange(1, num_pacientes + 1),
+        "name": generar_nombres(_rng_derivado(CLAVES_RNG["pacientes"]), num_pacientes)
+    }), "Pacientes")
+    guardar_tabla(df_pacientes, "Pacientes")
     print(f"Pacientes.csv generado con {num_pacientes} registros.")
     return df_pacientes
 
@@ -185,11 +296,112 @@ def generate_tratamientos_csv(df_profesionales, df_medicacion, df_diagnosticos,
             })
             paciente_counter += 1
             
-    df_tratamientos = pd.DataFrame(tratamientos_data)
-    df_tratamientos.to_csv("../data/Tratamientos.csv", index=False, sep=';')
+    df_tratamientos = tipar(pd.DataFrame(tratamientos_data), "Tratamientos")
+    guardar_tabla(df_tratamientos, "Tratamientos")
     print(f"Tratamientos.csv generado con {len(df_tratamientos)} registros.")
     return df_tratamientos
 
+# --- Motor vectorizado (NumPy) para Tratamientos.csv ---
+# El bucle por paciente de generate_tratamientos_csv no escala a cohortes de millones de pacientes.
+# Este motor aplica las mismas reglas estadísticas pero trabajando con arrays por lotes.
+# Las funciones por lote (asignar_diagnosticos, seleccionar_pro_antipsicoticos, tratamientos_lote,
+# antipsicoticos_por_paciente, metabolico_lote y visitas_lote) son públicas: stream.py depende de ellas
+# para generar las llegadas continuas con las mismas reglas.
+MOTORES = ("bucle", "vectorizado")
+MOTOR = "bucle" # Usar "vectorizado" (--motor vectorizado) para generar cohortes grandes (1M-10M pacientes)
+TAMANO_LOTE = 250_000 # Pacientes por lote: acota la memoria usada por la matriz de muestreo
+
+def asignar_diagnosticos(rng, num_pacientes, diagnostico_name_to_id):
+    """Devuelve un array mezclado de diagnósticos con el reparto 34% / 27% / resto equitativo."""
+    num_esquizofrenia = int(num_pacientes * 0.34)
+    num_trastorno_bipolar = int(num_pacientes * 0.27)
+    remaining_diagnoses_count = num_pacientes - num_esquizofrenia - num_trastorno_bipolar
+    num_tag = remaining_diagnoses_count // 3
+    num_tlp = remaining_diagnoses_count // 3
+    num_depresion = remaining_diagnoses_count - num_tag - num_tlp
+
+    ids = np.array([
+        diagnostico_name_to_id["Esquizofrenia"],
+        diagnostico_name_to_id["Trastorno Bipolar"],
+        diagnostico_name_to_id["TAG"],
+        diagnostico_name_to_id["TLP"],
+        diagnostico_name_to_id["Depresion"]
+    ], dtype=np.int32)
+    cantidades = [num_esquizofrenia, num_trastorno_bipolar, num_tag, num_tlp, num_depresion]
+    return rng.permutation(np.repeat(ids, cantidades))
+
+def seleccionar_pro_antipsicoticos(rng, num_profesionales):
+    """Devuelve una máscara booleana con los profesionales "favorables" a antipsicóticos (aprox. 18%)."""
+    num_antips_prone_prof = max(1, int(num_profesionales * 0.18))
+    es_pro_antips = np.zeros(num_profesionales, dtype=bool)
+    es_pro_antips[rng.choice(num_profesionales, num_antips_prone_prof, replace=False)] = True
+    return es_pro_antips
+
+def tratamientos_lote(rng, paciente_ids, diagnosticos, profesionales_ids, medicacion_ids,
+                       es_antipsicotico, es_pro_antips, esquizofrenia_id):
+    """Genera las filas (paciente, medicación) de un lote de pacientes sin construir diccionarios por fila."""
+    num_pacientes_lote = len(paciente_ids)
+    num_medicaciones = len(medicacion_ids)
+    columnas_antipsicoticos = np.flatnonzero(es_antipsicotico)
+
+    # Asignar un profesional a cada paciente (índice dentro de profesionales_ids)
+    idx_profesional = rng.integers(0, len(profesionales_ids), size=num_pacientes_lote)
+
+    # Número de medicaciones: int(N(3, 1.5)) acotado a [1, num_medicaciones], igual que el bucle original
+    num_meds = np.clip(rng.normal(3, 1.5, size=num_pacientes_lote).astype(np.int64), 1, num_medicaciones)
+
+    # Muestreo sin reemplazo por fila: claves aleatorias y se marcan las num_meds más pequeñas
+    claves = rng.random((num_pacientes_lote, num_medicaciones))
+    umbral = np.sort(claves, axis=1)[np.arange(num_pacientes_lote), num_meds - 1]
+    recetadas = claves <= umbral[:, None]
+
+    # Profesionales pro-antipsicóticos: 70% de chance de añadir uno si el paciente no tiene ninguno
+    tiene_antipsicotico = recetadas[:, columnas_antipsicoticos].any(axis=1)
+    anadir = es_pro_antips[idx_profesional] & ~tiene_antipsicotico & (rng.random(num_pacientes_lote) < 0.7)
+    filas = np.flatnonzero(anadir)
+    recetadas[filas, rng.choice(columnas_antipsicoticos, size=len(filas))] = True
+    tiene_antipsicotico |= anadir
+
+    # Garantizar al menos un antipsicótico a los pacientes con Esquizofrenia
+    filas = np.flatnonzero((diagnosticos == esquizofrenia_id) & ~tiene_antipsicotico)
+    recetadas[filas, rng.choice(columnas_antipsicoticos, size=len(filas))] = True
+
+    # "Explotar" la matriz en pares (paciente, medicación)
+    fila, columna = np.nonzero(recetadas)
+    return tipar(pd.DataFrame({
+        "paciente_id": paciente_ids[fila],
+        "medicacion_id": medicacion_ids[columna],
+        "profesionales_id": profesionales_ids[idx_profesional[fila]],
+        "diagnostico_id": diagnosticos[fila]
+    }), "Tratamientos")
+
+def generate_tratamientos_vectorizado(df_profesionales, df_medicacion, df_diagnosticos, antipsicoticos_list,
+                                      num_pacientes=854, seed=None, tamano_lote=TAMANO_LOTE):
+    """Versión vectorizada de generate_tratamientos_csv pensada para cohortes de millones de pacientes."""
+    rng = np.random.default_rng(RANDOM_SEED if seed is None else seed)
+
+    profesionales_ids = df_profesionales['profesionales_id'].to_numpy(dtype=np.int32)
+    medicacion_ids = df_medicacion['medicacion_id'].to_numpy(dtype=np.int32)
+    es_antipsicotico = df_medicacion['Droga'].isin(antipsicoticos_list).to_numpy()
+    diagnostico_name_to_id = df_diagnosticos.set_index('name')['diagnostico_id'].to_dict()
+
+    diagnosticos = asignar_diagnosticos(rng, num_pacientes, diagnostico_name_to_id)
+    es_pro_antips = seleccionar_pro_antipsicoticos(rng, len(profesionales_ids))
+
+    lotes = []
+    for inicio in range(0, num_pacientes, tamano_lote):
+        fin = min(inicio + tamano_lote, num_pacientes)
+        paciente_ids = np.arange(inicio + 1, fin + 1, dtype=np.int32)
+        lotes.append(tratamientos_lote(
+            rng, paciente_ids, diagnosticos[inicio:fin], profesionales_ids, medicacion_ids,
+            es_antipsicotico, es_pro_antips, diagnostico_name_to_id["Esquizofrenia"]
+        ))
+
+    df_tratamientos = pd.concat(lotes, ignore_index=True)
+    guardar_tabla(df_tratamientos, "Tratamientos")
+    print(f"Tratamientos.csv generado (motor vectorizado) con {len(df_tratamientos)} registros.")
+    return df_tratamientos
+
 # --- Generación de Metabolico.csv ---
 def generate_metabolico_csv(df_tratamientos, df_medicacion, antipsicoticos_list):
     metabolico_data = []
@@ -226,30 +438,316 @@ def generate_metabolico_csv(df_tratamientos, df_medicacion, antipsicoticos_list)
             "imc": imc
         })
         
-    df_metabolico = pd.DataFrame(metabolico_data)
-    df_metabolico.to_csv("../data/Metabolico.csv", index=False, sep=';')
+    df_metabolico = tipar(pd.DataFrame(metabolico_data), "Metabolico")
+    guardar_tabla(df_metabolico, "Metabolico")
     print(f"Metabolico.csv generado con {len(df_metabolico)} registros.")
     return df_metabolico
 
-# --- Ejecución de la generación de CSVs ---
-if __name__ == "__main__":
+# --- Generación de Visitas.csv (seguimiento metabólico longitudinal) ---
+# Mediciones de peso e IMC fechadas a lo largo del seguimiento, en meses distintos para cada paciente.
+# La última visita coincide con la fila del paciente en Metabolico; hacia atrás el peso baja según la
+# tendencia mensual del paciente, que crece con la cantidad de antipsicóticos que toma.
+FECHA_INICIO_VISITAS = "2024-01" # Primer mes del seguimiento (visitas está particionada por mes desde 2024-01 en esquema.py)
+MESES_SEGUIMIENTO = 24
+VISITAS_POR_PACIENTE = (3, 12) # Mínimo y máximo de visitas por paciente
+AUMENTO_MENSUAL_ANTIPSICOTICO = (0.6, 0.25) # Aumento de peso (kg/mes) por antipsicótico: media y desvío
+VARIACION_MENSUAL_BASE = 0.15 # Desvío (kg/mes) de la tendencia de peso independiente de la medicación
+RUIDO_PESO = 0.8 # Desvío (kg) de cada medición respecto de la tendencia
+
+def visitas_lote(rng, paciente_ids, num_antipsicoticos, peso_final, imc_final):
+    """Genera las visitas de un lote de pacientes a partir de su peso e IMC en Metabolico y su cantidad de antipsicóticos."""
+    n = len(paciente_ids)
+    # Metabolico guarda peso e IMC en float32: se vuelven a redondear en float64 (85.2 y no 85.19999694824219)
+    peso_final = np.asarray(peso_final, dtype=np.float64).round(1)
+    imc_final = np.asarray(imc_final, dtype=np.float64).round(1)
+    # Meses con visita: muestreo sin reemplazo por fila, igual que las medicaciones de tratamientos_lote
+    num_visitas = rng.integers(VISITAS_POR_PACIENTE[0], VISITAS_POR_PACIENTE[1] + 1, size=n)
+    claves = rng.random((n, MESES_SEGUIMIENTO))
+    umbral = np.sort(claves, axis=1)[np.arange(n), num_visitas - 1]
+    fila, mes = np.nonzero(claves <= umbral[:, None])
+
+    # np.nonzero devuelve los meses de cada paciente ordenados: su última visita es la última posición del paciente
+    ultima = np.cumsum(np.bincount(fila, minlength=n)) - 1
+    meses_antes = mes[ultima][fila] - mes
+
+    tendencia = num_antipsicoticos * rng.normal(*AUMENTO_MENSUAL_ANTIPSICOTICO, size=n) + rng.normal(0, VARIACION_MENSUAL_BASE, size=n)
+    ruido = rng.normal(0, RUIDO_PESO, size=len(fila))
+    ruido[ultima] = 0 # La última visita es exactamente la medición de Metabolico
+    peso = np.maximum(peso_final[fila] - tendencia[fila] * meses_antes + ruido, 35).round(1)
+    # La talla de cada paciente sale de su peso e IMC en Metabolico (IMC = peso / talla²)
+    talla_cuadrado = peso_final / imc_final
+    imc = (peso / talla_cuadrado[fila]).round(1)
+
+    dia = rng.integers(0, 28, size=len(fila))
+    fecha = (np.datetime64(FECHA_INICIO_VISITAS, "M") + mes).astype("datetime64[D]") + dia
+    return tipar(pd.DataFrame({"paciente_id": paciente_ids[fila], "fecha": fecha, "peso": peso, "imc": imc}), "Visitas")
+
+def antipsicoticos_por_paciente(df_tratamientos, ids_antipsicoticos, paciente_ids, primer_id=0):
+    """Devuelve cuántos antipsicóticos toma cada paciente de paciente_ids (ids consecutivos desde primer_id)."""
+    es_antipsicotico_fila = np.isin(df_tratamientos["medicacion_id"].to_numpy(), ids_antipsicoticos)
+    conteo = np.bincount(df_tratamientos["paciente_id"].to_numpy() - primer_id, weights=es_antipsicotico_fila,
+                         minlength=int(paciente_ids.max()) - primer_id + 1)
+    return conteo[paciente_ids - primer_id]
+
+def generate_visitas_csv(df_tratamientos, df_metabolico, df_medicacion, antipsicoticos_list, tamano_lote=TAMANO_LOTE):
+    """Genera Visitas.csv con el seguimiento de peso e IMC de los pacientes de Metabolico, por lotes de pacientes."""
+    rng = _rng_derivado(CLAVES_RNG["visitas"])
+    ids_antipsicoticos = df_medicacion[df_medicacion['Droga'].isin(antipsicoticos_list)]['medicacion_id'].to_numpy()
+    paciente_ids = df_metabolico['paciente_id'].to_numpy(dtype=np.int64)
+    num_antipsicoticos = antipsicoticos_por_paciente(df_tratamientos, ids_antipsicoticos, paciente_ids)
+    peso = df_metabolico['peso'].to_numpy()
+    imc = df_metabolico['imc'].to_numpy()
+
+    lotes = []
+    for inicio in range(0, len(paciente_ids), tamano_lote):
+        fin = inicio + tamano_lote
+        lotes.append(visitas_lote(rng, paciente_ids[inicio:fin], num_antipsicoticos[inicio:fin], peso[inicio:fin], imc[inicio:fin]))
+
+    df_visitas = pd.concat(lotes, ignore_index=True)
+    guardar_tabla(df_visitas, "Visitas")
+    print(f"Visitas.csv generado con {len(df_visitas)} registros.")
+    return df_visitas
+
+# --- Generación paralela por shards (Pacientes, Tratamientos, Metabolico) ---
+# El espacio de paciente_id se divide en shards de tamaño fijo. Cada shard usa una semilla derivada de
+# RANDOM_SEED y de su índice, por lo que la salida es idéntica con cualquier número de workers.
+TAMANO_SHARD = 100_000 # Pacientes por shard (no depende del número de workers)
+SHARDS_DIR = "shards" # Subcarpeta de DATA_DIR donde se escriben los part-files
+TABLAS_SHARD = ["Pacientes", "Tratamientos", "Metabolico", "Visitas"]
+
+def _semilla_shard(indice_shard):
+    """Devuelve la SeedSequence del shard, derivada de RANDOM_SEED y del índice del shard."""
+    return np.random.SeedSequence([RANDOM_SEED, ESPACIO_SHARDS, indice_shard])
+
+def metabolico_lote(rng, paciente_ids, toma_antipsicotico):
+    """Genera edad, peso e IMC de un lote de pacientes con las mismas reglas que generate_metabolico_csv."""
+    n = len(paciente_ids)
+    edad = rng.integers(20, 66, size=n)
+    # Rango de peso e IMC más alto si toma antipsicóticos
+    peso = np.where(toma_antipsicotico, rng.uniform(70, 110, size=n), rng.uniform(55, 85, size=n)).round(1)
+    imc = np.where(toma_antipsicotico, rng.uniform(25, 35, size=n), rng.uniform(18, 28, size=n)).round(1)
+    return tipar(pd.DataFrame({"paciente_id": paciente_ids, "edad": edad, "peso": peso, "imc": imc}), "Metabolico")
+
+def _generar_shard(tarea):
+    """Genera los part-files de un shard. Se ejecuta en un proceso del pool."""
+    # La semilla se pasa en la tarea: con el método "spawn" (Windows) el proceso no hereda RANDOM_SEED
+    fijar_semilla(tarea["semilla"])
+    indice = tarea["indice"]
+    inicio, fin = tarea["inicio"], tarea["fin"]
+    semilla = _semilla_shard(indice)
+    rng = np.random.default_rng(semilla)
+
+    paciente_ids = np.arange(inicio + 1, fin + 1, dtype=np.int32)
+    df_pacientes = tipar(pd.DataFrame({
+        "paciente_id": paciente_ids,
+        # Generador propio para los nombres: no altera la secuencia de rng del resto del shard
+        "name": generar_nombres(_rng_derivado(CLAVES_RNG["pacientes"], indice), len(paciente_ids), tarea["tamano_pool_nombres"])
+    }), "Pacientes")
+
+    diagnosticos = asignar_diagnosticos(rng, len(paciente_ids), tarea["diagnostico_name_to_id"])
+    df_tratamientos = tratamientos_lote(
+        rng, paciente_ids, diagnosticos, tarea["profesionales_ids"], tarea["medicacion_ids"],
+        tarea["es_antipsicotico"], tarea["es_pro_antips"], tarea["diagnostico_name_to_id"]["Esquizofrenia"]
+    )
+
+    # Saber cuántos antipsicóticos toma cada paciente del shard, sin agrupar por paciente en Python
+    num_antipsicoticos = antipsicoticos_por_paciente(df_tratamientos, tarea["medicacion_ids"][tarea["es_antipsicotico"]],
+                                                      paciente_ids, primer_id=inicio + 1)
+    df_metabolico = metabolico_lote(rng, paciente_ids, num_antipsicoticos > 0)
+    df_visitas = visitas_lote(rng, paciente_ids, num_antipsicoticos, df_metabolico["peso"].to_numpy(), df_metabolico["imc"].to_numpy())
+
+    filas = {}
+    for tabla, df in zip(TABLAS_SHARD, [df_pacientes, df_tratamientos, df_metabolico, df_visitas]):
+        # Los formatos se pasan en la tarea: con el método "spawn" (Windows) el proceso no hereda FORMATOS
+        guardar_tabla(df, tabla, os.path.join(tarea["shards_dir"], tabla, f"part-{indice:05d}"), tarea["formatos"])
+        filas[tabla] = len(df)
+    return filas
+
+def _fusionar_part_files(shards_dir, tabla, num_shards, formato="csv"):
+    """Concatena los part-files de una tabla en DATA_DIR/<tabla>.<ext> (los CSV conservan una sola cabecera)."""
+    extension = EXTENSIONES[formato]
+    rutas = [os.path.join(shards_dir, tabla, f"part-{indice:05d}{extension}") for indice in range(num_shards)]
+    destino_ruta = os.path.join(DATA_DIR, f"{tabla}{extension}")
+    borrar_anterior(destino_ruta)
+
+    if formato == "csv":
+        with open(destino_ruta, "wb") as destino:
+            for indice, ruta in enumerate(rutas):
+                with open(ruta, "rb") as origen:
+                    if indice > 0:
+                        origen.readline() # Saltar la cabecera repetida
+                    shutil.copyfileobj(origen, destino)
+        return
+
+    # Parquet y Arrow: cada part-file se agrega como un bloque más (row group / record batch), sin convertir los datos
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if formato == "parquet":
+        esquema_arrow = pq.read_schema(rutas[0])
+        with pq.ParquetWriter(destino_ruta, esquema_arrow) as destino:
+            for ruta in rutas:
+                destino.write_table(pq.read_table(ruta))
+    else:
+        esquema_arrow = pa.ipc.open_file(rutas[0]).schema
+        with pa.ipc.new_file(destino_ruta, esquema_arrow) as destino:
+            for ruta in rutas:
+                destino.write_table(pa.ipc.open_file(pa.memory_map(ruta, "r")).read_all())
+
+def generate_shards_paralelo(df_profesionales, df_medicacion, df_diagnosticos, antipsicoticos_list,
+                             num_pacientes=854, workers=None, tamano_shard=TAMANO_SHARD, fusionar=True):
+    """Genera Pacientes, Tratamientos, Metabolico y Visitas repartiendo los shards en un pool de procesos."""
+    shards_dir = os.path.join(DATA_DIR, SHARDS_DIR)
+    for tabla in TABLAS_SHARD:
+        os.makedirs(os.path.join(shards_dir, tabla), exist_ok=True)
+
+    # Los profesionales pro-antipsicóticos son globales: se eligen una sola vez con la semilla base
+    profesionales_ids = df_profesionales['profesionales_id'].to_numpy(dtype=np.int32)
+    es_pro_antips = seleccionar_pro_antipsicoticos(np.random.default_rng(RANDOM_SEED), len(profesionales_ids))
+
+    comunes = {
+        "shards_dir": shards_dir,
+        "semilla": RANDOM_SEED,
+        "formatos": list(FORMATOS),
+        "tamano_pool_nombres": TAMANO_POOL_NOMBRES,
+        "profesionales_ids": profesionales_ids,
+        "medicacion_ids": df_medicacion['medicacion_id'].to_numpy(dtype=np.int32),
+        "es_antipsicotico": df_medicacion['Droga'].isin(antipsicoticos_list).to_numpy(),
+        "es_pro_antips": es_pro_antips,
+        "diagnostico_name_to_id": df_diagnosticos.set_index('name')['diagnostico_id'].to_dict()
+    }
+    tareas = [
+        dict(comunes, indice=indice, inicio=inicio, fin=min(inicio + tamano_shard, num_pacientes))
+        for indice, inicio in enumerate(range(0, num_pacientes, tamano_shard))
+    ]
+
+    totales = dict.fromkeys(TABLAS_SHARD, 0)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for filas in pool.map(_generar_shard, tareas):
+            for tabla, n in filas.items():
+                totales[tabla] += n
+    print(f"{len(tareas)} shards generados en '{shards_dir}'.")
+
+    for tabla in TABLAS_SHARD:
+        if fusionar:
+            for formato in FORMATOS:
+                _fusionar_part_files(shards_dir, tabla, len(tareas), formato)
+                print(f"{tabla}{EXTENSIONES[formato]} generado (fusionando {len(tareas)} shards) con {totales[tabla]} registros.")
+        else:
+            print(f"{tabla}: {totales[tabla]} registros en {len(tareas)} part-files.")
+    return totales
+
+# --- Generación completa del conjunto de datos ---
+def configuracion(num_pacientes, num_profesionales, paralelo, tamano_shard, motor=MOTOR):
+    """Devuelve los parámetros que determinan el contenido de los archivos generados (clave de la caché)."""
+    return {
+        "num_pacientes": num_pacientes,
+        "num_profesionales": num_profesionales,
+        "semilla": RANDOM_SEED,
+        "formatos": sorted(FORMATOS),
+        "tamano_pool_nombres": TAMANO_POOL_NOMBRES,
+        # Cada motor (y cada tamaño de shard o de lote) recorre las secuencias aleatorias en otro orden
+        "motor": f"paralelo:{tamano_shard}" if paralelo else motor,
+        "tamano_lote": TAMANO_LOTE,
+        "versiones": {"numpy": np.__version__, "pandas": pd.__version__, "faker": faker.VERSION}
+    }
+
+def generar_todo(num_pacientes=NUM_PACIENTES, num_profesionales=NUM_PROFESIONALES, paralelo=False, workers=None,
+                 tamano_shard=TAMANO_SHARD, fusionar=True, usar_cache=True, motor=MOTOR):
+    """Genera todos los CSV en DATA_DIR y devuelve la cantidad de filas de cada tabla.
+    motor ("bucle" o "vectorizado") elige cómo se genera Tratamientos sin paralelo.
+    Con usar_cache=True, si el mismo conjunto ya se generó antes se restaura desde cache_datasets sin generarlo."""
     # Asegurarse de que la carpeta 'data' exista
-    if not os.path.exists("../data"):
-        os.makedirs("../data")
-        print("Carpeta '../data' creada.")
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR)
+        print(f"Carpeta '{DATA_DIR}' creada.")
+
+    # Sin fusionar, la salida son part-files de shards: no se guarda en la caché
+    usar_cache = usar_cache and fusionar
+    config = configuracion(num_pacientes, num_profesionales, paralelo, tamano_shard, motor)
+    if usar_cache:
+        inicio = time.perf_counter()
+        with metricas.etapa("crea_csv", "restauracion_cache") as registro:
+            filas = cache_datasets.restaurar(config, DATA_DIR)
+            registro["filas"] = sum(filas.values()) if filas else 0
+        if filas:
+            borrar_otros_formatos(filas)
+            print(f"Conjunto de datos restaurado desde la caché en {(time.perf_counter() - inicio) * 1000:.1f} ms "
+                  f"({registro['filas']} filas en '{DATA_DIR}', sin generar).")
+            return filas
+
+    # Cada generación parte de la semilla, aunque el proceso ya haya generado otro conjunto antes
+    fijar_semilla(RANDOM_SEED)
+
+    with metricas.etapa("crea_csv", "generacion") as registro_total:
+        with metricas.etapa("crea_csv", "dimensiones") as registro:
+            df_profesionales = generate_profesionales_csv(num_profesionales)
+            df_diagnosticos = generate_diagnosticos_csv()
+            df_medicacion, antipsicoticos_list = generate_medicacion_csv() # Obtenemos la lista de antipsicóticos
+            filas = {"Profesionales": len(df_profesionales), "Diagnosticos": len(df_diagnosticos), "Medicacion": len(df_medicacion)}
+            registro["filas"] = sum(filas.values())
+
+        if paralelo:
+            # Pacientes, Tratamientos, Metabolico y Visitas se generan por shards en un pool de procesos
+            with metricas.etapa("crea_csv", "shards") as registro:
+                totales = generate_shards_paralelo(df_profesionales, df_medicacion, df_diagnosticos, antipsicoticos_list,
+                                                   num_pacientes=num_pacientes, workers=workers,
+                                                   tamano_shard=tamano_shard, fusionar=fusionar)
+                registro["filas"] = sum(totales.values())
+            filas.update(totales)
+        else:
+            # Generamos la nueva tabla Pacientes.csv
+            with metricas.etapa("crea_csv", "Pacientes") as registro:
+                df_pacientes = generate_pacientes_csv(num_pacientes)
+                registro["filas"] = filas["Pacientes"] = len(df_pacientes)
+
+            # Generamos Tratamientos.csv (antes Pacientes.csv) usando la lista de antipsicóticos
+            # Nota: Pasamos df_pacientes para obtener el número correcto de pacientes para la generación de Tratamientos
+            with metricas.etapa("crea_csv", "Tratamientos") as registro:
+                if motor == "vectorizado":
+                    df_tratamientos = generate_tratamientos_vectorizado(df_profesionales, df_medicacion, df_diagnosticos, antipsicoticos_list, num_pacientes=len(df_pacientes))
+                else:
+                    df_tratamientos = generate_tratamientos_csv(df_profesionales, df_medicacion, df_diagnosticos, antipsicoticos_list, num_pacientes=len(df_pacientes))
+                registro["filas"] = filas["Tratamientos"] = len(df_tratamientos)
+
+            # Generamos Metabolico.csv usando la lista de antipsicóticos para la lógica de peso
+            with metricas.etapa("crea_csv", "Metabolico") as registro:
+                df_metabolico = generate_metabolico_csv(df_tratamientos, df_medicacion, antipsicoticos_list)
+                registro["filas"] = filas["Metabolico"] = len(df_metabolico)
 
-    df_profesionales = generate_profesionales_csv()
-    df_diagnosticos = generate_diagnosticos_csv()
-    df_medicacion, antipsicoticos_list = generate_medicacion_csv() # Obtenemos la lista de antipsicóticos
+            # Generamos Visitas.csv con el seguimiento de peso e IMC de cada paciente
+            with metricas.etapa("crea_csv", "Visitas") as registro:
+                df_visitas = generate_visitas_csv(df_tratamientos, df_metabolico, df_medicacion, antipsicoticos_list)
+                registro["filas"] = filas["Visitas"] = len(df_visitas)
+        registro_total["filas"] = sum(filas.values())
+    borrar_otros_formatos(filas)
 
-    # Generamos la nueva tabla Pacientes.csv
-    df_pacientes = generate_pacientes_csv()
+    print(f"\nTodos los archivos ({', '.join(FORMATOS)}) han sido generados exitosamente en la carpeta '{DATA_DIR}'.")
+    if usar_cache:
+        cache_datasets.guardar(config, DATA_DIR, [f"{tabla}{EXTENSIONES[formato]}" for tabla in filas for formato in FORMATOS], filas)
+    return filas
 
-    # Generamos Tratamientos.csv (antes Pacientes.csv) usando la lista de antipsicóticos
-    # Nota: Pasamos df_pacientes para obtener el número correcto de pacientes para la generación de Tratamientos
-    df_tratamientos = generate_tratamientos_csv(df_profesionales, df_medicacion, df_diagnosticos, antipsicoticos_list, num_pacientes=len(df_pacientes))
+# --- Ejecución de la generación de CSVs ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera los archivos CSV con datos ficticios.")
+    parser.add_argument("--motor", choices=MOTORES, default=MOTOR, help="Motor de generación de Tratamientos (sin --paralelo): vectorizado para cohortes grandes")
+    parser.add_argument("--paralelo", action="store_true", help="Genera Pacientes, Tratamientos, Metabolico y Visitas por shards en varios procesos")
+    parser.add_argument("--workers", type=int, default=None, help="Número de procesos (por defecto, uno por núcleo)")
+    parser.add_argument("--tamano-shard", type=int, default=TAMANO_SHARD, help="Pacientes por shard")
+    parser.add_argument("--sin-fusionar", action="store_true", help="Deja los part-files sin fusionar en un único CSV por tabla")
+    parser.add_argument("--formato", choices=FORMATOS_SALIDA, nargs="+", default=FORMATOS, help="Formatos de salida (uno o varios)")
+    parser.add_argument("--pool-nombres", type=int, default=TAMANO_POOL_NOMBRES, help="Reutiliza un pool de N nombres de pacientes (0: un nombre por fila)")
+    parser.add_argument("--num-pacientes", type=int, default=NUM_PACIENTES, help="Cantidad de pacientes")
+    parser.add_argument("--num-profesionales", type=int, default=NUM_PROFESIONALES, help="Cantidad de profesionales")
+    parser.add_argument("--semilla", type=int, default=RANDOM_SEED, help="Semilla de los generadores aleatorios")
+    parser.add_argument("--sin-cache", action="store_true", help="Genera los datos aunque el mismo conjunto esté en la caché")
+    args = parser.parse_args()
 
-    # Generamos Metabolico.csv usando la lista de antipsicóticos para la lógica de peso
-    df_metabolico = generate_metabolico_csv(df_tratamientos, df_medicacion, antipsicoticos_list)
+    if set(args.formato) - {"csv"} and not pyarrow_disponible():
+        print("Error: Los formatos parquet y arrow requieren el paquete pyarrow (pip install pyarrow).")
+        exit(1)
+    FORMATOS = args.formato
+    TAMANO_POOL_NOMBRES = args.pool_nombres
+    fijar_semilla(args.semilla)
 
-    print("\nTodos los archivos CSV han sido generados exitosamente en la carpeta '../data/'.")
\ No newline at end of file
+    generar_todo(args.num_pacientes, args.num_profesionales, paralelo=args.paralelo, workers=args.workers, motor=args.motor,
+                 tamano_shard=args.tamano_shard, fusionar=not args.sin_fusionar, usar_cache=not args.sin_cache)
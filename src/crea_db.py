@@ -1,8 +1,20 @@
 import os
+import sys
 import pandas as pd
 import mysql.connector
+from mysql.connector import pooling
 import time
-import numpy as np
+import uuid
+import argparse
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import esquema
+import indices
+import rollups
+import backends
+import metricas
+import tipos
 
 # --- Configuración de la Base de Datos ---
 DB_HOST = "127.0.0.1"  # Usamos 127.0.0.1 (localhost) ya que Docker mapea el puerto
@@ -13,8 +25,66 @@ DB_NAME = "data_medical"      # Debe coincidir con MYSQL_DATABASE en docker-comp
 
 # --- Configuración de la Carpeta de CSVs ---
 CSV_FOLDER = "../data" # Ruta a tu carpeta con los archivos .csv
+CSV_SEPARADOR = ";"
+CSV_ENCODING = "utf-8" # El encoding con el que crea_csv.py (Pandas) escribe los CSV
+
+# --- Formatos de entrada ---
+# Además de CSV, se leen las tablas que crea_csv.py escribe en formato columnar (--formato parquet arrow).
+# Arrow IPC se abre con memory-map (sin parsear ni copiar los datos) y Parquet se decodifica por columnas
+# con sus tipos. Si una tabla está en varios formatos se usa el primero de la lista; con LOAD DATA se
+# prefiere el CSV, porque lo lee directamente el servidor. Los formatos columnares requieren pyarrow.
+# crea_csv.py borra los formatos que no se pidieron, así que los formatos de una tabla son siempre de la misma generación.
+EXTENSIONES_ENTRADA = (".arrow", ".parquet", ".csv")
+EXTENSIONES_ENTRADA_LOAD_DATA = (".csv", ".arrow", ".parquet")
+
+# --- Configuración de la Carga Masiva ---
+# Modos de carga disponibles:
+#   "load_data": LOAD DATA LOCAL INFILE envía el archivo directamente al servidor, sin pasar por Pandas.
+#                Si el servidor lo tiene deshabilitado (local_infile=OFF) se usan INSERT multi-fila por lotes.
+#   "lotes":     lee el CSV completo con Pandas y lo inserta con INSERT multi-fila por lotes.
+#   "streaming": lee el CSV por chunks con memoria acotada y confirma (commit) cada chunk por separado.
+#                Si la carga falla, la siguiente ejecución continúa desde el último chunk confirmado.
+MODOS_CARGA = ("load_data", "lotes", "streaming")
+MODO_CARGA = "load_data"
+TAMANO_LOTE_INSERT = 5000   # Filas por cada INSERT multi-fila del modo alternativo
+FILAS_MUESTRA_TIPOS = 10000 # Filas leídas para inferir los tipos de columna al crear la tabla
+CHARSET_MYSQL = {"latin1": "latin1", "utf-8": "utf8mb4"} # Encoding de Python -> CHARACTER SET de MySQL
+# Errores de MySQL que indican que LOAD DATA LOCAL no está permitido
+ERRNOS_LOAD_DATA_DESHABILITADO = (1148, 2068, 3948)
+
+# --- Configuración de la Carga por Streaming ---
+TAMANO_CHUNK = 50000 # Filas leídas y confirmadas por chunk
+TABLA_PROGRESO = "carga_progreso" # Guarda el último chunk confirmado de cada tabla para poder reanudar
+
+# --- Configuración de la Carga en Paralelo ---
+# Las tablas sin dependencias entre sí se cargan a la vez, cada una con su conexión del pool.
+# Las tablas hijas (según FOREIGN_KEYS) esperan a que terminen de cargarse sus tablas padre.
+WORKERS_CARGA = 4
+
+# --- Configuración de la Carga Incremental ---
+# Se guarda el hash del contenido y las filas de cada CSV cargado. En las siguientes ejecuciones las tablas
+# cuyo CSV no cambió se saltan, y en las que cambió solo se aplica la diferencia por clave primaria
+# (upsert de filas nuevas o modificadas y borrado de las que ya no están en el CSV).
+TABLA_METADATOS = "carga_metadatos"
+PREFIJO_STAGING = "stg_" # Tablas temporales donde se carga el CSV nuevo para calcular la diferencia
+
+# --- Configuración de la Versión de Carga ---
+# Cada carga terminada guarda un sello de versión nuevo en TABLA_VERSION (una sola fila). api.py lo compara
+# con el de sus respuestas en caché para descartarlas en cuanto los datos cambian.
+TABLA_VERSION = "carga_version"
+
+# --- Configuración de la Validación de Integridad Referencial ---
+# Antes de cargar se comprueba cada relación de FOREIGN_KEYS sobre los archivos de datos (isin() vectorizado
+# por chunks, leyendo solo las columnas de las claves). Las tablas declaradas en esquema.py se crean con sus
+# FKs ya definidas y, si la validación pasó, se cargan con FOREIGN_KEY_CHECKS=0: MySQL no verifica ninguna fila.
+# Las tablas con PK diferida (tablas de hechos) reciben sus FKs después de sus índices, también con
+# FOREIGN_KEY_CHECKS=0: así el ALTER TABLE es in-place y no recorre ni reconstruye la tabla, y la carga no
+# mantiene los índices que InnoDB crearía para las FKs. Si hay filas huérfanas no se carga nada.
+MUESTRA_HUERFANAS = 10 # Valores huérfanos distintos que se muestran por relación
 
 # --- Definición de Claves Primarias y Foráneas ---
+# Las tablas declaradas en esquema.py ya se crean con su clave primaria; PRIMARY_KEYS solo se aplica
+# (con ALTER TABLE) a las tablas creadas a partir de los tipos inferidos del DataFrame.
 # Define claves primarias.
 # Formato: { "nombre_tabla": "nombre_columna_pk" }
 PRIMARY_KEYS = {
@@ -35,11 +105,11 @@ FOREIGN_KEYS = [
     {"from_table": "tratamientos", "from_column": "profesionales_id", "to_table": "profesionales", "to_column": "profesionales_id"},
     {"from_table": "tratamientos", "from_column": "diagnostico_id", "to_table": "diagnosticos", "to_column": "diagnostico_id"},
     {"from_table": "tratamientos", "from_column": "paciente_id", "to_table": "pacientes", "to_column": "paciente_id"}
-
+    # visitas no tiene FK a pacientes: está particionada por mes y InnoDB no admite FKs en tablas particionadas
 ]
 
 # --- Funciones para manejar la base de datos ---
-def get_db_connection():
+def get_db_connection(allow_local_infile=False):
     """Establece y devuelve una conexión a la base de datos MySQL"""
     try:
         conn = mysql.connector.connect(
@@ -47,16 +117,46 @@ def get_db_connection():
             port=DB_PORT,
             user=DB_USER,
             password=DB_PASSWORD,
-            database=DB_NAME
+            database=DB_NAME,
+            allow_local_infile=allow_local_infile
         )
         print(f"Conexión a la base de datos MySQL establecida exitosamente.")
-        return conn
+        return metricas.ConexionInstrumentada(conn) # Cuenta round-trips y commits
     except mysql.connector.Error as err:
         print(f"Error al conectar a la base de datos MySQL.")
         if "Unknown database" in str(err):
             print(f"La base de datos '{DB_NAME}' podría no existir aún. Asegúrate de que el contenedor Docker esté completamente inicializado.")
         return None
 
+def workers_para_pool(workers):
+    """Limita los workers de carga a las conexiones que admite un pool de mysql.connector (una queda para la
+    conexión principal): con más workers, los hilos sobrantes no conseguirían conexión."""
+    maximo = pooling.CNX_POOL_MAXSIZE - 1
+    if workers > maximo:
+        print(f"Advertencia: {workers} workers superan las {pooling.CNX_POOL_MAXSIZE} conexiones del pool. Se usarán {maximo}.")
+    return max(1, min(workers, maximo))
+
+def get_db_pool(tamano, allow_local_infile=False):
+    """Crea y devuelve un pool de conexiones a la base de datos MySQL"""
+    try:
+        pool = pooling.MySQLConnectionPool(
+            pool_name="carga_medical",
+            pool_size=min(tamano, pooling.CNX_POOL_MAXSIZE),
+            host=DB_HOST,
+            port=DB_PORT,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            database=DB_NAME,
+            allow_local_infile=allow_local_infile
+        )
+        print(f"Pool de {pool.pool_size} conexiones a la base de datos MySQL establecido exitosamente.")
+        return metricas.PoolInstrumentado(pool) # Cuenta round-trips y commits
+    except mysql.connector.Error as err:
+        print("Error al conectar a la base de datos MySQL.")
+        if "Unknown database" in str(err):
+            print(f"La base de datos '{DB_NAME}' podría no existir aún. Asegúrate de que el contenedor Docker esté completamente inicializado.")
+        return None
+
 def create_table_from_dataframe(cursor, df, table_name):
     """Crea una tabla en MySQL a partir de la estructura de un DataFrame de Pandas."""
     columns_sql = []
@@ -91,50 +191,673 @@ def create_table_from_dataframe(cursor, df, table_name):
         print(f"Error al crear la tabla '{table_name}': {err}")
         return False
 
-def insert_data_into_table(conn, cursor, df, table_name):
-    """Inserta los datos de un DataFrame en la tabla especificada."""
+def limpiar_identificador(nombre):
+    """Limpia un nombre de tabla o columna para que sea válido en MySQL."""
+    return "".join(c for c in nombre if c.isalnum() or c == "_").lower()
+
+def nombre_fk(fk_info):
+    """Devuelve el nombre de la restricción de una FK de FOREIGN_KEYS (acortado con un hash si supera los 64 caracteres)."""
+    from_column = limpiar_identificador(fk_info["from_column"])
+    to_column = limpiar_identificador(fk_info["to_column"])
+    base_fk_name = f"fk_{fk_info['from_table']}_{from_column}_to_{fk_info['to_table']}_{to_column}"
+
+    # MySQL por defecto tiene un límite de 64 caracteres para identificadores.
+    # Puedes ajustar este número si sabes que tu DB tiene un límite diferente.
+    MAX_FK_NAME_LENGTH = 64
+    if len(base_fk_name) <= MAX_FK_NAME_LENGTH:
+        return base_fk_name
+    # Truncar y agregar un hash corto del nombre original para asegurar unicidad
+    hash_suffix = hashlib.md5(base_fk_name.encode()).hexdigest()[:3]
+    return f"fk_{fk_info['from_table']}_{from_column}_{hash_suffix}"[:MAX_FK_NAME_LENGTH]
+
+def clausula_fk(fk_info):
+    """Devuelve la cláusula CONSTRAINT ... FOREIGN KEY de una FK de FOREIGN_KEYS."""
+    # ON DELETE RESTRICT: Si intentas borrar una fila de la tabla padre que tiene filas hijas, la operación fallará.
+    # ON UPDATE CASCADE: Si se actualiza el valor de la clave primaria en la tabla padre, se actualiza automáticamente
+    #                     en la tabla hija.
+    return (f"CONSTRAINT `{nombre_fk(fk_info)}` FOREIGN KEY (`{limpiar_identificador(fk_info['from_column'])}`) "
+            f"REFERENCES `{fk_info['to_table']}`(`{limpiar_identificador(fk_info['to_column'])}`) "
+            f"ON DELETE RESTRICT ON UPDATE CASCADE")
+
+def create_table_from_schema(cursor, table_name):
+    """Crea una tabla en MySQL a partir de su definición en esquema.py (tipos compactos, PK y FKs incluidas).
+    Las tablas con PK diferida se crean sin FKs (las agrega add_foreign_keys después de crear sus índices)."""
+    restricciones = []
+    if not esquema.TABLAS[table_name].get("pk_diferida"):
+        restricciones = [clausula_fk(fk_info) for fk_info in FOREIGN_KEYS if fk_info["from_table"] == table_name]
+    create_table_query = esquema.create_table_sql(table_name, restricciones=restricciones)
+    print(f"Generando SQL para tabla {table_name}: {create_table_query}")
+    try:
+        cursor.execute(create_table_query)
+        print(f"Tabla '{table_name}' creada/verificada.")
+        return True
+    except mysql.connector.Error as err:
+        print(f"Error al crear la tabla '{table_name}': {err}")
+        return False
+
+def crear_tabla(cursor, table_name, df=None):
+    """Crea la tabla usando su esquema declarado o, si no está declarada, los tipos inferidos del DataFrame."""
+    if table_name in esquema.TABLAS:
+        return create_table_from_schema(cursor, table_name)
+    return create_table_from_dataframe(cursor, df, table_name)
+
+def insert_rows(cursor, df, table_name, tamano_lote=TAMANO_LOTE_INSERT):
+    """Ejecuta INSERT multi-fila por lotes con las filas de un DataFrame, sin confirmar la transacción."""
+    # Limpiar y asegurar los nombres de las columnas para la consulta INSERT
+    columns_str = ", ".join(f"`{limpiar_identificador(col)}`" for col in df.columns)
+    fila_placeholders = "(" + ", ".join(["%s"] * len(df.columns)) + ")"
+
+    for desde in range(0, len(df), tamano_lote):
+        lote = df.iloc[desde:desde + tamano_lote]
+        # Conversión vectorizada a tipos nativos de Python: astype(object) convierte los escalares
+        # de NumPy a int/float/str y where() reemplaza NaN/NA por None (NULL en MySQL)
+        lote_nativo = lote.astype(object).where(lote.notna(), None)
+        valores = [valor for fila in lote_nativo.itertuples(index=False, name=None) for valor in fila]
+        insert_query = f"INSERT INTO `{table_name}` ({columns_str}) VALUES {', '.join([fila_placeholders] * len(lote))}"
+        cursor.execute(insert_query, valores)
+
+def insert_data_into_table(conn, cursor, df, table_name, tamano_lote=TAMANO_LOTE_INSERT):
+    """Inserta los datos de un DataFrame en la tabla especificada usando INSERT multi-fila por lotes."""
     if df.empty:
         print(f"El DataFrame para la tabla '{table_name}' está vacío. No se insertarán datos.")
-        return
+        return 0
 
-    # Limpiar y asegurar los nombres de las columnas para la consulta INSERT
-    clean_columns = [f"`{''.join(c for c in col if c.isalnum() or c == '_').lower()}`" for col in df.columns]
-    columns_str = ", ".join(clean_columns)
-    
-    placeholders = ", ".join(["%s"] * len(df.columns))
-    insert_query = f"INSERT INTO `{table_name}` ({columns_str}) VALUES ({placeholders})"
-
-    # Convertir DataFrame a una lista de tuplas para la inserción
-    # Pandas DataFrame.values ya produce una lista de filas, pero lo convertimos a tuplas
-    # Asegúrate de que los tipos de datos en el DataFrame coincidan con los de la tabla MySQL
-    df_copy = df.copy()
-    df_copy = df_copy.replace({pd.NA: None, pd.NaT: None})
-    data_to_insert = [tuple(row) for row in df_copy.values]
-
-    print(f"Insertando {len(data_to_insert)} filas en la tabla '{table_name}'...")
-    data_to_insert = []
-    for index, row in df.iterrows():
-        # Convertir cada valor a un tipo de Python nativo.
-        # Esto es crucial para manejar los tipos de NumPy.
-        processed_row = []
-        for item in row.values:
-            if isinstance(item, (np.integer, np.int64, np.int32)):
-                processed_row.append(int(item)) # Convertir enteros de NumPy a int de Python
-            elif isinstance(item, (np.floating, np.float64, np.float32)):
-                processed_row.append(float(item)) # Convertir flotantes de NumPy a float de Python
-            elif pd.isna(item): # Manejar NaN (valores faltantes) de Pandas/NumPy
-                processed_row.append(None) # Convertir NaN a None (que MySQL interpreta como NULL)
-            else:
-                processed_row.append(item) # Dejar otros tipos (strings, etc.) como están
-        data_to_insert.append(tuple(processed_row))
-        
+    print(f"Insertando {len(df)} filas en la tabla '{table_name}' en lotes de {tamano_lote}...")
+    inicio = time.perf_counter()
     try:
-        cursor.executemany(insert_query, data_to_insert)
+        insert_rows(cursor, df, table_name, tamano_lote)
         conn.commit() # Confirmar los cambios
-        print(f"Datos insertados exitosamente en la tabla '{table_name}'.")
     except mysql.connector.Error as err:
         print(f"Error al insertar datos en la tabla '{table_name}': {err}")
         conn.rollback() # Revertir cambios en caso de error
+        return 0
+
+    duracion = time.perf_counter() - inicio
+    print(f"Datos insertados exitosamente en la tabla '{table_name}': {len(df)} filas en {duracion:.2f} s ({len(df) / max(duracion, 1e-9):,.0f} filas/s).")
+    return len(df)
+
+def es_columnar(file_path):
+    """Indica si un archivo de datos está en formato columnar (Parquet o Arrow IPC)."""
+    return os.path.splitext(file_path)[1] in (".parquet", ".arrow")
+
+def leer_tabla_arrow(file_path):
+    """Lee un archivo Parquet o Arrow IPC como pyarrow.Table. Arrow IPC se abre con memory-map, sin copiar los datos."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if file_path.endswith(".arrow"):
+        return pa.ipc.open_file(pa.memory_map(file_path, "r")).read_all()
+    return pq.read_table(file_path, memory_map=True)
+
+def tabla_de_archivo(file_path):
+    """Devuelve el nombre de la tabla de un archivo de datos (el nombre del archivo sin extensión, limpio)."""
+    return limpiar_identificador(os.path.splitext(os.path.basename(file_path))[0])
+
+def columnas_csv(file_path):
+    """Devuelve los nombres de las columnas de un CSV (su cabecera)."""
+    return list(pd.read_csv(file_path, encoding=CSV_ENCODING, sep=CSV_SEPARADOR, nrows=0).columns)
+
+def a_tipos_de_carga(df, tabla):
+    """Convierte un DataFrame leído de un archivo columnar a los tipos de carga de tipos.py (ver dtypes_carga)."""
+    df = df.astype(tipos.dtypes_carga(tabla, df.columns))
+    escalas = {col: n for col, n in tipos.decimales(tabla).items() if col in df.columns}
+    return df.round(escalas) if escalas else df
+
+def leer_csv_por_chunks(file_path, tamano_chunk, saltar_filas=0, usecols=None):
+    """Lee un CSV por chunks con los tipos de carga de tipos.py (sin inferir tipos), salteando las primeras saltar_filas
+    filas de datos. Si una columna entera tiene campos vacíos, sigue desde ese chunk con enteros nullable."""
+    tabla_destino = tabla_de_archivo(file_path)
+    # Se lee la cabecera aparte para poder saltar directamente las filas pedidas
+    columnas = columnas_csv(file_path)
+    leidas = 0
+    for nullable in (False, True):
+        lector = pd.read_csv(file_path, encoding=CSV_ENCODING, sep=CSV_SEPARADOR, header=None, names=columnas, usecols=usecols,
+                             skiprows=saltar_filas + leidas + 1, chunksize=tamano_chunk,
+                             dtype=tipos.dtypes_carga(tabla_destino, usecols or columnas, nullable))
+        try:
+            for chunk in lector:
+                leidas += len(chunk)
+                yield chunk
+            return
+        except ValueError: # "Integer column has NA values"
+            if nullable:
+                raise
+
+def leer_archivo(file_path, nrows=None):
+    """Lee un archivo de datos (CSV, Parquet o Arrow) como DataFrame, opcionalmente solo sus primeras nrows filas.
+    Las columnas registradas en tipos.py se leen con su tipo, sin que Pandas lo infiera."""
+    tabla_destino = tabla_de_archivo(file_path)
+    if not es_columnar(file_path):
+        columnas = columnas_csv(file_path)
+        try:
+            return pd.read_csv(file_path, encoding=CSV_ENCODING, sep=CSV_SEPARADOR, nrows=nrows, low_memory=False,
+                               dtype=tipos.dtypes_carga(tabla_destino, columnas))
+        except ValueError: # Una columna entera tiene campos vacíos (NULL)
+            return pd.read_csv(file_path, encoding=CSV_ENCODING, sep=CSV_SEPARADOR, nrows=nrows, low_memory=False,
+                               dtype=tipos.dtypes_carga(tabla_destino, columnas, nullable=True))
+    tabla = leer_tabla_arrow(file_path)
+    return a_tipos_de_carga((tabla if nrows is None else tabla.slice(0, nrows)).to_pandas(), tabla_destino)
+
+def leer_archivo_por_chunks(file_path, tamano_chunk, saltar_filas=0):
+    """Lee un archivo de datos por chunks de tamano_chunk filas, salteando las primeras saltar_filas filas de datos."""
+    if not es_columnar(file_path):
+        yield from leer_csv_por_chunks(file_path, tamano_chunk, saltar_filas)
+        return
+    tabla_destino = tabla_de_archivo(file_path)
+    # slice() no copia: cada chunk es una vista sobre el archivo mapeado hasta que se convierte a DataFrame
+    tabla = leer_tabla_arrow(file_path).slice(saltar_filas)
+    for desde in range(0, tabla.num_rows, tamano_chunk):
+        yield a_tipos_de_carga(tabla.slice(desde, tamano_chunk).to_pandas(), tabla_destino)
+
+def leer_columna_por_chunks(file_path, columna, tamano_chunk):
+    """Lee una sola columna (por su nombre limpio, ej. 'paciente_id') de un archivo de datos, por chunks (Series)."""
+    if not es_columnar(file_path):
+        nombres = {limpiar_identificador(col): col for col in columnas_csv(file_path)}
+        original = nombres[columna]
+        for chunk in leer_csv_por_chunks(file_path, tamano_chunk, usecols=[original]):
+            yield chunk[original]
+        return
+    tabla = leer_tabla_arrow(file_path)
+    nombres = {limpiar_identificador(col): col for col in tabla.column_names}
+    valores = tabla.column(nombres[columna])
+    for desde in range(0, len(valores), tamano_chunk):
+        yield valores.slice(desde, tamano_chunk).to_pandas()
+
+def validar_integridad(archivos_por_tabla, tamano_chunk=TAMANO_CHUNK):
+    """Comprueba en los archivos cada relación de FOREIGN_KEYS cuyas dos tablas se van a cargar.
+    Devuelve { nombre_fk: filas huérfanas } con las relaciones que tienen valores sin fila en la tabla padre."""
+    print("\n--- Validando Integridad Referencial ---")
+    claves_padre = {} # (tabla, columna) -> valores de la clave en la tabla padre (se leen una sola vez)
+    huerfanas_por_fk = {}
+    for fk_info in FOREIGN_KEYS:
+        from_table, to_table = fk_info["from_table"], fk_info["to_table"]
+        if from_table not in archivos_por_tabla or to_table not in archivos_por_tabla:
+            continue
+        relacion = f"{from_table}.{fk_info['from_column']} -> {to_table}.{fk_info['to_column']}"
+        try:
+            clave = (to_table, fk_info["to_column"])
+            if clave not in claves_padre:
+                claves_padre[clave] = pd.concat(leer_columna_por_chunks(archivos_por_tabla[to_table], fk_info["to_column"], tamano_chunk)).unique()
+
+            filas = huerfanas = 0
+            muestra = set()
+            for chunk in leer_columna_por_chunks(archivos_por_tabla[from_table], fk_info["from_column"], tamano_chunk):
+                # Los NULL no violan la FK; el resto debe estar entre las claves de la tabla padre
+                es_huerfana = chunk.notna().to_numpy() & ~chunk.isin(claves_padre[clave]).to_numpy()
+                filas += len(chunk)
+                huerfanas += int(es_huerfana.sum())
+                if len(muestra) < MUESTRA_HUERFANAS:
+                    muestra.update(chunk[es_huerfana].unique()[:MUESTRA_HUERFANAS - len(muestra)].tolist())
+        except KeyError as err:
+            print(f"Error: Falta la columna {err} para validar {relacion}.")
+            huerfanas_por_fk[nombre_fk(fk_info)] = None
+            continue
+
+        if huerfanas:
+            huerfanas_por_fk[nombre_fk(fk_info)] = huerfanas
+            print(f"Error: {relacion}: {huerfanas} de {filas} filas sin fila en '{to_table}' (ej. {sorted(muestra)}).")
+        else:
+            print(f"{relacion}: {filas} filas válidas.")
+    return huerfanas_por_fk
+
+def load_data_disponible(cursor):
+    """Indica si el servidor acepta LOAD DATA LOCAL INFILE (variable local_infile)."""
+    try:
+        cursor.execute("SHOW GLOBAL VARIABLES LIKE 'local_infile'")
+        fila = cursor.fetchone()
+        return bool(fila) and str(fila[1]).upper() in ("ON", "1")
+    except mysql.connector.Error as err:
+        print(f"No se pudo consultar la variable 'local_infile': {err}")
+        return False
+
+def load_data_into_table(conn, cursor, file_path, table_name, columnas):
+    """Carga un CSV con LOAD DATA LOCAL INFILE. Devuelve las filas cargadas o None si LOAD DATA no está permitido."""
+    # Detectar el fin de línea del archivo (los CSV generados en Windows usan \r\n)
+    with open(file_path, "rb") as f:
+        fin_de_linea = "\\r\\n" if f.readline().endswith(b"\r\n") else "\\n"
+
+    # Cada campo se lee en una variable de usuario para convertir los campos vacíos en NULL
+    variables = ", ".join(f"@c{i}" for i in range(len(columnas)))
+    asignaciones = ", ".join(f"`{limpiar_identificador(col)}` = NULLIF(@c{i}, '')" for i, col in enumerate(columnas))
+    ruta = os.path.abspath(file_path).replace("\\", "/")
+    load_query = f"""
+    LOAD DATA LOCAL INFILE '{ruta}'
+    INTO TABLE `{table_name}`
+    CHARACTER SET {CHARSET_MYSQL.get(CSV_ENCODING, "utf8mb4")}
+    FIELDS TERMINATED BY '{CSV_SEPARADOR}' OPTIONALLY ENCLOSED BY '"'
+    LINES TERMINATED BY '{fin_de_linea}'
+    IGNORE 1 LINES
+    ({variables})
+    SET {asignaciones}
+    """
+
+    print(f"Cargando '{file_path}' en la tabla '{table_name}' con LOAD DATA LOCAL INFILE...")
+    inicio = time.perf_counter()
+    try:
+        cursor.execute(load_query)
+        filas = cursor.rowcount
+        conn.commit()
+    except mysql.connector.Error as err:
+        conn.rollback()
+        if err.errno in ERRNOS_LOAD_DATA_DESHABILITADO:
+            print(f"LOAD DATA LOCAL INFILE no está permitido ({err}). Se usará INSERT por lotes.")
+            return None
+        print(f"Error al cargar datos en la tabla '{table_name}': {err}")
+        return 0
+
+    duracion = time.perf_counter() - inicio
+    print(f"Datos cargados exitosamente en la tabla '{table_name}': {filas} filas en {duracion:.2f} s ({filas / max(duracion, 1e-9):,.0f} filas/s).")
+    return filas
+
+def crear_tabla_progreso(cursor):
+    """Crea (si no existe) la tabla que registra el último chunk confirmado de cada carga por streaming."""
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS `{TABLA_PROGRESO}` (
+        `tabla` VARCHAR(64) PRIMARY KEY,
+        `archivo` VARCHAR(255) NOT NULL,
+        `tamano_archivo` BIGINT NOT NULL,
+        `chunks_confirmados` INT NOT NULL,
+        `filas` BIGINT NOT NULL,
+        `actualizado` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """)
+
+def stream_csv_into_table(conn, cursor, file_path, table_name, tamano_chunk=TAMANO_CHUNK, tamano_lote=TAMANO_LOTE_INSERT):
+    """Carga un archivo de datos por chunks, confirmando cada chunk junto con su progreso para poder reanudar la carga."""
+    archivo = os.path.basename(file_path)
+    tamano_archivo = os.path.getsize(file_path)
+    crear_tabla_progreso(cursor)
+
+    # ¿Hay una carga anterior sin terminar para esta tabla?
+    cursor.execute(f"SELECT `archivo`, `tamano_archivo`, `chunks_confirmados`, `filas` FROM `{TABLA_PROGRESO}` WHERE `tabla` = %s", (table_name,))
+    progreso = cursor.fetchone()
+    chunks_confirmados, filas_confirmadas = 0, 0
+    if progreso:
+        if progreso[0] != archivo or progreso[1] != tamano_archivo:
+            print(f"Error: La tabla '{table_name}' tiene una carga incompleta de otro archivo ('{progreso[0]}', {progreso[1]} bytes). "
+                  f"Vacía la tabla y borra su fila de '{TABLA_PROGRESO}' antes de volver a cargarla. Saltando.")
+            return 0
+        chunks_confirmados, filas_confirmadas = progreso[2], progreso[3]
+        print(f"Reanudando la carga de '{table_name}' desde el chunk {chunks_confirmados} ({filas_confirmadas} filas ya confirmadas).")
+
+    # Se saltan directamente las filas ya confirmadas
+    lector = leer_archivo_por_chunks(file_path, tamano_chunk, saltar_filas=filas_confirmadas)
+
+    print(f"Cargando '{archivo}' en la tabla '{table_name}' por chunks de {tamano_chunk} filas...")
+    inicio = time.perf_counter()
+    filas_sesion = 0
+    for chunk in lector:
+        if chunks_confirmados == 0 and not crear_tabla(cursor, table_name, chunk):
+            return filas_sesion
+        try:
+            insert_rows(cursor, chunk, table_name, tamano_lote)
+            # El progreso se guarda en la misma transacción que las filas del chunk
+            cursor.execute(f"""
+            INSERT INTO `{TABLA_PROGRESO}` (`tabla`, `archivo`, `tamano_archivo`, `chunks_confirmados`, `filas`)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE `chunks_confirmados` = VALUES(`chunks_confirmados`), `filas` = VALUES(`filas`)
+            """, (table_name, archivo, tamano_archivo, chunks_confirmados + 1, filas_confirmadas + len(chunk)))
+            conn.commit()
+        except mysql.connector.Error as err:
+            conn.rollback()
+            print(f"Error al insertar el chunk {chunks_confirmados} en la tabla '{table_name}': {err}. "
+                  f"La próxima ejecución continuará desde este chunk.")
+            return filas_sesion
+        chunks_confirmados += 1
+        filas_confirmadas += len(chunk)
+        filas_sesion += len(chunk)
+
+    # Carga completa: ya no hace falta reanudar
+    cursor.execute(f"DELETE FROM `{TABLA_PROGRESO}` WHERE `tabla` = %s", (table_name,))
+    conn.commit()
+
+    duracion = time.perf_counter() - inicio
+    print(f"Datos cargados exitosamente en la tabla '{table_name}': {filas_sesion} filas en {chunks_confirmados} chunks, "
+          f"{duracion:.2f} s ({filas_sesion / max(duracion, 1e-9):,.0f} filas/s).")
+    return filas_sesion
+
+def cargar_archivo(conn, cursor, file_path, table_name, modo=MODO_CARGA, tamano_lote=TAMANO_LOTE_INSERT, tamano_chunk=TAMANO_CHUNK):
+    """Crea la tabla de un archivo de datos y carga sus datos según el modo de carga elegido."""
+    if modo == "streaming":
+        return stream_csv_into_table(conn, cursor, file_path, table_name, tamano_chunk, tamano_lote)
+
+    if modo == "load_data" and not es_columnar(file_path):
+        # Para crear la tabla alcanza con el esquema declarado o con una muestra; los datos no pasan por Pandas
+        filas_muestra = 0 if table_name in esquema.TABLAS else FILAS_MUESTRA_TIPOS
+        df_muestra = leer_archivo(file_path, nrows=filas_muestra)
+        if not crear_tabla(cursor, table_name, df_muestra):
+            return 0
+        filas = load_data_into_table(conn, cursor, file_path, table_name, list(df_muestra.columns))
+        if filas is not None:
+            return filas
+
+    # Modo "lotes" (o LOAD DATA no permitido, o archivo columnar): leer el archivo completo e insertarlo por lotes
+    df = leer_archivo(file_path)
+    print(f"Archivo '{os.path.basename(file_path)}' leído. {len(df)} filas encontradas.")
+    if not crear_tabla(cursor, table_name, df):
+        return 0
+    return insert_data_into_table(conn, cursor, df, table_name, tamano_lote)
+
+def dependencias_de_carga(tablas):
+    """Devuelve, para cada tabla a cargar, el conjunto de tablas padre (según FOREIGN_KEYS) que deben cargarse antes."""
+    dependencias = {tabla: set() for tabla in tablas}
+    for fk_info in FOREIGN_KEYS:
+        if fk_info["from_table"] in dependencias and fk_info["to_table"] in dependencias and fk_info["from_table"] != fk_info["to_table"]:
+            dependencias[fk_info["from_table"]].add(fk_info["to_table"])
+    return dependencias
+
+def cargar_archivo_con_pool(pool, file_path, table_name, modo, tamano_lote, tamano_chunk, validadas=False):
+    """Carga un archivo usando una conexión propia tomada del pool (se ejecuta en un hilo del planificador).
+    Con validadas=True (los datos ya pasaron validar_integridad) MySQL no verifica las FKs fila a fila.
+    Devuelve las filas cargadas, o None si la carga falló."""
+    csv_file = os.path.basename(file_path)
+    conn = cursor = None
+    print(f"\n--- Procesando archivo: {csv_file} ---")
+    try:
+        conn = pool.get_connection()
+        cursor = conn.cursor()
+        if validadas:
+            cursor.execute("SET SESSION FOREIGN_KEY_CHECKS = 0")
+        with metricas.etapa("crea_db", f"carga:{table_name}", solo_hilo=True) as registro:
+            registro["filas"] = cargar_archivo(conn, cursor, file_path, table_name, modo, tamano_lote, tamano_chunk)
+        return registro["filas"]
+    except pd.errors.EmptyDataError:
+        print(f"El archivo '{csv_file}' está vacío. Saltando.")
+    except FileNotFoundError:
+        print(f"Error: El archivo '{csv_file}' no se encontró. Verifica la ruta.")
+    except Exception as e:
+        print(f"Error inesperado al procesar el archivo '{csv_file}': {e}")
+    finally:
+        if cursor is not None:
+            try:
+                if validadas:
+                    cursor.execute("SET SESSION FOREIGN_KEY_CHECKS = 1")
+            except mysql.connector.Error:
+                pass # Conexión cortada: el pool la descarta
+            cursor.close()
+        if conn is not None:
+            conn.close() # Devuelve la conexión al pool
+    return None
+
+def cargar_tablas_en_paralelo(pool, archivos_por_tabla, modo=MODO_CARGA, tamano_lote=TAMANO_LOTE_INSERT,
+                              tamano_chunk=TAMANO_CHUNK, workers=WORKERS_CARGA, validadas=False):
+    """Carga las tablas en paralelo respetando el orden padre -> hija definido por FOREIGN_KEYS.
+    Devuelve { tabla: filas }, con None en las tablas que fallaron y en las que se omitieron porque falló una tabla padre."""
+    pendientes = dependencias_de_carga(archivos_por_tabla)
+    terminadas = set()
+    fallidas = set()
+    en_curso = {}
+    filas_por_tabla = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as ejecutor:
+        while pendientes or en_curso:
+            # Lanzar todas las tablas cuyas tablas padre ya terminaron de cargarse
+            listas = [tabla for tabla, padres in pendientes.items() if padres <= terminadas]
+            for tabla in listas:
+                del pendientes[tabla]
+                futuro = ejecutor.submit(cargar_archivo_con_pool, pool, archivos_por_tabla[tabla], tabla, modo, tamano_lote, tamano_chunk, validadas)
+                en_curso[futuro] = tabla
+
+            if not en_curso:
+                print(f"Error: Dependencias circulares entre las tablas {sorted(pendientes)}. No se cargarán.")
+                break
+
+            hechas, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in hechas:
+                tabla = en_curso.pop(futuro)
+                filas_por_tabla[tabla] = futuro.result()
+                if filas_por_tabla[tabla] is None:
+                    fallidas.add(tabla)
+                else:
+                    terminadas.add(tabla)
+
+            # Las hijas de una tabla que falló no se cargan: con FOREIGN_KEY_CHECKS = 0 entrarían filas huérfanas
+            omitidas = [tabla for tabla, padres in pendientes.items() if padres & fallidas]
+            while omitidas:
+                for tabla in omitidas:
+                    print(f"Se omite la tabla '{tabla}' porque falló la carga de '{', '.join(sorted(pendientes[tabla] & fallidas))}'.")
+                    del pendientes[tabla]
+                    filas_por_tabla[tabla] = None
+                    fallidas.add(tabla)
+                omitidas = [tabla for tabla, padres in pendientes.items() if padres & fallidas]
+    return filas_por_tabla
+
+def tablas_fallidas(filas_por_tabla):
+    """Devuelve las tablas que no se cargaron (filas None en el resultado de cargar_tablas_en_paralelo)."""
+    return sorted(tabla for tabla, filas in filas_por_tabla.items() if filas is None)
+
+def orden_de_carga(tablas):
+    """Devuelve las tablas ordenadas de forma que cada tabla padre aparezca antes que sus hijas."""
+    pendientes = dependencias_de_carga(tablas)
+    orden = []
+    while pendientes:
+        listas = sorted(tabla for tabla, padres in pendientes.items() if padres <= set(orden))
+        if not listas:
+            print(f"Advertencia: Dependencias circulares entre las tablas {sorted(pendientes)}.")
+            listas = sorted(pendientes)
+        for tabla in listas:
+            del pendientes[tabla]
+        orden.extend(listas)
+    return orden
+
+def hash_archivo(file_path):
+    """Calcula el hash SHA-256 del contenido de un archivo, leyéndolo por bloques."""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(bloque)
+    return sha256.hexdigest()
+
+def sql_version_carga(version):
+    """Devuelve las sentencias (válidas en MySQL, DuckDB y SQLite) que guardan el sello de versión de la carga."""
+    return [
+        f"CREATE TABLE IF NOT EXISTS {TABLA_VERSION} (id INTEGER PRIMARY KEY, version VARCHAR(64) NOT NULL, "
+        f"actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+        f"DELETE FROM {TABLA_VERSION}",
+        f"INSERT INTO {TABLA_VERSION} (id, version) VALUES (1, '{version}')"
+    ]
+
+def registrar_version_carga(conn, cursor):
+    """Guarda un sello de versión nuevo para la carga recién terminada (cursor puede ser la conexión embebida)."""
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    for sql in sql_version_carga(version):
+        cursor.execute(sql)
+    conn.commit()
+    print(f"Versión de la carga: {version}")
+    return version
+
+def crear_tabla_metadatos(cursor):
+    """Crea (si no existe) la tabla con el hash y las filas del último CSV cargado en cada tabla."""
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS `{TABLA_METADATOS}` (
+        `tabla` VARCHAR(64) PRIMARY KEY,
+        `archivo` VARCHAR(255) NOT NULL,
+        `hash` CHAR(64) NOT NULL,
+        `filas` BIGINT NOT NULL,
+        `actualizado` TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    )
+    """)
+
+def registrar_metadatos(cursor, table_name, file_path, hash_csv, filas):
+    """Guarda el hash y las filas del CSV cargado en una tabla (sin confirmar la transacción)."""
+    cursor.execute(f"""
+    INSERT INTO `{TABLA_METADATOS}` (`tabla`, `archivo`, `hash`, `filas`) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE `archivo` = VALUES(`archivo`), `hash` = VALUES(`hash`), `filas` = VALUES(`filas`)
+    """, (table_name, os.path.basename(file_path), hash_csv, filas))
+
+def llenar_staging(conn, cursor, file_path, table_name, modo, tamano_lote, tamano_chunk):
+    """Carga un archivo de datos en una tabla temporal con la misma estructura (y PK) que la tabla destino."""
+    tabla_staging = f"{PREFIJO_STAGING}{table_name}"
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{tabla_staging}`")
+    if esquema.TABLAS.get(table_name, {}).get("particiones"):
+        # CREATE TEMPORARY TABLE ... LIKE falla con tablas particionadas: se crea desde esquema.py
+        cursor.execute(esquema.create_table_sql(table_name, temporal_como=tabla_staging))
+    else:
+        cursor.execute(f"CREATE TEMPORARY TABLE `{tabla_staging}` LIKE `{table_name}`")
+
+    if modo == "load_data" and not es_columnar(file_path):
+        columnas = columnas_csv(file_path)
+        filas = load_data_into_table(conn, cursor, file_path, tabla_staging, columnas)
+        if filas is not None:
+            return tabla_staging, filas
+
+    # Sin LOAD DATA: insertar por chunks para mantener la memoria acotada
+    filas = 0
+    for chunk in leer_archivo_por_chunks(file_path, tamano_chunk):
+        insert_rows(cursor, chunk, tabla_staging, tamano_lote)
+        filas += len(chunk)
+    conn.commit()
+    return tabla_staging, filas
+
+def sql_filas_distintas(table_name, tabla_staging):
+    """Devuelve el SELECT de las filas de la tabla temporal que son nuevas o distintas a las de la tabla destino."""
+    pk = esquema.TABLAS[table_name]["pk"]
+    no_pk = [col for col in esquema.columnas_tabla(table_name) if col not in pk]
+    union = " AND ".join(f"d.`{col}` = s.`{col}`" for col in pk)
+    # Fila nueva (no existe en destino) o con algún valor distinto (<=> compara también NULLs)
+    distinta = " OR ".join([f"d.`{pk[0]}` IS NULL"] + [f"NOT (s.`{col}` <=> d.`{col}`)" for col in no_pk])
+    return f"""
+    SELECT {", ".join(f"s.`{col}`" for col in esquema.columnas_tabla(table_name))}
+    FROM `{tabla_staging}` s
+    LEFT JOIN `{table_name}` d ON {union}
+    WHERE {distinta}
+    """
+
+def sql_filas_borradas(table_name, tabla_staging):
+    """Devuelve el FROM/WHERE de las filas de la tabla destino (alias d) cuya PK ya no está en la tabla temporal."""
+    pk = esquema.TABLAS[table_name]["pk"]
+    union = " AND ".join(f"d.`{col}` = s.`{col}`" for col in pk)
+    return f"""
+    FROM `{table_name}` d
+    LEFT JOIN `{tabla_staging}` s ON {union}
+    WHERE s.`{pk[0]}` IS NULL
+    """
+
+def aplicar_upsert(cursor, table_name, tabla_staging):
+    """Inserta las filas nuevas y actualiza las modificadas (según la PK) desde la tabla temporal. Devuelve las filas afectadas."""
+    pk = esquema.TABLAS[table_name]["pk"]
+    columnas = esquema.columnas_tabla(table_name)
+    no_pk = [col for col in columnas if col not in pk]
+    lista_columnas = ", ".join(f"`{col}`" for col in columnas)
+    seleccion = sql_filas_distintas(table_name, tabla_staging)
+    if no_pk:
+        actualizaciones = ", ".join(f"`{col}` = nuevo.`{col}`" for col in no_pk)
+        upsert_query = f"INSERT INTO `{table_name}` ({lista_columnas}) SELECT * FROM ({seleccion}) AS nuevo ON DUPLICATE KEY UPDATE {actualizaciones}"
+    else:
+        upsert_query = f"INSERT IGNORE INTO `{table_name}` ({lista_columnas}) {seleccion}"
+    cursor.execute(upsert_query)
+    return cursor.rowcount
+
+def aplicar_borrados(cursor, table_name, tabla_staging):
+    """Borra de la tabla destino las filas cuya PK ya no está en el CSV. Devuelve las filas borradas."""
+    cursor.execute(f"DELETE d {sql_filas_borradas(table_name, tabla_staging)}")
+    return cursor.rowcount
+
+def registrar_pacientes_con_cambios(cursor, table_name, tabla_staging):
+    """Registra en la tabla temporal de rollups los pacientes con filas nuevas, modificadas o borradas."""
+    destino = f"INSERT IGNORE INTO `{rollups.TABLA_PACIENTES_AFECTADOS}` (`paciente_id`)"
+    cursor.execute(f"{destino} SELECT x.`paciente_id` FROM ({sql_filas_distintas(table_name, tabla_staging)}) AS x")
+    cursor.execute(f"{destino} SELECT d.`paciente_id` {sql_filas_borradas(table_name, tabla_staging)}")
+
+def cargar_incremental(pool, conn, cursor, archivos_por_tabla, modo=MODO_CARGA, tamano_lote=TAMANO_LOTE_INSERT,
+                       tamano_chunk=TAMANO_CHUNK, workers=WORKERS_CARGA, validadas=False):
+    """Carga solo las tablas cuyo CSV cambió desde la última carga, aplicando la diferencia por clave primaria."""
+    print("\n--- Carga Incremental ---")
+    crear_tabla_metadatos(cursor)
+    cursor.execute(f"SELECT `tabla`, `hash` FROM `{TABLA_METADATOS}`")
+    hashes_cargados = dict(cursor.fetchall())
+    cursor.execute("SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = %s", (DB_NAME,))
+    tablas_existentes = {fila[0].lower() for fila in cursor.fetchall()}
+    conn.commit()
+
+    hashes = {tabla: hash_archivo(file_path) for tabla, file_path in archivos_por_tabla.items()}
+    nuevas, modificadas = {}, {}
+    for tabla, file_path in archivos_por_tabla.items():
+        if tabla not in tablas_existentes:
+            nuevas[tabla] = file_path
+        elif hashes_cargados.get(tabla) == hashes[tabla]:
+            print(f"La tabla '{tabla}' está al día con '{os.path.basename(file_path)}'. Saltando.")
+        else:
+            modificadas[tabla] = file_path
+
+    filas_por_tabla = {}
+
+    # Tablas nuevas: carga completa (en paralelo) y registro de su hash
+    if nuevas:
+        filas_por_tabla.update(cargar_tablas_en_paralelo(pool, nuevas, modo, tamano_lote, tamano_chunk, workers, validadas))
+        for tabla, file_path in nuevas.items():
+            if filas_por_tabla.get(tabla):
+                registrar_metadatos(cursor, tabla, file_path, hashes[tabla], filas_por_tabla[tabla])
+        conn.commit()
+
+    # Tablas modificadas: se carga el CSV en una tabla temporal y se aplica la diferencia por PK
+    staging = {}
+    recargadas = []
+    for tabla in orden_de_carga(modificadas):
+        file_path = modificadas[tabla]
+        definicion = esquema.TABLAS.get(tabla)
+        if not definicion or not definicion["pk"] or "PRIMARY" not in indices.indices_existentes(cursor, tabla):
+            # Sin clave primaria no se puede calcular la diferencia: recarga completa de la tabla
+            print(f"La tabla '{tabla}' no tiene clave primaria. Se recargará completa.")
+            try:
+                cursor.execute(f"DELETE FROM `{tabla}`")
+                conn.commit()
+            except mysql.connector.Error as err:
+                conn.rollback()
+                print(f"Error al vaciar la tabla '{tabla}': {err}. Saltando.")
+                continue
+            filas_por_tabla[tabla] = cargar_archivo(conn, cursor, file_path, tabla, modo, tamano_lote, tamano_chunk)
+            recargadas.append(tabla)
+            registrar_metadatos(cursor, tabla, file_path, hashes[tabla], filas_por_tabla[tabla])
+            conn.commit()
+            continue
+        print(f"\n--- Calculando cambios de la tabla '{tabla}' ---")
+        staging[tabla] = llenar_staging(conn, cursor, file_path, tabla, modo, tamano_lote, tamano_chunk)
+
+    # Rollups: si hay tablas nuevas, recargadas completas o de dimensión modificadas se recalculan completos; si solo
+    # cambiaron tablas de hechos se recalculan los grupos de los pacientes afectados (antes y después de aplicar los cambios)
+    refresco_completo = bool(nuevas) or bool(recargadas) or any(tabla in rollups.TABLAS_DIMENSION for tabla in modificadas)
+    tablas_hechos = [tabla for tabla in staging if tabla in rollups.TABLAS_HECHOS]
+    grupos_antes = None
+
+    if staging:
+        inicio = time.perf_counter()
+        try:
+            if tablas_hechos and not refresco_completo:
+                rollups.crear_tabla_pacientes_afectados(cursor)
+                for tabla in tablas_hechos:
+                    registrar_pacientes_con_cambios(cursor, tabla, staging[tabla][0])
+                grupos_antes = rollups.grupos_de_pacientes(cursor)
+
+            # Upserts de padres a hijas y borrados de hijas a padres, para respetar las claves foráneas.
+            # Todo en una única transacción: o se aplican todos los cambios o ninguno.
+            cambios = {}
+            for tabla in orden_de_carga(staging):
+                cambios[tabla] = [aplicar_upsert(cursor, tabla, staging[tabla][0]), 0]
+            for tabla in reversed(orden_de_carga(staging)):
+                cambios[tabla][1] = aplicar_borrados(cursor, tabla, staging[tabla][0])
+            for tabla, (tabla_staging, filas) in staging.items():
+                registrar_metadatos(cursor, tabla, modificadas[tabla], hashes[tabla], filas)
+            conn.commit()
+            for tabla, (upserts, borrados) in cambios.items():
+                # ON DUPLICATE KEY UPDATE cuenta 1 por fila insertada y 2 por fila actualizada
+                print(f"Tabla '{tabla}' actualizada: {upserts} filas afectadas por el upsert, {borrados} filas borradas.")
+                filas_por_tabla[tabla] = upserts + borrados
+            print(f"Cambios aplicados en {time.perf_counter() - inicio:.2f} s.")
+
+            if grupos_antes is not None:
+                rollups.refrescar_rollups(conn, cursor, rollups.unir_grupos(grupos_antes, rollups.grupos_de_pacientes(cursor)))
+        except mysql.connector.Error as err:
+            conn.rollback()
+            print(f"Error al aplicar los cambios incrementales: {err}. No se modificó ninguna tabla.")
+        finally:
+            for tabla_staging, _ in staging.values():
+                cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{tabla_staging}`")
+            cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{rollups.TABLA_PACIENTES_AFECTADOS}`")
+
+    if refresco_completo:
+        rollups.refrescar_rollups(conn, cursor)
+
+    return filas_por_tabla
 
 def add_primary_keys(conn, cursor):
     """Agrega claves primarias a las tablas según la configuración."""
@@ -163,42 +886,22 @@ def add_primary_keys(conn, cursor):
             else:
                 print(f"Error al agregar clave primaria a '{table}': {err}")
 
-def add_foreign_keys(conn, cursor):
-    """Agrega claves foráneas a las tablas según la configuración."""
+def add_foreign_keys(conn, cursor, validadas=False):
+    """Agrega claves foráneas a las tablas según la configuración.
+    Con validadas=True (los datos ya pasaron validar_integridad) se agregan con FOREIGN_KEY_CHECKS=0: el ALTER TABLE
+    es in-place y no verifica las filas existentes."""
     print("\n--- Agregando Claves Foráneas ---")
+    # La mayoría de las tablas de esquema.py ya se crean con sus FKs: aquí se agregan las de las tablas con PK
+    # diferida y las que falten (ej. tablas creadas con los tipos inferidos del DataFrame)
+    if validadas:
+        cursor.execute("SET SESSION FOREIGN_KEY_CHECKS = 0")
     for fk_info in FOREIGN_KEYS:
         from_table = fk_info["from_table"]
-        from_column = "".join(c for c in fk_info["from_column"] if c.isalnum() or c == "_").lower()
+        from_column = limpiar_identificador(fk_info["from_column"])
         to_table = fk_info["to_table"]
-        to_column = "".join(c for c in fk_info["to_column"] if c.isalnum() or c == "_").lower()
-
-        # Generar el nombre de la FK y truncarlo si es necesario
-        base_fk_name = f"fk_{from_table}_{from_column}_to_{to_table}_{to_column}"
-        
-        # MySQL por defecto tiene un límite de 64 caracteres para identificadores.
-        # Puedes ajustar este número si sabes que tu DB tiene un límite diferente.
-        MAX_FK_NAME_LENGTH = 64 
-
-        if len(base_fk_name) > MAX_FK_NAME_LENGTH:
-            # Opción 1: Truncar y agregar un hash para asegurar unicidad
-            import hashlib
-            hash_suffix = hashlib.md5(base_fk_name.encode()).hexdigest()[:3] # Usar un hash corto del nombre original
-            fk_name = f"fk_{from_table}_{from_column}_{hash_suffix}"
-            # Asegurarse de que el nombre final no exceda el límite
-            fk_name = fk_name[:MAX_FK_NAME_LENGTH] 
-            print(f"Advertencia: El nombre de FK '{base_fk_name}' era demasiado largo. Se ha truncado a '{fk_name}'.")
-        else:
-            fk_name = base_fk_name
-
-        alter_table_query = f"""
-        ALTER TABLE `{from_table}`
-        ADD CONSTRAINT `{fk_name}`
-        FOREIGN KEY (`{from_column}`) REFERENCES `{to_table}`(`{to_column}`)
-        ON DELETE RESTRICT ON UPDATE CASCADE;
-        """
-        # ON DELETE RESTRICT: Si intentas borrar una fila de la tabla padre que tiene filas hijas, la operación fallará.
-        # ON UPDATE CASCADE: Si se actualiza el valor de la clave primaria en la tabla padre, se actualiza automáticamente
-        #                     en la tabla hija.
+        to_column = limpiar_identificador(fk_info["to_column"])
+        fk_name = nombre_fk(fk_info)
+        alter_table_query = f"ALTER TABLE `{from_table}` ADD {clausula_fk(fk_info)}"
 
         try:
             # Verificar si la clave foránea ya existe
@@ -220,60 +923,163 @@ def add_foreign_keys(conn, cursor):
                 print(f"¡Error Crítico! El nombre de la clave foránea '{fk_name}' es demasiado largo ({len(fk_name)} caracteres) incluso después de intentar truncarlo. Considera un esquema de nombres más corto o ajusta el límite de caracteres si tu DB lo permite.")
             else:
                 print(f"Error al agregar clave foránea '{fk_name}': {err}")
+    if validadas:
+        cursor.execute("SET SESSION FOREIGN_KEY_CHECKS = 1")
+
+def cargar_embebido(backend, archivos_por_tabla, ruta_db=None, tamano_chunk=TAMANO_CHUNK, validadas=False):
+    """Crea las tablas declaradas en esquema.py en una base embebida (DuckDB o SQLite) y carga los CSV en orden padre -> hija.
+    Siempre hace una carga completa: las tablas existentes se reemplazan. Devuelve { tabla: filas }."""
+    ruta_db = ruta_db or backends.RUTAS_POR_DEFECTO[backend]
+    conn = backends.conectar(backend, ruta_db)
+    if not conn:
+        return {}
+
+    tablas = [tabla for tabla in orden_de_carga(archivos_por_tabla) if tabla in esquema.TABLAS]
+    for tabla in sorted(set(archivos_por_tabla) - set(tablas)):
+        print(f"Advertencia: La tabla '{tabla}' no está declarada en esquema.py. Saltando.")
+
+    filas_por_tabla = {}
+    try:
+        # Borrar primero las tablas hijas para no violar las FKs
+        for tabla in reversed(tablas):
+            conn.execute(f'DROP TABLE IF EXISTS "{tabla}"')
+        for tabla in tablas:
+            conn.execute(backends.create_table_sql(tabla, backend, PRIMARY_KEYS, FOREIGN_KEYS))
+        if backend == "sqlite" and validadas:
+            # Los datos ya se validaron: SQLite no verifica las FKs fila a fila durante la carga
+            conn.execute("PRAGMA foreign_keys = OFF")
+
+        for tabla in tablas:
+            inicio = time.perf_counter()
+            filas = 0
+            for chunk in leer_archivo_por_chunks(archivos_por_tabla[tabla], tamano_chunk):
+                chunk.columns = [limpiar_identificador(col) for col in chunk.columns]
+                backends.insertar_chunk(conn, backend, chunk, tabla)
+                filas += len(chunk)
+            conn.commit()
+            filas_por_tabla[tabla] = filas
+            duracion = time.perf_counter() - inicio
+            print(f"Tabla '{tabla}' cargada en {backend}: {filas} filas en {duracion:.2f} s ({filas / max(duracion, 1e-9):,.0f} filas/s).")
+
+        backends.crear_indices_embebidos(conn, backend, tablas)
+        conn.commit()
+        registrar_version_carga(conn, conn)
+        if backend == "sqlite" and validadas:
+            conn.execute("PRAGMA foreign_keys = ON")
+        print(f"Base {backend} lista en '{os.path.abspath(ruta_db)}'.")
+    except Exception as err: # sqlite3.Error o duckdb.Error
+        print(f"Error al cargar la base {backend}: {err}")
+    finally:
+        conn.close()
+    return filas_por_tabla
+
+def archivos_de_datos_por_tabla(modo=MODO_CARGA):
+    """Busca los archivos de datos de CSV_FOLDER y devuelve { nombre_tabla: ruta_archivo } (vacío si no hay archivos).
+    Si una tabla está en varios formatos se elige uno según EXTENSIONES_ENTRADA (o EXTENSIONES_ENTRADA_LOAD_DATA)."""
+    # Asegurarse de que la carpeta de CSVs exista
+    if not os.path.isdir(CSV_FOLDER):
+        print(f"Error: La carpeta '{CSV_FOLDER}' no existe. Por favor, créala y coloca tus archivos CSV dentro.")
+        return {}
+
+    preferencia = EXTENSIONES_ENTRADA_LOAD_DATA if modo == "load_data" else EXTENSIONES_ENTRADA
+    data_files = [f for f in os.listdir(CSV_FOLDER) if os.path.splitext(f)[1] in preferencia]
+
+    if not data_files:
+        print(f"No se encontraron archivos de datos ({', '.join(preferencia)}) en la carpeta '{CSV_FOLDER}'.")
+        return {}
+
+    archivos_por_tabla = {}
+    # Recorrer del formato menos preferido al más preferido para que este último reemplace a los demás
+    for data_file in sorted(data_files, key=lambda f: -preferencia.index(os.path.splitext(f)[1])):
+        # Nombre de la tabla será el nombre del archivo sin extensión
+        table_name = os.path.splitext(data_file)[0] 
+        # Limpiar el nombre de la tabla para asegurar que sea válido en MySQL
+        table_name = "".join(c for c in table_name if c.isalnum() or c == "_").lower()
+        if not table_name:
+            print(f"Advertencia: El nombre de archivo '{data_file}' resultó en un nombre de tabla vacío o inválido. Saltando.")
+            continue
+        archivos_por_tabla[table_name] = os.path.join(CSV_FOLDER, data_file)
+    return archivos_por_tabla
+
+def integridad_valida(archivos_por_tabla, tamano_chunk=TAMANO_CHUNK):
+    """Ejecuta la etapa de validación de integridad referencial. Devuelve False si hay filas huérfanas."""
+    with metricas.etapa("crea_db", "validacion_fks"):
+        huerfanas_por_fk = validar_integridad(archivos_por_tabla, tamano_chunk)
+    if huerfanas_por_fk:
+        print(f"Error: {len(huerfanas_por_fk)} relaciones con filas huérfanas ({', '.join(huerfanas_por_fk)}). "
+              f"No se cargará ningún dato: corrige los archivos o usa --sin-validar-fks.")
+        return False
+    return True
+
+def main(modo=MODO_CARGA, tamano_lote=TAMANO_LOTE_INSERT, tamano_chunk=TAMANO_CHUNK, workers=WORKERS_CARGA, incremental=False,
+         backend=backends.BACKEND, ruta_db=None, validar_fks=True):
+    if backend != "mysql":
+        # Base embebida en un archivo (DuckDB o SQLite): no necesita el contenedor de MySQL
+        archivos_por_tabla = archivos_de_datos_por_tabla(modo=None)
+        if archivos_por_tabla and (not validar_fks or integridad_valida(archivos_por_tabla, tamano_chunk)):
+            with metricas.etapa("crea_db", f"carga_{backend}") as registro:
+                filas_por_tabla = cargar_embebido(backend, archivos_por_tabla, ruta_db, tamano_chunk, validar_fks)
+                registro["filas"] = sum(filas_por_tabla.values())
+            print(f"\n{registro['filas']} filas cargadas en {len(filas_por_tabla)} tablas en {registro['segundos']:.2f} s.")
+        return
 
-def main():
     conn = None
+    workers = workers_para_pool(workers)
     try:
-        conn = get_db_connection()
-        if not conn:
+        # Una conexión por worker más la conexión principal (claves primarias y foráneas)
+        pool = get_db_pool(workers + 1, allow_local_infile=(modo == "load_data"))
+        if not pool:
             print("No se pudo establecer conexión con la base de datos. Asegúrate de que el contenedor Docker esté funcionando.")
             return
 
+        conn = pool.get_connection()
         cursor = conn.cursor()
 
-        # Asegurarse de que la carpeta de CSVs exista
-        if not os.path.isdir(CSV_FOLDER):
-            print(f"Error: La carpeta '{CSV_FOLDER}' no existe. Por favor, créala y coloca tus archivos CSV dentro.")
-            return
-
-        csv_files = [f for f in os.listdir(CSV_FOLDER) if f.endswith(".csv")]
+        if modo == "load_data" and not load_data_disponible(cursor):
+            print(f"El servidor tiene deshabilitado LOAD DATA LOCAL INFILE. Se usarán INSERT por lotes de {tamano_lote} filas.")
+            modo = "lotes"
 
-        if not csv_files:
-            print(f"No se encontraron archivos .csv en la carpeta '{CSV_FOLDER}'.")
+        archivos_por_tabla = archivos_de_datos_por_tabla(modo)
+        if not archivos_por_tabla:
+            return
+        if validar_fks and not integridad_valida(archivos_por_tabla, tamano_chunk):
             return
 
-        for csv_file in csv_files:
-            file_path = os.path.join(CSV_FOLDER, csv_file)
-            
-            # Nombre de la tabla será el nombre del archivo sin extensión
-            table_name = os.path.splitext(csv_file)[0] 
-            # Limpiar el nombre de la tabla para asegurar que sea válido en MySQL
-            table_name = "".join(c for c in table_name if c.isalnum() or c == "_").lower()
-            if not table_name:
-                print(f"Advertencia: El nombre de archivo '{csv_file}' resultó en un nombre de tabla vacío o inválido. Saltando.")
-                continue
+        with metricas.etapa("crea_db", "carga_incremental" if incremental else "carga") as registro:
+            if incremental:
+                # Solo se cargan las tablas cuyo CSV cambió, aplicando la diferencia por clave primaria
+                filas_por_tabla = cargar_incremental(pool, conn, cursor, archivos_por_tabla, modo, tamano_lote, tamano_chunk, workers, validar_fks)
+            else:
+                # Cargar las tablas en paralelo: primero las tablas padre, luego sus hijas
+                filas_por_tabla = cargar_tablas_en_paralelo(pool, archivos_por_tabla, modo, tamano_lote, tamano_chunk, workers, validar_fks)
+            fallidas = tablas_fallidas(filas_por_tabla)
+            filas_por_tabla = {tabla: filas for tabla, filas in filas_por_tabla.items() if filas is not None}
+            registro["filas"] = sum(filas_por_tabla.values())
+        print(f"\n{registro['filas']} filas cargadas en {len(filas_por_tabla)} tablas en {registro['segundos']:.2f} s con {workers} workers.")
+        if fallidas:
+            # Código de salida distinto de 0: app.py detiene el pipeline en lugar de informar éxito
+            print(f"Error: No se cargaron las tablas {', '.join(fallidas)}. No se crearán claves ni rollups.")
+            sys.exit(1)
+        if not incremental:
+            with metricas.etapa("crea_db", "rollups"):
+                rollups.refrescar_rollups(conn, cursor)
 
-            print(f"\n--- Procesando archivo: {csv_file} ---")
-            try:
-                # Leer el archivo CSV
-                df = pd.read_csv(file_path, encoding='latin1', sep=';', low_memory=False)
-                print(f"Archivo '{csv_file}' leído. {len(df)} filas encontradas.")
-                
-                # Crear la tabla
-                if create_table_from_dataframe(cursor, df, table_name):
-                    # Insertar los datos
-                    insert_data_into_table(conn, cursor, df, table_name)
-
-            except pd.errors.EmptyDataError:
-                print(f"El archivo '{csv_file}' está vacío. Saltando.")
-            except FileNotFoundError:
-                print(f"Error: El archivo '{csv_file}' no se encontró. Verifica la ruta.")
-            except Exception as e:
-                print(f"Error inesperado al procesar el archivo '{csv_file}': {e}")
-
-        # --- Agrega las claves primarias y foráneas después de cargar todos los datos ---
-        add_primary_keys(conn, cursor)
-        add_foreign_keys(conn, cursor)
+        # --- Agrega las claves primarias, los índices y las claves foráneas que falten después de cargar todos los datos ---
+        # Los índices se crean antes que las FKs para que MySQL los reutilice en lugar de crear índices propios
+        with metricas.etapa("crea_db", "claves_primarias"):
+            add_primary_keys(conn, cursor)
+        with metricas.etapa("crea_db", "indices"):
+            indices.crear_indices(conn, cursor)
+        with metricas.etapa("crea_db", "claves_foraneas"):
+            add_foreign_keys(conn, cursor, validadas=validar_fks)
+        indices.verificar_planes_dashboard(cursor)
+        registrar_version_carga(conn, cursor)
+
+        # Las métricas de esta ejecución quedan disponibles para el panel "Pipeline" de Grafana
+        try:
+            metricas.guardar_en_mysql(conn, cursor)
+        except mysql.connector.Error as err:
+            print(f"No se pudieron guardar las métricas en la tabla '{metricas.TABLA_METRICAS}': {err}")
 
     finally:
         if conn:
@@ -281,4 +1087,14 @@ def main():
             print("\n\nConexión a la base de datos cerrada.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Crea las tablas de la base de datos y carga los CSV.")
+    parser.add_argument("--modo", choices=MODOS_CARGA, default=MODO_CARGA, help="Modo de carga de los CSV")
+    parser.add_argument("--tamano-lote", type=int, default=TAMANO_LOTE_INSERT, help="Filas por INSERT multi-fila")
+    parser.add_argument("--tamano-chunk", type=int, default=TAMANO_CHUNK, help="Filas por chunk en el modo streaming")
+    parser.add_argument("--workers", type=int, default=WORKERS_CARGA, help="Tablas cargadas en paralelo")
+    parser.add_argument("--incremental", action="store_true", help="Carga solo los CSV que cambiaron desde la última ejecución")
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=backends.BACKEND, help="Base de destino: mysql (Grafana) o una base embebida")
+    parser.add_argument("--db-path", default=None, help="Archivo de la base embebida (por defecto, ../data_medical.<backend>)")
+    parser.add_argument("--sin-validar-fks", action="store_true", help="No valida la integridad referencial de los archivos antes de cargar")
+    args = parser.parse_args()
+    main(args.modo, args.tamano_lote, args.tamano_chunk, args.workers, args.incremental, args.backend, args.db_path, not args.sin_validar_fks)
\ No newline at end of file
@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import time
+import hashlib
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+import esquema
+import rollups
+import tipos
+from crea_db import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME, TABLA_METADATOS
+
+# --- Acceso a datos para el notebook de análisis ---
+# Un único engine de SQLAlchemy con pool de conexiones para toda la sesión, lecturas por chunks con solo
+# las columnas y filas pedidas (el filtro se resuelve en MySQL), y DataFrames con los tipos de tipos.py.
+# Los resultados se guardan en una caché en disco cuya clave incluye la consulta y la versión de cada
+# tabla consultada: después de una recarga la versión cambia y la consulta se vuelve a ejecutar.
+DATABASE_URL = f"mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+TAMANO_POOL = 5
+TAMANO_CHUNK_LECTURA = 50000 # Filas por chunk al leer resultados grandes
+
+# --- Configuración de la caché ---
+CARPETA_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, ".cache", "consultas")
+TAMANO_MAXIMO_CACHE_MB = 512 # Al superarlo se borran los resultados usados hace más tiempo (LRU)
+
+# Columnas de texto sin tipo en tipos.py con menos valores distintos que esta fracción de las filas se convierten a category
+FRACCION_CATEGORICA = 0.5
+
+_engine = None
+
+def get_engine():
+    """Devuelve el engine de SQLAlchemy de la sesión (se crea una sola vez y reutiliza sus conexiones)."""
+    global _engine
+    if _engine is None:
+        # pool_pre_ping: descarta conexiones cortadas (ej. si se reinició el contenedor) antes de usarlas
+        _engine = create_engine(DATABASE_URL, pool_size=TAMANO_POOL, pool_pre_ping=True, pool_recycle=3600)
+    return _engine
+
+# --- Tipos compactos ---
+def compactar_chunk(df, dtypes):
+    """Convierte las columnas numéricas de un chunk a los tipos de tipos.py por nombre de columna, para que todos
+    los chunks de una consulta queden con los mismos tipos y se puedan concatenar sin volver a convertir."""
+    for columna in df.columns:
+        serie = df[columna]
+        if serie.dtype == object:
+            # Las columnas DECIMAL llegan como objetos Decimal: pasarlas a float (las de texto quedan igual)
+            try:
+                serie = df[columna] = pd.to_numeric(serie)
+            except (ValueError, TypeError):
+                pass
+        dtype = dtypes.get(columna, "")
+        if dtype.startswith("datetime") and not pd.api.types.is_datetime64_any_dtype(serie):
+            df[columna] = pd.to_datetime(serie).astype(dtype) # Las columnas DATE llegan como objetos date (o texto)
+            continue
+        # Los enteros con NULL (ej. por un LEFT JOIN) llegan como float y se dejan así
+        if (dtype.startswith("uint") and pd.api.types.is_integer_dtype(serie)) or (dtype.startswith("float") and pd.api.types.is_float_dtype(serie)):
+            df[columna] = serie.astype(dtype)
+    return df
+
+def compactar(df, dtypes):
+    """Ajusta los tipos de un DataFrame completo. El texto toma su tipo de tipos.py (category o string) después de
+    concatenar los chunks, para que todos compartan las mismas categorías. El resto de los enteros se reduce
+    al tipo más chico y el texto repetido que no está en tipos.py pasa a category."""
+    for columna in df.columns:
+        serie = df[columna]
+        if dtypes.get(columna) in ("category", "string") and (serie.dtype == object or isinstance(serie.dtype, pd.StringDtype)):
+            df[columna] = serie.astype(dtypes[columna])
+        elif str(serie.dtype) == "int64" and len(serie):
+            df[columna] = pd.to_numeric(serie, downcast="unsigned" if serie.min() >= 0 else "integer")
+        elif (serie.dtype == object or isinstance(serie.dtype, pd.StringDtype)) and len(serie) and serie.nunique() < FRACCION_CATEGORICA * len(serie):
+            df[columna] = serie.astype("category")
+    return df
+
+# --- Versión de las tablas ---
+def tablas_de_consulta(sql):
+    """Devuelve las tablas conocidas (esquema.py y rollups) que aparecen en una consulta."""
+    conocidas = list(esquema.TABLAS) + list(rollups.ROLLUPS)
+    return sorted(tabla for tabla in conocidas if re.search(rf"\b{tabla}\b", sql, re.IGNORECASE))
+
+def versiones_tablas(conn, tablas):
+    """Devuelve { tabla: versión } combinando el hash del último CSV cargado (carga_metadatos) y la hora
+    de la última modificación de la tabla en MySQL. Cualquier recarga cambia la versión."""
+    if not tablas:
+        return {}
+    marcadores = ", ".join(f":t{i}" for i in range(len(tablas)))
+    parametros = {f"t{i}": tabla for i, tabla in enumerate(tablas)}
+    # Sin esto MySQL 8 devuelve UPDATE_TIME desde una caché de estadísticas (24 h por defecto)
+    conn.execute(text("SET SESSION information_schema_stats_expiry = 0"))
+    versiones = {tabla: "" for tabla in tablas}
+    filas = conn.execute(text(
+        f"SELECT TABLE_NAME, UPDATE_TIME, CREATE_TIME FROM INFORMATION_SCHEMA.TABLES "
+        f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({marcadores})"
+    ), parametros)
+    for tabla, actualizada, creada in filas:
+        versiones[tabla] = f"{creada}|{actualizada}"
+    try:
+        filas = conn.execute(text(f"SELECT `tabla`, `hash`, `actualizado` FROM `{TABLA_METADATOS}` WHERE `tabla` IN ({marcadores})"), parametros)
+        for tabla, hash_csv, actualizado in filas:
+            versiones[tabla] += f"|{hash_csv}|{actualizado}"
+    except SQLAlchemyError: # Todavía no hubo cargas incrementales
+        conn.rollback()
+    return versiones
+
+# --- Caché en disco (LRU) ---
+def clave_cache(sql, parametros, versiones):
+    """Devuelve la clave de caché de una consulta: su texto, sus parámetros y la versión de sus tablas."""
+    contenido = json.dumps({"sql": " ".join(sql.split()), "parametros": parametros, "versiones": versiones}, sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+def leer_cache(clave):
+    """Devuelve el DataFrame guardado con esa clave (o None). Marca el archivo como usado recientemente."""
+    ruta = os.path.join(CARPETA_CACHE, f"{clave}.pkl")
+    if not os.path.exists(ruta):
+        return None
+    os.utime(ruta) # La fecha de modificación es la de último uso para el LRU
+    return pd.read_pickle(ruta)
+
+def guardar_cache(clave, df, tamano_maximo_mb=TAMANO_MAXIMO_CACHE_MB):
+    """Guarda un DataFrame en la caché y borra los resultados usados hace más tiempo si se supera el tamaño máximo."""
+    os.makedirs(CARPETA_CACHE, exist_ok=True)
+    ruta = os.path.join(CARPETA_CACHE, f"{clave}.pkl")
+    temporal = f"{ruta}.tmp"
+    df.to_pickle(temporal) # pickle conserva los tipos compactos (uint, category)
+    os.replace(temporal, ruta)
+
+    archivos = [os.path.join(CARPETA_CACHE, f) for f in os.listdir(CARPETA_CACHE) if f.endswith(".pkl")]
+    archivos.sort(key=os.path.getmtime)
+    total = sum(os.path.getsize(archivo) for archivo in archivos)
+    while archivos and total > tamano_maximo_mb * 1024 * 1024:
+        archivo = archivos.pop(0)
+        total -= os.path.getsize(archivo)
+        os.remove(archivo)
+
+def limpiar_cache():
+    """Borra todos los resultados guardados en la caché."""
+    if os.path.isdir(CARPETA_CACHE):
+        for archivo in os.listdir(CARPETA_CACHE):
+            os.remove(os.path.join(CARPETA_CACHE, archivo))
+
+# --- Consultas ---
+def consultar(sql, parametros=None, usar_cache=True, tamano_chunk=TAMANO_CHUNK_LECTURA):
+    """Ejecuta una consulta SELECT y devuelve un DataFrame con tipos compactos.
+    parametros usa la sintaxis de SQLAlchemy (ej. "WHERE edad > :edad", {"edad": 40})."""
+    parametros = parametros or {}
+    inicio = time.perf_counter()
+    with get_engine().connect() as conn:
+        clave = None
+        if usar_cache:
+            clave = clave_cache(sql, parametros, versiones_tablas(conn, tablas_de_consulta(sql)))
+            df = leer_cache(clave)
+            if df is not None:
+                print(f"{len(df)} filas leídas de la caché en {time.perf_counter() - inicio:.3f} s.")
+                return df
+
+        # Leer por chunks y compactar cada uno para no tener el resultado completo con tipos de 64 bits en memoria
+        dtypes = tipos.dtypes_columnas(tablas_de_consulta(sql))
+        chunks = [compactar_chunk(chunk, dtypes) for chunk in pd.read_sql(text(sql), conn, params=parametros, chunksize=tamano_chunk)]
+    df = compactar(pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(), dtypes)
+    print(f"{len(df)} filas leídas de MySQL en {time.perf_counter() - inicio:.3f} s ({df.memory_usage(deep=True).sum() / 1024 / 1024:.1f} MB).")
+
+    if clave:
+        guardar_cache(clave, df)
+    return df
+
+def leer_tabla(tabla, columnas=None, filtros=None, usar_cache=True, tamano_chunk=TAMANO_CHUNK_LECTURA):
+    """Lee una tabla pidiendo a MySQL solo las columnas y filas necesarias.
+    filtros: { columna: valor } para igualdad, { columna: [valores] } para IN,
+             o { columna: ("operador", valor) } con operador en =, !=, <, <=, >, >=.
+    Ej.: leer_tabla("metabolico", ["paciente_id", "imc"], {"edad": (">=", 40)})"""
+    permitidas = esquema.columnas_tabla(tabla) if tabla in esquema.TABLAS else None
+    columnas = list(columnas or [])
+    for columna in columnas + list(filtros or {}):
+        if permitidas is not None and columna not in permitidas:
+            raise ValueError(f"La columna '{columna}' no existe en la tabla '{tabla}'.")
+
+    condiciones, parametros = [], {}
+    for i, (columna, valor) in enumerate((filtros or {}).items()):
+        if isinstance(valor, (list, set)):
+            nombres = [f"p{i}_{j}" for j in range(len(valor))]
+            condiciones.append(f"`{columna}` IN ({', '.join(f':{nombre}' for nombre in nombres)})")
+            parametros.update(zip(nombres, valor))
+            continue
+        operador, valor = valor if isinstance(valor, tuple) else ("=", valor)
+        if operador not in ("=", "!=", "<", "<=", ">", ">="):
+            raise ValueError(f"Operador no permitido: '{operador}'.")
+        condiciones.append(f"`{columna}` {operador} :p{i}")
+        parametros[f"p{i}"] = valor
+
+    sql = f"SELECT {', '.join(f'`{col}`' for col in columnas) if columnas else '*'} FROM `{tabla}`"
+    if condiciones:
+        sql += " WHERE " + " AND ".join(condiciones)
+    return consultar(sql, parametros, usar_cache, tamano_chunk)
@@ -0,0 +1,105 @@
+# --- Esquema declarativo de la base de datos data_medical ---
+# Cada tabla se declara una sola vez con los tipos más compactos que admite su dominio y con su
+# clave primaria incluida en el CREATE TABLE. Así no hace falta un ALTER TABLE ... ADD PRIMARY KEY
+# después de la carga (que en InnoDB reconstruye la tabla completa).
+# Formato: { "nombre_tabla": {"columnas": [("nombre_columna", "TIPO_MYSQL"), ...], "pk": ["columna", ...] o None} }
+# Con "pk_diferida": True la clave primaria no se declara en el CREATE TABLE: la crea la etapa de índices
+# (indices.py) después de la carga masiva, junto con los índices secundarios de la tabla.
+# Los tipos de las columnas de claves foráneas deben coincidir exactamente con los de la tabla referenciada.
+# Con "particiones": {"columna": ..., "desde": "AAAA-MM", "meses": N} la tabla se particiona por RANGE
+# con una partición por mes (más una última para las fechas posteriores). Las consultas que filtran por
+# fecha solo leen las particiones de ese rango. InnoDB no admite claves foráneas en tablas particionadas
+# y exige que la clave primaria incluya la columna de la partición.
+TABLAS = {
+    "pacientes": {
+        "columnas": [
+            ("paciente_id", "INT UNSIGNED NOT NULL"), # Hasta ~4.000 millones de pacientes
+            ("name", "VARCHAR(100)")
+        ],
+        "pk": ["paciente_id"]
+    },
+    "profesionales": {
+        "columnas": [
+            ("profesionales_id", "SMALLINT UNSIGNED NOT NULL"),
+            ("name", "VARCHAR(100)")
+        ],
+        "pk": ["profesionales_id"]
+    },
+    "diagnosticos": {
+        "columnas": [
+            ("diagnostico_id", "TINYINT UNSIGNED NOT NULL"),
+            ("name", "VARCHAR(50)")
+        ],
+        "pk": ["diagnostico_id"]
+    },
+    "medicacion": {
+        "columnas": [
+            ("medicacion_id", "SMALLINT UNSIGNED NOT NULL"),
+            ("droga", "VARCHAR(50)"),
+            ("tipo", "VARCHAR(20)")
+        ],
+        "pk": ["medicacion_id"]
+    },
+    "tratamientos": {
+        "columnas": [
+            ("paciente_id", "INT UNSIGNED NOT NULL"),
+            ("medicacion_id", "SMALLINT UNSIGNED NOT NULL"),
+            ("profesionales_id", "SMALLINT UNSIGNED NOT NULL"),
+            ("diagnostico_id", "TINYINT UNSIGNED NOT NULL")
+        ],
+        "pk": ["paciente_id", "medicacion_id"],
+        "pk_diferida": True # Tabla de hechos: la PK compuesta se construye después de cargar los datos
+    },
+    "metabolico": {
+        "columnas": [
+            ("paciente_id", "INT UNSIGNED NOT NULL"),
+            ("edad", "TINYINT UNSIGNED"),   # 0-255 años
+            ("peso", "DECIMAL(4,1)"),       # Hasta 999.9 kg con un decimal, como se generan
+            ("imc", "DECIMAL(4,1)")
+        ],
+        "pk": ["paciente_id"]
+    },
+    "visitas": {
+        "columnas": [
+            ("paciente_id", "INT UNSIGNED NOT NULL"),
+            ("fecha", "DATE NOT NULL"),
+            ("peso", "DECIMAL(4,1)"),
+            ("imc", "DECIMAL(4,1)")
+        ],
+        "pk": ["paciente_id", "fecha"],
+        "pk_diferida": True, # Es la tabla de hechos más grande: la PK se construye después de la carga
+        "particiones": {"columna": "fecha", "desde": "2024-01", "meses": 36} # Cubre el seguimiento de crea_csv.py
+    }
+}
+
+def columnas_tabla(tabla):
+    """Devuelve los nombres de las columnas declaradas para una tabla."""
+    return [nombre for nombre, _ in TABLAS[tabla]["columnas"]]
+
+def particiones_sql(tabla):
+    """Devuelve la cláusula PARTITION BY RANGE COLUMNS de una tabla particionada por mes (o "" si no lo está)."""
+    particiones = TABLAS[tabla].get("particiones")
+    if not particiones:
+        return ""
+    anio, mes = (int(parte) for parte in particiones["desde"].split("-"))
+    definiciones = []
+    for _ in range(particiones["meses"]):
+        siguiente_anio, siguiente_mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+        definiciones.append(f"PARTITION p{anio}{mes:02d} VALUES LESS THAN ('{siguiente_anio}-{siguiente_mes:02d}-01')")
+        anio, mes = siguiente_anio, siguiente_mes
+    definiciones.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return f" PARTITION BY RANGE COLUMNS(`{particiones['columna']}`) ({', '.join(definiciones)})"
+
+def create_table_sql(tabla, temporal_como=None, restricciones=None):
+    """Devuelve la sentencia CREATE TABLE de una tabla declarada, con su clave primaria incluida.
+    restricciones son cláusulas extra de la tabla (ej. las CONSTRAINT ... FOREIGN KEY que arma crea_db.py).
+    Con temporal_como se crea una tabla temporal con ese nombre, con la PK y sin particiones ni restricciones
+    (MySQL no admite tablas temporales particionadas)."""
+    definicion = TABLAS[tabla]
+    columnas_sql = [f"`{nombre}` {tipo}" for nombre, tipo in definicion["columnas"]]
+    if definicion["pk"] and (temporal_como or not definicion.get("pk_diferida")):
+        columnas_sql.append(f"PRIMARY KEY ({', '.join(f'`{col}`' for col in definicion['pk'])})")
+    if temporal_como:
+        return f"CREATE TEMPORARY TABLE `{temporal_como}` ({', '.join(columnas_sql)}) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+    columnas_sql.extend(restricciones or [])
+    return f"CREATE TABLE IF NOT EXISTS `{tabla}` ({', '.join(columnas_sql)}) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4{particiones_sql(tabla)}"
@@ -0,0 +1,109 @@
+import time
+import mysql.connector
+
+import esquema
+from consultas import CONSULTAS_DASHBOARD
+
+# --- Índices secundarios para las consultas del dashboard ---
+# Se crean después de la carga masiva (no antes), en un único ALTER TABLE por tabla, junto con las
+# claves primarias diferidas declaradas en esquema.py. Construir un índice sobre datos ya cargados
+# es mucho más rápido que mantenerlo fila a fila durante la carga.
+# Formato: { "nombre_tabla": [("nombre_indice", ["columna", ...]), ...] }
+INDICES = {
+    "tratamientos": [
+        # Pacientes por medicación (y antipsicóticos): cubre el JOIN con medicacion y el COUNT(DISTINCT paciente_id)
+        ("idx_tratamientos_medicacion_paciente", ["medicacion_id", "paciente_id"]),
+        # Diagnósticos por profesional: cubre el GROUP BY profesional/diagnóstico y el COUNT(DISTINCT paciente_id)
+        ("idx_tratamientos_profesional_diagnostico", ["profesionales_id", "diagnostico_id", "paciente_id"])
+    ],
+    "medicacion": [
+        # Filtrar por tipo de droga (ej. 'Antipsicotico') sin leer la tabla
+        ("idx_medicacion_tipo", ["tipo", "medicacion_id"])
+    ],
+    "metabolico": [
+        # Comparaciones metabólicas: índice cubriente más pequeño que la tabla (incluye paciente_id por ser PK)
+        ("idx_metabolico_edad_peso_imc", ["edad", "peso", "imc"])
+    ],
+    "visitas": [
+        # Paneles por ventana de tiempo: rango de fechas dentro de las particiones del período (cubriente)
+        ("idx_visitas_fecha_peso_imc", ["fecha", "peso", "imc"])
+    ]
+}
+
+# Un "full scan" sobre tablas con menos filas estimadas que este umbral (ej. tablas de dimensión) no se reporta
+UMBRAL_FILAS_SCAN = 1000
+
+def indices_existentes(cursor, tabla):
+    """Devuelve los nombres de los índices que ya tiene una tabla."""
+    cursor.execute(f"SHOW INDEX FROM `{tabla}`")
+    return {fila[2] for fila in cursor.fetchall()} # Columna Key_name
+
+def crear_indices(conn, cursor):
+    """Crea las claves primarias diferidas y los índices secundarios que todavía no existan."""
+    print("\n--- Creando Índices ---")
+    tablas_pk_diferida = [tabla for tabla, definicion in esquema.TABLAS.items() if definicion.get("pk_diferida")]
+
+    for tabla in dict.fromkeys(tablas_pk_diferida + list(INDICES)):
+        try:
+            existentes = indices_existentes(cursor, tabla)
+        except mysql.connector.Error as err:
+            print(f"No se pudieron leer los índices de la tabla '{tabla}': {err}. Saltando.")
+            continue
+
+        clausulas = []
+        if tabla in tablas_pk_diferida and "PRIMARY" not in existentes:
+            columnas_pk = ", ".join(f"`{col}`" for col in esquema.TABLAS[tabla]["pk"])
+            clausulas.append(f"ADD PRIMARY KEY ({columnas_pk})")
+        for nombre, columnas in INDICES.get(tabla, []):
+            if nombre not in existentes:
+                clausulas.append(f"ADD INDEX `{nombre}` ({', '.join(f'`{col}`' for col in columnas)})")
+
+        if not clausulas:
+            print(f"La tabla '{tabla}' ya tiene todos sus índices. Saltando.")
+            continue
+
+        # Un único ALTER TABLE por tabla para que InnoDB la recorra una sola vez
+        alter_table_query = f"ALTER TABLE `{tabla}` {', '.join(clausulas)}"
+        print(f"Creando índices en '{tabla}': {alter_table_query}")
+        inicio = time.perf_counter()
+        try:
+            cursor.execute(alter_table_query)
+            conn.commit()
+            print(f"Índices creados en '{tabla}' en {time.perf_counter() - inicio:.2f} s.")
+        except mysql.connector.Error as err:
+            if err.errno == 1062: # Error 1062: Duplicate entry
+                print(f"Error: La tabla '{tabla}' tiene filas duplicadas para su clave primaria. Error: {err}")
+            else:
+                print(f"Error al crear los índices de '{tabla}': {err}")
+
+def verificar_planes_dashboard(cursor):
+    """Ejecuta EXPLAIN sobre las consultas del dashboard y reporta las que todavía leen tablas completas."""
+    print("\n--- Verificando Planes de Ejecución del Dashboard ---")
+    consultas_con_scan = {}
+    for nombre, consulta in CONSULTAS_DASHBOARD.items():
+        try:
+            cursor.execute(f"EXPLAIN {consulta}")
+            columnas = [descripcion[0] for descripcion in cursor.description]
+            plan = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+        except mysql.connector.Error as err:
+            print(f"No se pudo obtener el plan de la consulta '{nombre}': {err}")
+            continue
+
+        # type = ALL indica un full scan; se ignoran las tablas derivadas (<derivedN>) y las tablas pequeñas
+        scans = [
+            (paso["table"], paso["rows"]) for paso in plan
+            if paso["type"] == "ALL" and not str(paso["table"]).startswith("<") and (paso["rows"] or 0) >= UMBRAL_FILAS_SCAN
+        ]
+        # Tablas particionadas: informar cuántas particiones lee la consulta (poda de particiones)
+        for paso in plan:
+            if paso.get("partitions"):
+                particiones = paso["partitions"].split(",")
+                print(f"La consulta '{nombre}' lee {len(particiones)} particiones de '{paso['table']}' ({particiones[0]} a {particiones[-1]}).")
+
+        if scans:
+            consultas_con_scan[nombre] = scans
+            detalle = ", ".join(f"'{tabla}' (~{filas} filas)" for tabla, filas in scans)
+            print(f"Advertencia: La consulta '{nombre}' hace un full scan sobre {detalle}.")
+        else:
+            print(f"La consulta '{nombre}' usa índices.")
+    return consultas_con_scan
@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+# --- Instrumentación del pipeline ---
+# Cada etapa medida (con etapa()) genera un registro con su duración, filas, filas/s, memoria,
+# round-trips a la base de datos y commits. Los registros se agregan como una línea JSON en
+# RUTA_LOG_METRICAS y se pueden guardar en la tabla TABLA_METRICAS de MySQL, que lee el panel
+# "Pipeline" de Grafana (grafana/dashboards/pipeline_metrics.json).
+# La ruta es relativa a este archivo para que app.py y sus subprocesos escriban en el mismo log.
+# Se puede cambiar con la variable de entorno VARIABLE_RUTA_LOG (benchmark.py escribe en su propio log)
+VARIABLE_RUTA_LOG = "PIPELINE_METRICAS_LOG"
+RUTA_LOG_METRICAS = os.environ.get(VARIABLE_RUTA_LOG) or os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "logs", "pipeline_metrics.jsonl")
+TABLA_METRICAS = "pipeline_metrics"
+# app.py comparte el identificador de la ejecución con crea_csv.py y crea_db.py mediante esta variable de entorno
+VARIABLE_EJECUCION = "PIPELINE_EJECUCION_ID"
+
+# Contadores de la base de datos: totales del proceso y por hilo (las tablas se cargan en hilos en paralelo)
+CONTADORES = {"round_trips": 0, "commits": 0}
+_contadores_hilo = threading.local()
+_lock = threading.Lock()
+
+# Registros de las etapas medidas en este proceso
+REGISTROS = []
+
+def id_ejecucion():
+    """Devuelve el identificador de la ejecución actual (lo crea y lo exporta a los subprocesos si no existe)."""
+    if VARIABLE_EJECUCION not in os.environ:
+        os.environ[VARIABLE_EJECUCION] = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+    return os.environ[VARIABLE_EJECUCION]
+
+def rss_pico_mb():
+    """Devuelve el pico de memoria residente (RSS) del proceso actual en MB, desde que empezó el proceso.
+    El sistema no permite reiniciarlo: para una etapa solo se puede medir cuánto lo aumentó."""
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024 # macOS: bytes, Linux: KB
+    except ImportError: # Windows
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+
+def contar(contador, cantidad=1):
+    """Suma al contador indicado del proceso y del hilo actual."""
+    with _lock:
+        CONTADORES[contador] += cantidad
+    por_hilo = getattr(_contadores_hilo, "valores", None)
+    if por_hilo is None:
+        por_hilo = _contadores_hilo.valores = dict.fromkeys(CONTADORES, 0)
+    por_hilo[contador] += cantidad
+
+def contadores_actuales(solo_hilo=False):
+    """Devuelve una copia de los contadores del proceso (o solo los del hilo actual)."""
+    if solo_hilo:
+        return dict(getattr(_contadores_hilo, "valores", None) or dict.fromkeys(CONTADORES, 0))
+    with _lock:
+        return dict(CONTADORES)
+
+# --- Conexiones instrumentadas ---
+# Envuelven una conexión (o pool) de mysql.connector y cuentan cada execute/commit/rollback como un round-trip.
+class CursorInstrumentado:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        contar("round_trips")
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        contar("round_trips")
+        return self._cursor.executemany(*args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+class ConexionInstrumentada:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return CursorInstrumentado(self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        contar("round_trips")
+        contar("commits")
+        return self._conn.commit()
+
+    def rollback(self):
+        contar("round_trips")
+        return self._conn.rollback()
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+class PoolInstrumentado:
+    def __init__(self, pool):
+        self._pool = pool
+
+    def get_connection(self):
+        return ConexionInstrumentada(self._pool.get_connection())
+
+    def __getattr__(self, nombre):
+        return getattr(self._pool, nombre)
+
+# --- Registro de etapas ---
+def registrar(registro, ruta=RUTA_LOG_METRICAS):
+    """Guarda un registro en memoria y lo agrega como una línea JSON al log de métricas."""
+    REGISTROS.append(registro)
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        with open(ruta, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+    except OSError as err:
+        print(f"No se pudo escribir el log de métricas '{ruta}': {err}")
+
+def registrar_duracion(componente, nombre, inicio, segundos, filas=None):
+    """Registra una etapa medida por fuera de etapa() (ej. un subproceso), a partir de su inicio (datetime) y duración."""
+    registrar({
+        "ejecucion_id": id_ejecucion(),
+        "componente": componente,
+        "etapa": nombre,
+        "inicio": inicio.isoformat(timespec="milliseconds"),
+        "filas": filas,
+        "segundos": round(segundos, 4),
+        "filas_por_segundo": round(filas / max(segundos, 1e-9), 1) if filas is not None else None,
+        "rss_pico_mb": None,
+        "rss_incremento_mb": None,
+        "round_trips": 0,
+        "commits": 0
+    })
+
+@contextmanager
+def etapa(componente, nombre, solo_hilo=False):
+    """Mide una etapa del pipeline. Devuelve un diccionario en el que la etapa puede anotar sus 'filas'.
+    Con solo_hilo=True los round-trips y commits son solo los del hilo actual (etapas que corren en paralelo).
+    rss_pico_mb es el pico acumulado del proceso al terminar la etapa (incluye el de las etapas anteriores);
+    rss_incremento_mb es cuánto lo aumentó esta etapa (0 si usó menos memoria que el pico anterior)."""
+    registro = {
+        "ejecucion_id": id_ejecucion(),
+        "componente": componente,
+        "etapa": nombre,
+        "inicio": datetime.now().isoformat(timespec="milliseconds"),
+        "filas": None
+    }
+    contadores_inicio = contadores_actuales(solo_hilo)
+    rss_inicio = rss_pico_mb()
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        segundos = time.perf_counter() - inicio
+        contadores_fin = contadores_actuales(solo_hilo)
+        registro["segundos"] = round(segundos, 4)
+        registro["filas_por_segundo"] = round(registro["filas"] / max(segundos, 1e-9), 1) if registro["filas"] is not None else None
+        rss_fin = rss_pico_mb()
+        registro["rss_pico_mb"] = round(rss_fin, 1)
+        registro["rss_incremento_mb"] = round(rss_fin - rss_inicio, 1)
+        for contador in CONTADORES:
+            registro[contador] = contadores_fin[contador] - contadores_inicio[contador]
+        registrar(registro)
+
+def leer_log(ejecucion_id, componentes=None, ruta=RUTA_LOG_METRICAS):
+    """Devuelve los registros del log de una ejecución (opcionalmente solo de algunos componentes)."""
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, encoding="utf-8") as f:
+        registros = [json.loads(linea) for linea in f if linea.strip()]
+    return [r for r in registros if r["ejecucion_id"] == ejecucion_id and (componentes is None or r["componente"] in componentes)]
+
+def crear_tabla_metricas(cursor):
+    """Crea (si no existe) la tabla de métricas del pipeline."""
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS `{TABLA_METRICAS}` (
+        `id` BIGINT UNSIGNED AUTO_INCREMENT PRIMARY KEY,
+        `ejecucion_id` VARCHAR(32) NOT NULL,
+        `componente` VARCHAR(20) NOT NULL,
+        `etapa` VARCHAR(64) NOT NULL,
+        `inicio` DATETIME(3) NOT NULL,
+        `segundos` DOUBLE NOT NULL,
+        `filas` BIGINT UNSIGNED,
+        `filas_por_segundo` DOUBLE,
+        `rss_pico_mb` DOUBLE,
+        `rss_incremento_mb` DOUBLE,
+        `round_trips` INT UNSIGNED NOT NULL,
+        `commits` INT UNSIGNED NOT NULL,
+        KEY `idx_pipeline_metrics_inicio` (`inicio`),
+        KEY `idx_pipeline_metrics_ejecucion` (`ejecucion_id`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+    # Tablas creadas antes de que existiera rss_incremento_mb
+    cursor.execute(
+        "SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'rss_incremento_mb'",
+        (TABLA_METRICAS,)
+    )
+    if not cursor.fetchone()[0]:
+        cursor.execute(f"ALTER TABLE `{TABLA_METRICAS}` ADD COLUMN `rss_incremento_mb` DOUBLE AFTER `rss_pico_mb`")
+
+def guardar_en_mysql(conn, cursor, registros=None):
+    """Inserta registros de métricas (por defecto, los de este proceso) en la tabla de métricas."""
+    registros = REGISTROS if registros is None else registros
+    if not registros:
+        return
+    columnas = ["ejecucion_id", "componente", "etapa", "inicio", "segundos", "filas", "filas_por_segundo",
+                "rss_pico_mb", "rss_incremento_mb", "round_trips", "commits"]
+    crear_tabla_metricas(cursor)
+    fila_placeholders = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+    valores = [registro.get(col) for registro in registros for col in columnas] # Logs anteriores: sin rss_incremento_mb
+    cursor.execute(
+        f"INSERT INTO `{TABLA_METRICAS}` ({', '.join(f'`{col}`' for col in columnas)}) VALUES {', '.join([fila_placeholders] * len(registros))}",
+        valores
+    )
+    conn.commit()
+    print(f"{len(registros)} métricas guardadas en la tabla '{TABLA_METRICAS}'.")
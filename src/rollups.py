@@ -0,0 +1,176 @@
+import time
+import mysql.connector
+
+# --- Tablas de resumen (rollups) para los paneles de Grafana ---
+# Los paneles leen estas tablas pre-calculadas (unos cientos de filas) en lugar de agrupar la tabla
+# de hechos tratamientos en cada refresco. Cuando llegan filas nuevas solo se recalculan los grupos
+# afectados (las medicaciones, profesionales/diagnósticos o franjas de edad de esos pacientes).
+# Formato: { "tabla_rollup": {
+#     "grupo": tipo de grupo que la afecta (ver grupos_de_pacientes),
+#     "columnas": definición de columnas para el CREATE TABLE,
+#     "clave": columnas del rollup que identifican un grupo,
+#     "expresion": expresión del SELECT que calcula esa clave (para filtrar por grupo),
+#     "select": consulta que calcula el rollup; {filtro} se reemplaza por el WHERE de los grupos a refrescar } }
+ROLLUPS = {
+    "rollup_pacientes_medicacion": {
+        "grupo": "medicacion",
+        "columnas": "`medicacion_id` SMALLINT UNSIGNED NOT NULL, `droga` VARCHAR(50), `tipo` VARCHAR(20), "
+                    "`pacientes` INT UNSIGNED NOT NULL, PRIMARY KEY (`medicacion_id`)",
+        "clave": "`medicacion_id`",
+        "expresion": "m.medicacion_id",
+        "select": """
+            SELECT m.medicacion_id, m.droga, m.tipo, COUNT(DISTINCT t.paciente_id)
+            FROM medicacion m
+            JOIN tratamientos t ON t.medicacion_id = m.medicacion_id
+            {filtro}
+            GROUP BY m.medicacion_id, m.droga, m.tipo
+        """
+    },
+    "rollup_pacientes_tipo": {
+        "grupo": "tipo",
+        "columnas": "`tipo` VARCHAR(20) NOT NULL, `pacientes` INT UNSIGNED NOT NULL, PRIMARY KEY (`tipo`)",
+        "clave": "`tipo`",
+        "expresion": "m.tipo",
+        "select": """
+            SELECT m.tipo, COUNT(DISTINCT t.paciente_id)
+            FROM medicacion m
+            JOIN tratamientos t ON t.medicacion_id = m.medicacion_id
+            {filtro}
+            GROUP BY m.tipo
+        """
+    },
+    "rollup_diagnostico_profesional": {
+        "grupo": "diagnostico_profesional",
+        "columnas": "`profesionales_id` SMALLINT UNSIGNED NOT NULL, `diagnostico_id` TINYINT UNSIGNED NOT NULL, "
+                    "`profesional` VARCHAR(100), `diagnostico` VARCHAR(50), `pacientes` INT UNSIGNED NOT NULL, "
+                    "PRIMARY KEY (`profesionales_id`, `diagnostico_id`)",
+        "clave": "(`profesionales_id`, `diagnostico_id`)",
+        "expresion": "(t.profesionales_id, t.diagnostico_id)",
+        "select": """
+            SELECT t.profesionales_id, t.diagnostico_id, p.name, d.name, COUNT(DISTINCT t.paciente_id)
+            FROM tratamientos t
+            JOIN profesionales p ON p.profesionales_id = t.profesionales_id
+            JOIN diagnosticos d ON d.diagnostico_id = t.diagnostico_id
+            {filtro}
+            GROUP BY t.profesionales_id, t.diagnostico_id, p.name, d.name
+        """
+    },
+    "rollup_metabolico_edad": {
+        "grupo": "franja_edad",
+        "columnas": "`franja_edad` VARCHAR(7) NOT NULL, `toma_antipsicotico` TINYINT(1) NOT NULL, "
+                    "`pacientes` INT UNSIGNED NOT NULL, `peso_promedio` DECIMAL(5,2), `imc_promedio` DECIMAL(5,2), "
+                    "PRIMARY KEY (`franja_edad`, `toma_antipsicotico`)",
+        "clave": "`franja_edad`",
+        "expresion": "CONCAT(FLOOR(me.edad / 10) * 10, '-', FLOOR(me.edad / 10) * 10 + 9)",
+        "select": """
+            SELECT CONCAT(FLOOR(me.edad / 10) * 10, '-', FLOOR(me.edad / 10) * 10 + 9) AS franja_edad,
+                   ap.paciente_id IS NOT NULL AS toma_antipsicotico,
+                   COUNT(*), AVG(me.peso), AVG(me.imc)
+            FROM metabolico me
+            LEFT JOIN (
+                SELECT DISTINCT t.paciente_id
+                FROM tratamientos t
+                JOIN medicacion m ON m.medicacion_id = t.medicacion_id
+                WHERE m.tipo = 'Antipsicotico'
+            ) ap ON ap.paciente_id = me.paciente_id
+            {filtro}
+            GROUP BY franja_edad, toma_antipsicotico
+        """
+    }
+}
+
+# Tablas cuyas filas nuevas se pueden resolver refrescando solo los grupos de los pacientes afectados.
+# Un cambio en las tablas de dimensión (nombres, tipos de droga) requiere recalcular los rollups completos.
+TABLAS_HECHOS = ("tratamientos", "metabolico")
+TABLAS_DIMENSION = ("medicacion", "profesionales", "diagnosticos")
+
+# Tabla temporal (por conexión) con los paciente_id cuyas filas cambiaron
+TABLA_PACIENTES_AFECTADOS = "tmp_pacientes_afectados"
+
+# Consultas que obtienen, para los pacientes afectados, los grupos de cada tipo a los que pertenecen
+CONSULTAS_GRUPOS = {
+    "medicacion": f"""
+        SELECT DISTINCT t.medicacion_id FROM tratamientos t
+        JOIN `{TABLA_PACIENTES_AFECTADOS}` a ON a.paciente_id = t.paciente_id
+    """,
+    "tipo": f"""
+        SELECT DISTINCT m.tipo FROM tratamientos t
+        JOIN `{TABLA_PACIENTES_AFECTADOS}` a ON a.paciente_id = t.paciente_id
+        JOIN medicacion m ON m.medicacion_id = t.medicacion_id
+    """,
+    "diagnostico_profesional": f"""
+        SELECT DISTINCT t.profesionales_id, t.diagnostico_id FROM tratamientos t
+        JOIN `{TABLA_PACIENTES_AFECTADOS}` a ON a.paciente_id = t.paciente_id
+    """,
+    "franja_edad": f"""
+        SELECT DISTINCT CONCAT(FLOOR(me.edad / 10) * 10, '-', FLOOR(me.edad / 10) * 10 + 9) FROM metabolico me
+        JOIN `{TABLA_PACIENTES_AFECTADOS}` a ON a.paciente_id = me.paciente_id
+    """
+}
+
+def crear_tablas_rollup(cursor):
+    """Crea (si no existen) las tablas de rollup."""
+    for tabla, definicion in ROLLUPS.items():
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS `{tabla}` ({definicion['columnas']}) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4")
+
+def crear_tabla_pacientes_afectados(cursor):
+    """Crea (vacía) la tabla temporal donde se registran los pacientes cuyas filas cambiaron."""
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS `{TABLA_PACIENTES_AFECTADOS}`")
+    cursor.execute(f"CREATE TEMPORARY TABLE `{TABLA_PACIENTES_AFECTADOS}` (`paciente_id` INT UNSIGNED PRIMARY KEY)")
+
+def registrar_pacientes_afectados(cursor, paciente_ids):
+    """Agrega paciente_ids a la tabla temporal de pacientes afectados."""
+    paciente_ids = [int(paciente_id) for paciente_id in paciente_ids]
+    for desde in range(0, len(paciente_ids), 5000):
+        lote = paciente_ids[desde:desde + 5000]
+        cursor.execute(f"INSERT IGNORE INTO `{TABLA_PACIENTES_AFECTADOS}` (`paciente_id`) VALUES {', '.join(['(%s)'] * len(lote))}", lote)
+
+def grupos_de_pacientes(cursor):
+    """Devuelve, por tipo de grupo, el conjunto de grupos a los que pertenecen los pacientes afectados."""
+    grupos = {}
+    for grupo, consulta in CONSULTAS_GRUPOS.items():
+        cursor.execute(consulta)
+        grupos[grupo] = {fila if len(fila) > 1 else fila[0] for fila in cursor.fetchall()}
+    return grupos
+
+def unir_grupos(*lista_grupos):
+    """Une varios resultados de grupos_de_pacientes (por ejemplo, antes y después de aplicar cambios)."""
+    union = {}
+    for grupos in lista_grupos:
+        for grupo, valores in grupos.items():
+            union.setdefault(grupo, set()).update(valores)
+    return union
+
+def refrescar_rollups(conn, cursor, grupos=None):
+    """Recalcula las tablas de rollup. Con grupos=None las recalcula completas; si no, solo los grupos indicados."""
+    print("\n--- Refrescando Rollups ---")
+    crear_tablas_rollup(cursor)
+    inicio = time.perf_counter()
+    try:
+        for tabla, definicion in ROLLUPS.items():
+            if grupos is None:
+                cursor.execute(f"DELETE FROM `{tabla}`")
+                cursor.execute(f"INSERT INTO `{tabla}` {definicion['select'].format(filtro='')}")
+                print(f"Rollup '{tabla}' recalculado: {cursor.rowcount} filas.")
+                continue
+
+            valores = sorted(grupos.get(definicion["grupo"], ()))
+            if not valores:
+                continue
+            # Filtro "clave IN (...)"; las claves compuestas se comparan como tuplas: (a, b) IN ((%s, %s), ...)
+            if isinstance(valores[0], tuple):
+                marcador = "(" + ", ".join(["%s"] * len(valores[0])) + ")"
+                parametros = [valor for tupla in valores for valor in tupla]
+            else:
+                marcador = "%s"
+                parametros = list(valores)
+            lista = ", ".join([marcador] * len(valores))
+            cursor.execute(f"DELETE FROM `{tabla}` WHERE {definicion['clave']} IN ({lista})", parametros)
+            filtro = f"WHERE {definicion['expresion']} IN ({lista})"
+            cursor.execute(f"INSERT INTO `{tabla}` {definicion['select'].format(filtro=filtro)}", parametros)
+            print(f"Rollup '{tabla}': {len(valores)} grupos recalculados.")
+        conn.commit()
+        print(f"Rollups refrescados en {time.perf_counter() - inicio:.2f} s.")
+    except mysql.connector.Error as err:
+        conn.rollback()
+        print(f"Error al refrescar los rollups: {err}")
@@ -0,0 +1,285 @@
+import io
+import time
+import queue
+import argparse
+import threading
+import contextlib
+import numpy as np
+import pandas as pd
+import mysql.connector
+
+import crea_csv
+import crea_db
+import backends
+import metricas
+import rollups
+from crea_db import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+
+# --- Llegada continua de datos (prueba de carga) ---
+# crea_csv.py y crea_db.py hacen una carga única. Este modo simula la llegada continua de pacientes nuevos
+# (con sus tratamientos, datos metabólicos y visitas) a una tasa configurable y con las mismas reglas de
+# generación que crea_csv.py, mientras Grafana o api.py consultan la base.
+# Un hilo productor genera las llegadas y las deja en una cola acotada. Si el escritor no da abasto, la cola
+# se llena y el productor espera (contrapresión) en lugar de acumular datos sin límite en memoria.
+# El escritor junta las llegadas en microlotes y escribe cada uno en una sola transacción, en orden
+# padre -> hija. Escribe cuando el microlote llega a TAMANO_MICROLOTE pacientes o cuando la llegada más
+# antigua lleva LATENCIA_MAXIMA segundos esperando.
+# Al terminar informa la latencia de ingesta de punta a punta (de la generación al COMMIT) y el throughput sostenido.
+TASA_PACIENTES = 100 # Pacientes nuevos por segundo
+INTERVALO_LLEGADAS = 0.1 # Segundos entre tandas de llegadas del productor
+TAMANO_MICROLOTE = 1000 # Pacientes acumulados que fuerzan una escritura
+LATENCIA_MAXIMA = 0.5 # Segundos que puede esperar una llegada antes de forzar una escritura
+CAPACIDAD_COLA = 50 # Tandas de llegadas en cola antes de frenar al productor
+DURACION = 60 # Segundos de la prueba
+INTERVALO_REFRESCO = 5 # Segundos entre informes de progreso, refrescos de rollups y sellos de versión
+TABLAS_STREAM = ["pacientes", "tratamientos", "metabolico", "visitas"] # Orden de inserción (padre -> hija)
+# Los diagnósticos se toman de una bolsa mezclada con el reparto de crea_csv (34% / 27% / resto): con tandas
+# de pocos pacientes, repartir cada tanda por separado redondearía siempre hacia los mismos diagnósticos
+TAMANO_BOLSA_DIAGNOSTICOS = 10_000
+
+def consultar(conn, backend, sql):
+    """Ejecuta una consulta y devuelve sus filas (mysql.connector necesita un cursor; las bases embebidas no)."""
+    if backend != "mysql":
+        return conn.execute(sql).fetchall()
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    filas = cursor.fetchall()
+    cursor.close()
+    return filas
+
+def contexto_generacion(conn, backend, semilla):
+    """Lee de la base las tablas de dimensión y el último paciente_id, con lo que se generan las llegadas."""
+    profesionales_ids = np.array([fila[0] for fila in consultar(conn, backend, "SELECT profesionales_id FROM profesionales ORDER BY profesionales_id")], dtype=np.int32)
+    medicacion = consultar(conn, backend, "SELECT medicacion_id, tipo FROM medicacion ORDER BY medicacion_id")
+    return {
+        "profesionales_ids": profesionales_ids,
+        "medicacion_ids": np.array([fila[0] for fila in medicacion], dtype=np.int32),
+        "es_antipsicotico": np.array([fila[1] == "Antipsicotico" for fila in medicacion]),
+        # Los mismos profesionales pro-antipsicóticos que en la generación por shards de crea_csv
+        "es_pro_antips": crea_csv.seleccionar_pro_antipsicoticos(np.random.default_rng(semilla), len(profesionales_ids)),
+        "diagnostico_name_to_id": dict(consultar(conn, backend, "SELECT name, diagnostico_id FROM diagnosticos")),
+        "ultimo_paciente_id": int(consultar(conn, backend, "SELECT COALESCE(MAX(paciente_id), 0) FROM pacientes")[0][0])
+    }
+
+def generar_llegadas(rng, contexto, paciente_ids, diagnosticos):
+    """Genera las filas de un grupo de pacientes nuevos con las reglas de crea_csv. Devuelve { tabla: DataFrame }."""
+    primer_id = int(paciente_ids[0])
+    df_pacientes = crea_csv.tipar(pd.DataFrame({"paciente_id": paciente_ids, "name": crea_csv.generar_nombres(rng, len(paciente_ids))}), "Pacientes")
+    df_tratamientos = crea_csv.tratamientos_lote(
+        rng, paciente_ids, diagnosticos, contexto["profesionales_ids"], contexto["medicacion_ids"],
+        contexto["es_antipsicotico"], contexto["es_pro_antips"], contexto["diagnostico_name_to_id"]["Esquizofrenia"]
+    )
+    num_antipsicoticos = crea_csv.antipsicoticos_por_paciente(df_tratamientos, contexto["medicacion_ids"][contexto["es_antipsicotico"]],
+                                                               paciente_ids, primer_id=primer_id)
+    df_metabolico = crea_csv.metabolico_lote(rng, paciente_ids, num_antipsicoticos > 0)
+    df_visitas = crea_csv.visitas_lote(rng, paciente_ids, num_antipsicoticos, df_metabolico["peso"].to_numpy(), df_metabolico["imc"].to_numpy())
+    return dict(zip(TABLAS_STREAM, [df_pacientes, df_tratamientos, df_metabolico, df_visitas]))
+
+# --- Productor ---
+def producir(cola, detener, contexto, estado, tasa, intervalo, semilla):
+    """Genera tandas de pacientes nuevos a la tasa pedida y las pone en la cola. Se ejecuta en un hilo propio."""
+    # Generador propio en el espacio de los generadores derivados de crea_csv (no coincide con ningún shard)
+    rng = np.random.default_rng(np.random.SeedSequence([semilla, crea_csv.ESPACIO_DERIVADOS, crea_csv.CLAVES_RNG["stream"]]))
+    siguiente_id = contexto["ultimo_paciente_id"] + 1
+    bolsa = np.empty(0, dtype=np.int32)
+    acumulado = 0.0 # Pacientes fraccionarios pendientes (ej. 2.5 por tanda)
+    proxima = time.perf_counter()
+    try:
+        while not detener.is_set():
+            acumulado += tasa * intervalo
+            cantidad = int(acumulado)
+            acumulado -= cantidad
+            if cantidad:
+                if len(bolsa) < cantidad:
+                    bolsa = np.concatenate([bolsa, crea_csv.asignar_diagnosticos(rng, max(TAMANO_BOLSA_DIAGNOSTICOS, cantidad), contexto["diagnostico_name_to_id"])])
+                diagnosticos, bolsa = bolsa[:cantidad], bolsa[cantidad:]
+                paciente_ids = np.arange(siguiente_id, siguiente_id + cantidad, dtype=np.int32)
+                tanda = {"llegada": time.perf_counter(), "pacientes": cantidad, "tablas": generar_llegadas(rng, contexto, paciente_ids, diagnosticos)}
+                siguiente_id += cantidad
+                estado["generados"] += cantidad
+
+                inicio_espera = time.perf_counter()
+                while not detener.is_set():
+                    try:
+                        cola.put(tanda, timeout=intervalo) # Bloquea mientras la cola está llena (contrapresión)
+                        break
+                    except queue.Full:
+                        pass
+                estado["segundos_contrapresion"] += time.perf_counter() - inicio_espera
+            # Después de esperar por contrapresión no se "recuperan" las tandas atrasadas: la fuente se frena
+            proxima = max(proxima + intervalo, time.perf_counter())
+            time.sleep(max(0.0, proxima - time.perf_counter()))
+    except Exception as err:
+        print(f"Error al generar las llegadas: {err}")
+    finally:
+        # El escritor termina con el fin de las llegadas o al ver detener con la cola vacía: si el productor falla,
+        # la prueba termina en lugar de esperar para siempre
+        detener.set()
+        try:
+            cola.put(None, timeout=intervalo) # Fin de las llegadas
+        except queue.Full:
+            pass
+
+# --- Escritor ---
+def escribir_microlote(conn, cursor, backend, tandas, tamano_lote):
+    """Escribe varias tandas de llegadas en una sola transacción, en orden padre -> hija. Devuelve las filas escritas."""
+    filas = 0
+    try:
+        for tabla in TABLAS_STREAM:
+            df = crea_db.a_tipos_de_carga(pd.concat([tanda["tablas"][tabla] for tanda in tandas], ignore_index=True), tabla)
+            if backend == "mysql":
+                crea_db.insert_rows(cursor, df, tabla, tamano_lote)
+            else:
+                backends.insertar_chunk(conn, backend, df, tabla)
+            filas += len(df)
+        conn.commit()
+    except Exception: # mysql.connector.Error, sqlite3.Error o duckdb.Error: no queda un microlote a medias
+        conn.rollback()
+        raise
+    return filas
+
+def publicar(conn, cursor, backend, refrescar):
+    """Hace visibles las filas nuevas para los paneles: refresca los rollups de los pacientes nuevos (MySQL)
+    y escribe un sello de versión nuevo para que api.py descarte sus respuestas en caché."""
+    with contextlib.redirect_stdout(io.StringIO()): # Sin los mensajes de cada refresco entre los informes de progreso
+        if refrescar and backend == "mysql":
+            rollups.refrescar_rollups(conn, cursor, rollups.grupos_de_pacientes(cursor))
+            cursor.execute(f"DELETE FROM `{rollups.TABLA_PACIENTES_AFECTADOS}`")
+            conn.commit()
+        crea_db.registrar_version_carga(conn, cursor if backend == "mysql" else conn)
+
+def percentiles_ms(latencias):
+    """Devuelve la latencia p50, p95, p99 y máxima (en ms) de una lista de (segundos, pacientes)."""
+    if not latencias:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    segundos = np.repeat([latencia for latencia, _ in latencias], [pacientes for _, pacientes in latencias]) * 1000
+    return {"p50": float(np.percentile(segundos, 50)), "p95": float(np.percentile(segundos, 95)),
+            "p99": float(np.percentile(segundos, 99)), "max": float(segundos.max())}
+
+def escribir(cola, detener, conn, backend, estado, tamano_microlote, latencia_maxima, tamano_lote, refrescar, intervalo_refresco):
+    """Toma las tandas de la cola y las escribe por microlotes hasta recibir el fin de las llegadas
+    (o hasta que se pida detener y la cola esté vacía)."""
+    cursor = conn.cursor() if backend == "mysql" else None
+    if refrescar and backend == "mysql":
+        rollups.crear_tabla_pacientes_afectados(cursor)
+    inicio = time.perf_counter()
+    proximo_refresco = inicio + intervalo_refresco
+    pendientes, pacientes_pendientes, fin = [], 0, False
+    while not fin:
+        # Esperar una tanda nueva como máximo hasta que venza la latencia de la tanda pendiente más antigua
+        espera = latencia_maxima if not pendientes else max(0.0, pendientes[0]["llegada"] + latencia_maxima - time.perf_counter())
+        try:
+            tanda = cola.get(timeout=espera)
+            fin = tanda is None
+            if tanda:
+                pendientes.append(tanda)
+                pacientes_pendientes += tanda["pacientes"]
+        except queue.Empty:
+            fin = detener.is_set() and cola.empty()
+
+        vencida = pendientes and time.perf_counter() - pendientes[0]["llegada"] >= latencia_maxima
+        if pendientes and (fin or vencida or pacientes_pendientes >= tamano_microlote):
+            estado["filas"] += escribir_microlote(conn, cursor, backend, pendientes, tamano_lote)
+            confirmado = time.perf_counter()
+            estado["latencias"].extend((confirmado - tanda["llegada"], tanda["pacientes"]) for tanda in pendientes)
+            estado["escritos"] += pacientes_pendientes
+            estado["microlotes"] += 1
+            if refrescar and backend == "mysql":
+                rollups.registrar_pacientes_afectados(cursor, np.concatenate([tanda["tablas"]["pacientes"]["paciente_id"].to_numpy() for tanda in pendientes]))
+            pendientes, pacientes_pendientes = [], 0
+
+        if time.perf_counter() >= proximo_refresco or fin:
+            inicio_refresco = time.perf_counter()
+            publicar(conn, cursor, backend, refrescar)
+            estado["segundos_refresco"] += time.perf_counter() - inicio_refresco
+            proximo_refresco = time.perf_counter() + intervalo_refresco
+            segundos = time.perf_counter() - inicio
+            print(f"{segundos:>7.1f} s  {estado['escritos']:>9} pacientes  {estado['filas'] / segundos:>10,.0f} filas/s  "
+                  f"p95 {percentiles_ms(estado['latencias'])['p95']:>8.1f} ms  cola {cola.qsize():>3}/{cola.maxsize}")
+
+def main(backend=backends.BACKEND, ruta_db=None, tasa=TASA_PACIENTES, duracion=DURACION, tamano_microlote=TAMANO_MICROLOTE,
+         latencia_maxima=LATENCIA_MAXIMA, capacidad_cola=CAPACIDAD_COLA, tamano_lote=crea_db.TAMANO_LOTE_INSERT,
+         refrescar=False, semilla=crea_csv.RANDOM_SEED, intervalo_refresco=INTERVALO_REFRESCO):
+    """Ejecuta la prueba de carga durante duracion segundos y devuelve sus resultados."""
+    try:
+        if backend == "mysql":
+            conn = mysql.connector.connect(host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
+        else:
+            conn = backends.conectar(backend, ruta_db)
+    except mysql.connector.Error as err:
+        print(f"Error al conectar a la base de datos MySQL: {err}")
+        return None
+    if conn is None:
+        return None
+
+    try:
+        contexto = contexto_generacion(conn, backend, semilla)
+    except Exception as err: # La base todavía no tiene las tablas de crea_db
+        print(f"Error al leer las tablas de dimensión: {err}. Ejecuta antes crea_db.py.")
+        conn.close()
+        return None
+
+    print(f"--- Llegada continua: {tasa} pacientes/s durante {duracion} s en {backend} "
+          f"(microlotes de {tamano_microlote} pacientes o {latencia_maxima} s, cola de {capacidad_cola} tandas) ---")
+    estado = {"generados": 0, "escritos": 0, "filas": 0, "microlotes": 0, "latencias": [],
+              "segundos_contrapresion": 0.0, "segundos_refresco": 0.0}
+    cola = queue.Queue(maxsize=capacidad_cola)
+    detener = threading.Event()
+    productor = threading.Thread(target=producir, args=(cola, detener, contexto, estado, tasa, INTERVALO_LLEGADAS, semilla), daemon=True)
+    temporizador = threading.Timer(duracion, detener.set)
+    registro = {}
+
+    try:
+        with metricas.etapa("stream", "ingesta") as registro:
+            productor.start()
+            temporizador.start()
+            try:
+                escribir(cola, detener, conn, backend, estado, tamano_microlote, latencia_maxima, tamano_lote, refrescar, intervalo_refresco)
+            except KeyboardInterrupt:
+                print("\nPrueba interrumpida.")
+            registro["filas"] = estado["filas"]
+    except Exception as err: # mysql.connector.Error, sqlite3.Error o duckdb.Error
+        print(f"Error al escribir un microlote: {err}")
+    finally:
+        detener.set()
+        temporizador.cancel()
+        conn.close()
+
+    segundos = registro.get("segundos", duracion)
+    resultados = {
+        "pacientes": estado["escritos"],
+        "filas": estado["filas"],
+        "segundos": segundos,
+        "pacientes_por_segundo": estado["escritos"] / max(segundos, 1e-9),
+        "filas_por_segundo": estado["filas"] / max(segundos, 1e-9),
+        "microlotes": estado["microlotes"],
+        "latencia_ms": percentiles_ms(estado["latencias"]),
+        "segundos_contrapresion": estado["segundos_contrapresion"],
+        "segundos_refresco": estado["segundos_refresco"]
+    }
+    latencia = resultados["latencia_ms"]
+    print("\n--- Resultados ---")
+    print(f"{resultados['pacientes']} pacientes ({resultados['filas']} filas) escritos en {segundos:.1f} s: "
+          f"{resultados['pacientes_por_segundo']:,.0f} pacientes/s, {resultados['filas_por_segundo']:,.0f} filas/s sostenidas (objetivo: {tasa} pacientes/s).")
+    print(f"{resultados['microlotes']} microlotes de {resultados['pacientes'] / max(resultados['microlotes'], 1):,.0f} pacientes en promedio.")
+    print(f"Latencia de ingesta (generación -> COMMIT): p50 {latencia['p50']:.1f} ms, p95 {latencia['p95']:.1f} ms, "
+          f"p99 {latencia['p99']:.1f} ms, máxima {latencia['max']:.1f} ms.")
+    print(f"Productor frenado por contrapresión durante {resultados['segundos_contrapresion']:.1f} s; "
+          f"refrescos de rollups y versión: {resultados['segundos_refresco']:.1f} s.")
+    return resultados
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera pacientes nuevos de forma continua y los escribe por microlotes (prueba de carga).")
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=backends.BACKEND, help="Base de destino: mysql o una base embebida")
+    parser.add_argument("--db-path", default=None, help="Archivo de la base embebida (por defecto, ../data_medical.<backend>)")
+    parser.add_argument("--tasa", type=float, default=TASA_PACIENTES, help="Pacientes nuevos por segundo")
+    parser.add_argument("--duracion", type=float, default=DURACION, help="Segundos de la prueba")
+    parser.add_argument("--tamano-microlote", type=int, default=TAMANO_MICROLOTE, help="Pacientes acumulados que fuerzan una escritura")
+    parser.add_argument("--latencia-maxima", type=float, default=LATENCIA_MAXIMA, help="Segundos que puede esperar una llegada antes de escribirse")
+    parser.add_argument("--capacidad-cola", type=int, default=CAPACIDAD_COLA, help="Tandas en cola antes de frenar al productor")
+    parser.add_argument("--tamano-lote", type=int, default=crea_db.TAMANO_LOTE_INSERT, help="Filas por INSERT multi-fila (MySQL)")
+    parser.add_argument("--refrescar-rollups", action="store_true", help="Refresca los rollups de los pacientes nuevos cada pocos segundos (MySQL)")
+    parser.add_argument("--semilla", type=int, default=crea_csv.RANDOM_SEED, help="Semilla de los generadores aleatorios")
+    args = parser.parse_args()
+    main(args.backend, args.db_path, args.tasa, args.duracion, args.tamano_microlote, args.latencia_maxima,
+         args.capacidad_cola, args.tamano_lote, args.refrescar_rollups, args.semilla)
@@ -0,0 +1,63 @@
+import re
+
+import esquema
+
+# --- Registro único de tipos de Pandas de cada columna ---
+# crea_csv.py construye y guarda los DataFrames con estos tipos, crea_db.py los usa para leer los CSV sin
+# que Pandas tenga que inferirlos y datos.py (el notebook) los aplica a los resultados de MySQL.
+# Los enteros tienen el rango de su tipo en esquema.py (todos son UNSIGNED), peso e IMC son float32 y
+# los textos que se repiten mucho (droga, tipo, nombre del diagnóstico) son category.
+# Formato: { "nombre_tabla": { "columna": "dtype" } } (nombres en minúsculas, como en esquema.py)
+DTYPES = {
+    "pacientes": {"paciente_id": "uint32", "name": "string"},
+    "profesionales": {"profesionales_id": "uint16", "name": "string"},
+    "diagnosticos": {"diagnostico_id": "uint8", "name": "category"},
+    "medicacion": {"medicacion_id": "uint16", "droga": "category", "tipo": "category"},
+    "tratamientos": {"paciente_id": "uint32", "medicacion_id": "uint16", "profesionales_id": "uint16", "diagnostico_id": "uint8"},
+    "metabolico": {"paciente_id": "uint32", "edad": "uint8", "peso": "float32", "imc": "float32"},
+    "visitas": {"paciente_id": "uint32", "fecha": "datetime64[s]", "peso": "float32", "imc": "float32"}
+}
+
+def dtypes_tabla(tabla, columnas=None):
+    """Devuelve { columna: dtype } de una tabla, con los nombres de columna tal como se piden (ej. "Droga" en
+    Medicacion.csv). Las columnas que no están en el registro se omiten."""
+    registro = DTYPES.get(tabla.lower(), {})
+    columnas = list(registro) if columnas is None else columnas
+    return {col: registro[col.lower()] for col in columnas if col.lower() in registro}
+
+def dtypes_carga(tabla, columnas, nullable=False):
+    """Devuelve los tipos con los que crea_db.py lee los archivos de una tabla. Son los del registro salvo las
+    fechas, que se leen como texto ISO (la base las convierte al insertar), y los DECIMAL, que se leen como
+    float64 para que lleguen a la base con sus decimales exactos (85.2 y no 85.19999694824219).
+    Con nullable=True los enteros son enteros nullable (UInt*): admiten campos vacíos (NULL), pero Pandas
+    los parsea unas 10 veces más lento, así que solo se usan si la lectura con los tipos normales falla."""
+    dtypes = {}
+    for col, dtype in dtypes_tabla(tabla, columnas).items():
+        if dtype.startswith("datetime"):
+            dtype = "string"
+        elif dtype.startswith("uint") and nullable:
+            dtype = f"UInt{dtype[4:]}"
+        elif dtype.startswith("float"):
+            dtype = "float64"
+        dtypes[col] = dtype
+    return dtypes
+
+def decimales(tabla):
+    """Devuelve { columna: decimales } de las columnas DECIMAL de una tabla declarada en esquema.py."""
+    if tabla.lower() not in esquema.TABLAS:
+        return {}
+    escalas = {}
+    for nombre, tipo in esquema.TABLAS[tabla.lower()]["columnas"]:
+        coincidencia = re.match(r"DECIMAL\(\d+,(\d+)\)", tipo)
+        if coincidencia:
+            escalas[nombre] = int(coincidencia.group(1))
+    return escalas
+
+def dtypes_columnas(tablas):
+    """Devuelve { columna: dtype } para las columnas de varias tablas (ej. las de una consulta con JOIN).
+    Si una columna tiene tipos distintos en dos tablas (ej. name) se deja como texto ("string")."""
+    dtypes = {}
+    for tabla in tablas:
+        for col, dtype in DTYPES.get(tabla, {}).items():
+            dtypes[col] = dtype if dtypes.get(col, dtype) == dtype else "string"
+    return dtypes